@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Measure how many lambda invocations per second the job's workers sustain, against
+a local stub of the Lambda Invoke API, with one shared client and with a new client
+per invocation (how the job used to invoke). Run from glue_jobs/batch-index-taxons:
+
+    python -m benchmark.invocations --invocations 2000 --concurrency 50
+
+The stub answers every invocation with an empty result after --latency-ms, so the
+numbers are the job's own overhead: client construction, credential resolution,
+connection setup and request signing. The stub speaks plain HTTP with static
+credentials, so against the real endpoint (TLS, and credentials from the Glue
+container) the gap is larger.
+
+Prints a JSON report with the invocations/sec and the number of connections the
+stub accepted for each mode.
+"""
+
+import argparse
+import base64
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import job
+
+FUNCTION_NAME = "benchmark-taxon-indexing"
+
+
+class StubLambdaHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST /2015-03-31/functions/<name>/invocations like a lambda that
+    returned {} after `latency` seconds, and counts the connections it accepts
+    """
+
+    protocol_version = "HTTP/1.1"
+    latency = 0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            StubLambdaHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        data = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Amz-Executed-Version", "$LATEST")
+        self.send_header("X-Amz-Log-Result", base64.b64encode(b"").decode())
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_lambda(latency):
+    StubLambdaHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLambdaHandler)
+    server.daemon_threads = True
+    # the default backlog of 5 drops connections when every worker reconnects at once
+    server.socket.listen(socket.SOMAXCONN)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://{}:{}".format(*server.server_address)
+
+
+@contextlib.asynccontextmanager
+async def no_shared_client(max_pool_connections=None):
+    # with no shared client, job.invoke_once creates one per invocation
+    yield None
+
+
+def measure(mode, invocations, concurrency):
+    job_params = [
+        {"pipeline_run_id": i, "background_id": 1} for i in range(invocations)
+    ]
+    StubLambdaHandler.connections = 0
+    shared_client = job.lambda_client
+    if mode == "per_invocation":
+        job.lambda_client = no_shared_client
+    try:
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            start = time.perf_counter()
+            report = job.parallel_runs(
+                job_params, {}, concurrency, {"uri": checkpoint_dir}
+            )
+            seconds = time.perf_counter() - start
+    finally:
+        job.lambda_client = shared_client
+    if report["dead_letter_count"]:
+        raise Exception("Benchmark invocations failed: {}".format(report))
+    return {
+        "mode": mode,
+        "invocations": invocations,
+        "concurrency": concurrency,
+        "seconds": round(seconds, 3),
+        "invocations_per_second": round(invocations / seconds),
+        "connections": StubLambdaHandler.connections,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--invocations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0,
+        help="how long each stub invocation takes",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["per_invocation", "shared"],
+        default=["per_invocation", "shared"],
+    )
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.environ["AWS_ENDPOINT_URL_LAMBDA"] = start_stub_lambda(args.latency_ms / 1000)
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    config.params = {"lambda_function_name": FUNCTION_NAME}
+
+    report = {
+        "commit": git_commit(),
+        "latency_ms": args.latency_ms,
+        "results": [
+            measure(mode, args.invocations, args.concurrency) for mode in args.modes
+        ],
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
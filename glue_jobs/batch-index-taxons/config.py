@@ -1,18 +1,39 @@
 import boto3
+import concurrent.futures
+import contextlib
+import gzip
 import json
 import logging
+import os
 import sys
-from awsglue.utils import getResolvedOptions  # type: ignore
+from urllib.parse import urlparse
+
+try:
+    from awsglue.utils import getResolvedOptions  # type: ignore
+except ImportError:
+    # only available inside Glue; job.py also runs locally, see benchmark/
+    getResolvedOptions = None
 
 params = {}
 
 glue_param_keys = {
-    "optional": ["scored_taxon_counts_index_name", "pipeline_runs_index_name"],
+    "optional": [
+        "scored_taxon_counts_index_name",
+        "pipeline_runs_index_name",
+        "shard_index",
+        "shard_count",
+    ],
     "required": ["input_s3_path", "input_s3_bucket", "lambda_function_name"],
 }
 
 log = logging.getLogger(__name__)
 
+READ_CHUNK_SIZE = 1024 * 1024
+# objects fetched at a time by read_objects
+READ_WORKERS = 32
+# the most keys S3 deletes in one request
+DELETE_BATCH_SIZE = 1000
+
 
 def _get_optional_glue_param_value(key, job_params, default=None):
     """
@@ -67,3 +88,109 @@ def load_json_from_s3(bucket_name, key):
     obj = s3.Object(bucket_name, key)
     # TODO some validation that it is a json file
     return json.loads(obj.get()["Body"].read().decode("utf-8"))
+
+
+def _split_s3_uri(uri):
+    parsed = urlparse(uri)
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+def write_object(uri, body):
+    """
+    Write bytes to an s3://bucket/key URI or a local path
+    """
+    if uri.startswith("s3://"):
+        bucket_name, key = _split_s3_uri(uri)
+        boto3.client("s3").put_object(Bucket=bucket_name, Key=key, Body=body)
+        return
+    os.makedirs(os.path.dirname(uri) or ".", exist_ok=True)
+    with open(uri, "wb") as f:
+        f.write(body)
+
+
+def list_objects(uri):
+    """
+    Return the URIs of every object under an s3://bucket/prefix/ URI or in a
+    local directory, none if there are none
+    """
+    if uri.startswith("s3://"):
+        bucket_name, prefix = _split_s3_uri(uri)
+        paginator = boto3.client("s3").get_paginator("list_objects_v2")
+        return [
+            f"s3://{bucket_name}/{obj['Key']}"
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        ]
+    if not os.path.isdir(uri):
+        return []
+    return [os.path.join(uri, name) for name in sorted(os.listdir(uri))]
+
+
+def read_object(uri, s3=None):
+    """
+    Return the contents of an s3://bucket/key URI or a local file. Threads
+    should share an `s3` client: creating clients is not thread safe.
+    """
+    if uri.startswith("s3://"):
+        bucket_name, key = _split_s3_uri(uri)
+        s3 = s3 or boto3.client("s3")
+        return s3.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+    with open(uri, "rb") as f:
+        return f.read()
+
+
+def read_objects(uri, max_workers=READ_WORKERS):
+    """
+    Yield the (uri, contents) of every object under an s3://bucket/prefix/ URI
+    or in a local directory, fetching up to `max_workers` at a time
+    """
+    uris = list_objects(uri)
+    s3 = boto3.client("s3") if uri.startswith("s3://") else None
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        yield from zip(uris, executor.map(lambda uri: read_object(uri, s3), uris))
+
+
+def delete_objects(uris):
+    """
+    Delete s3://bucket/key URIs, all in one bucket, or local files
+    """
+    s3_uris = [uri for uri in uris if uri.startswith("s3://")]
+    for uri in uris:
+        if not uri.startswith("s3://"):
+            os.remove(uri)
+    if not s3_uris:
+        return
+    bucket_name = _split_s3_uri(s3_uris[0])[0]
+    s3 = boto3.client("s3")
+    for start in range(0, len(s3_uris), DELETE_BATCH_SIZE):
+        end = start + DELETE_BATCH_SIZE
+        keys = [_split_s3_uri(uri)[1] for uri in s3_uris[start:end]]
+        response = s3.delete_objects(
+            Bucket=bucket_name,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        if response.get("Errors"):
+            raise Exception(f"Could not delete objects: {response['Errors'][:10]}")
+
+
+def read_lines(uri):
+    """
+    Yield the non-empty lines of an s3://bucket/key URI or a local file as
+    bytes, as it downloads, gunzipping it if its name ends in .gz
+    """
+    if uri.startswith("s3://"):
+        bucket_name, key = _split_s3_uri(uri)
+        stream = boto3.client("s3").get_object(Bucket=bucket_name, Key=key)["Body"]
+    else:
+        stream = open(uri, "rb")
+    with contextlib.closing(stream):
+        if uri.endswith(".gz"):
+            lines = gzip.GzipFile(fileobj=stream)
+        elif uri.startswith("s3://"):
+            lines = stream.iter_lines(chunk_size=READ_CHUNK_SIZE)
+        else:
+            lines = stream
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
@@ -1,29 +1,133 @@
 import base64
+import bisect
 from aiobotocore.session import get_session  # type: ignore
 import asyncio
 import botocore
+import contextlib
+import datetime
+import heapq
 import config
+import itertools
 import json
 import logging
 import math
+import time
+import uuid
+import zlib
 from tenacity import (  # type: ignore
     retry,
     retry_if_result,
     stop_after_attempt,
     wait_fixed,
     after_log,
-    RetryError,
+    before_sleep_log,
 )
 
 log = logging.getLogger()
 
 botosession = get_session()
 
+SUCCEEDED = "succeeded"
+THROTTLED = "throttled"
+FAILED = "failed"
+# ClientError codes of invocations Lambda turned away for lack of concurrency
+THROTTLE_ERROR_CODES = {"TooManyRequestsException", "ThrottlingException"}
+# substrings of the errorMessage of a lambda that gave up on OpenSearch rejections
+REJECTION_MARKERS = (
+    "rejected_execution_exception",
+    "TransportError(429",
+    "too_many_requests",
+)
+# weight of the newest latency in the controller's moving average
+LATENCY_SMOOTHING = 0.2
+# attempts per job_params, counting throttled ones
+MAX_ATTEMPTS = 5
+THROTTLE_WAIT_SECONDS = 3
+DEFAULT_POOL_CONNECTIONS = 100
+# how often the checkpoint is written, whichever comes first
+CHECKPOINT_EVERY_RUNS = 500
+CHECKPOINT_EVERY_SECONDS = 30
+# a checkpoint with more segments than this is compacted into one when loaded
+COMPACT_SEGMENTS = 100
+# tries at writing a checkpoint segment, the dead letters or the report before
+# the job fails
+WRITE_ATTEMPTS = 3
+WRITE_WAIT_SECONDS = 5
+# failed params get this many more tries once every other params was invoked
+RETRY_PASSES = 1
+MAX_ERROR_LENGTH = 1000
+# the dead letters in the logged report; the full list is in the checkpoint
+MAX_REPORTED_DEAD_LETTERS = 100
+# job_params read from a manifest at a time
+READ_BATCH_SIZE = 1000
+# with no total to count percents of (a streamed manifest), log progress this often
+PROGRESS_EVERY_RUNS = 1000
+# the upper bounds of the BackfillReport latency histogram buckets, up to the
+# lambda's 300s read timeout
+HISTOGRAM_BOUNDS_SECONDS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 90, 120, 180, 240, 300)
+TIMELINE_INTERVAL_SECONDS = 60
+SLOWEST_RUNS = 20
+# see Plan
+ORDERS = ("manifest", "background", "recently_read")
+DEFAULT_ORDER = "manifest"
+
 
 def _is_transport_error(response):
     return response["Payload"].get("errorType") == "TransportError"
 
 
+# the shared client in use by the running job, see lambda_client
+_client = None
+
+
+def create_client(max_pool_connections=DEFAULT_POOL_CONNECTIONS):
+    return botosession.create_client(
+        "lambda",
+        config=botocore.config.Config(
+            max_pool_connections=max_pool_connections,
+            read_timeout=300,
+            connect_timeout=300,
+        ),
+    )
+
+
+@contextlib.asynccontextmanager
+async def lambda_client(max_pool_connections=DEFAULT_POOL_CONNECTIONS):
+    """
+    Open one Lambda client for every invocation made inside the block. The
+    workers then share its credentials and its pool of keep-alive connections,
+    instead of each invocation resolving credentials and opening a new TLS
+    connection.
+    """
+    global _client
+    async with create_client(max_pool_connections) as client:
+        _client = client
+        try:
+            yield client
+        finally:
+            _client = None
+
+
+async def invoke_once(function_name, payload):
+    if _client is None:
+        # called outside of a job, e.g. from a console
+        async with create_client() as client:
+            return await _invoke(client, function_name, payload)
+    return await _invoke(_client, function_name, payload)
+
+
+async def _invoke(client, function_name, payload):
+    response = await client.invoke(
+        FunctionName=function_name,
+        InvocationType="RequestResponse",
+        LogType="Tail",
+        Payload=payload,
+    )
+    response["Payload"] = json.loads((await response["Payload"].read()).decode("utf-8"))
+    response["LogResult"] = base64.b64decode(response["LogResult"])
+    return response
+
+
 @retry(
     retry=retry_if_result(_is_transport_error),
     reraise=True,
@@ -32,103 +136,981 @@ def _is_transport_error(response):
     after=after_log(log, logging.DEBUG),
 )
 async def invoke_lambda_function(function_name, payload):
-    async with botosession.create_client(
-        "lambda",
-        config=botocore.config.Config(
-            max_pool_connections=100, read_timeout=300, connect_timeout=300
-        ),
-    ) as client:
-        response = await client.invoke(
-            FunctionName=function_name,
-            InvocationType="RequestResponse",
-            LogType="Tail",
-            Payload=payload,
-        )
-        response["Payload"] = json.loads(
-            (await response["Payload"].read()).decode("utf-8")
-        )
-        response["LogResult"] = base64.b64decode(response["LogResult"])
-        return response
+    return await invoke_once(function_name, payload)
+
+
+@retry(
+    reraise=True,
+    stop=stop_after_attempt(WRITE_ATTEMPTS),
+    wait=wait_fixed(WRITE_WAIT_SECONDS),
+    before_sleep=before_sleep_log(log, logging.WARNING),
+)
+async def write_object(uri, body):
+    await asyncio.to_thread(config.write_object, uri, body)
+
 
+class RefreshCoalescer:
+    """
+    Collect the runs indexed with refresh_mode=deferred and finalize them in
+    groups, so that up to `max_runs` runs (or all runs indexed within
+    `max_seconds`) share a single refresh of the scored_taxon_counts index
+    instead of each invocation forcing its own
+    """
 
-async def run(job_params, batch_number, index_names):
-    success_count = 0
-    error_response = None
-    checkpoints = [math.floor(i * 0.01 * len(job_params)) for i in range(1, 101)]
-    for params in job_params:
+    def __init__(self, index_names, max_runs, max_seconds):
+        # the finalize event only takes the index names that were actually configured
+        self.index_names = {name: value for name, value in index_names.items() if value}
+        self.max_runs = max_runs
+        self.max_seconds = max_seconds
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    async def add(self, params):
+        self.pending.append(
+            {
+                "pipeline_run_id": params["pipeline_run_id"],
+                "background_id": params["background_id"],
+            }
+        )
+        if (
+            len(self.pending) >= self.max_runs
+            or time.monotonic() - self.last_flush >= self.max_seconds
+        ):
+            return await self.flush()
+        return []
+
+    async def flush(self):
+        """
+        Finalize the pending runs and return them, or raise FinalizeError
+        """
+        # swap the list out before awaiting so concurrent adds start a new group
+        runs, self.pending = self.pending, []
+        self.last_flush = time.monotonic()
+        if not runs:
+            return runs
         try:
-            if "scored_taxon_counts_index_name" in index_names:
-                params["scored_taxon_counts_index_name"] = index_names[
-                    "scored_taxon_counts_index_name"
-                ]
-            if "pipeline_runs_index_name" in index_names:
-                params["pipeline_runs_index_name"] = index_names[
-                    "pipeline_runs_index_name"
-                ]
             response = await invoke_lambda_function(
-                config.params["lambda_function_name"], json.dumps(params)
-            )
-        except botocore.exceptions.ClientError as error:
-            log.exception(
-                "batch %s: Couldn't invoke function %s.",
-                batch_number,
                 config.params["lambda_function_name"],
+                json.dumps({"finalize_runs": runs, **self.index_names}),
             )
-            error_response = error
-            break
-        except RetryError as error:
-            log.exception(
-                "batch %s: Unexpected retry error: %s",
-                batch_number,
-                error.last_attempt.result(),
-            )
-            error_response = error
-            break
         except Exception as error:
-            log.exception("batch %s: Unexpected error: %s", batch_number, error)
-            error_response = error
-            break
+            raise FinalizeError(runs, error) from error
         if "FunctionError" in response:
-            log.error(
-                "batch %s: Function %s returned error: %s",
-                batch_number,
-                config.params["lambda_function_name"],
-                response,
+            raise FinalizeError(runs, response)
+        log.info("Finalized %s runs", len(runs))
+        return runs
+
+
+class FinalizeError(Exception):
+    def __init__(self, runs, error_response):
+        super().__init__(f"Failed to finalize {len(runs)} runs: {error_response}")
+        self.runs = runs
+
+
+def expand_job_params(records):
+    """
+    Yield a job_params for each pipeline_run_id and background_id of each
+    record. A record is either one pair, {"pipeline_run_id": ...,
+    "background_id": ...}, or {"pipeline_run_ids": [...], "background_ids":
+    [...]} for every combination of them. Either may have a "last_read_at",
+    see Plan.
+    """
+    for record in records:
+        # only used to order the plan
+        extra = (
+            {"last_read_at": record["last_read_at"]} if "last_read_at" in record else {}
+        )
+        if "pipeline_run_id" in record:
+            yield {
+                "pipeline_run_id": record["pipeline_run_id"],
+                "background_id": record["background_id"],
+                **extra,
+            }
+            continue
+        for pipeline_run_id in record["pipeline_run_ids"]:
+            for background_id in record["background_ids"]:
+                yield {
+                    "pipeline_run_id": pipeline_run_id,
+                    "background_id": background_id,
+                    **extra,
+                }
+
+
+def read_manifest(uri):
+    """
+    Stream the job_params of an NDJSON manifest (gzipped if it ends in .gz),
+    one expand_job_params record per line
+    """
+    return expand_job_params(json.loads(line) for line in config.read_lines(uri))
+
+
+async def iterate_in_thread(items, batch_size=READ_BATCH_SIZE):
+    """
+    Yield from a blocking iterator, e.g. a manifest streaming from S3, reading
+    `batch_size` items at a time in a thread so the workers keep invoking
+    """
+    items = iter(items)
+    while True:
+        batch = await asyncio.to_thread(list, itertools.islice(items, batch_size))
+        if not batch:
+            return
+        for item in batch:
+            yield item
+
+
+def run_key(params):
+    return (params["pipeline_run_id"], params["background_id"])
+
+
+class Plan:
+    """
+    Decide which job_params this driver invokes, and in which order. Pairs are
+    de-duplicated, narrowed down to the driver's shard, and ordered by:
+    - "manifest": as given, and streamed. The pairs seen so far are still kept
+      to drop duplicates, about 140 bytes each, unless `deduplicate` is False;
+      a duplicate is then invoked again.
+    - "background": grouped by background_id, so the background's summaries
+      and lineages stay cached in the warm lambdas
+    - "recently_read": the runs with the latest "last_read_at" first, those
+      without one last
+    To split a backfill, start several drivers with the same job_params and
+    shard_count, each with its own shard_index; a pair always falls in the
+    same shard.
+    """
+
+    def __init__(
+        self, order=DEFAULT_ORDER, shard_index=0, shard_count=1, deduplicate=True
+    ):
+        if order not in ORDERS:
+            raise ValueError(f"order must be one of {ORDERS}, not {order}")
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(
+                f"shard_index {shard_index} is not in 0..{shard_count - 1}"
+            )
+        self.order = order
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.deduplicate_manifest = deduplicate
+        self.planned_count = 0
+        self.duplicate_count = 0
+        self.other_shards_count = 0
+
+    @property
+    def suffix(self):
+        if self.shard_count == 1:
+            return ""
+        return f"-shard-{self.shard_index}-of-{self.shard_count}"
+
+    def in_shard(self, key):
+        # crc32 rather than hash(), which is not meant to be stable across versions
+        shard = zlib.crc32("{}:{}".format(*key).encode()) % self.shard_count
+        return shard == self.shard_index
+
+    def __call__(self, job_params):
+        """
+        Return the planned job_params, a generator for a streamed manifest
+        """
+        if self.order == "manifest":
+            if self.deduplicate_manifest:
+                planned = self.deduplicate(job_params)
+            else:
+                planned = self.in_shard_params(job_params)
+            # only stream a manifest: the job logs percent progress of a list
+            return list(planned) if hasattr(job_params, "__len__") else planned
+        planned = {}
+        for params in self.deduplicate(job_params, planned):
+            planned[run_key(params)] = params
+        planned = list(planned.values())
+        if self.order == "background":
+            planned.sort(
+                key=lambda params: (params["background_id"], params["pipeline_run_id"])
+            )
+        else:
+            # ISO 8601 timestamps sort by time; a stable sort keeps the manifest
+            # order of ties
+            planned.sort(
+                key=lambda params: params.get("last_read_at") or "", reverse=True
+            )
+        log.info("Planned %s runs (%s order)", len(planned), self.order)
+        return planned
+
+    def deduplicate(self, job_params, planned=None):
+        """
+        Yield the job_params of this shard that were not seen yet. Given the
+        `planned` params by run_key, a duplicate's later last_read_at is kept.
+        """
+        seen = set() if planned is None else planned
+        for params in job_params:
+            key = run_key(params)
+            if self.shard_count > 1 and not self.in_shard(key):
+                self.other_shards_count += 1
+                continue
+            if key in seen:
+                self.duplicate_count += 1
+                if planned is not None and (params.get("last_read_at") or "") > (
+                    planned[key].get("last_read_at") or ""
+                ):
+                    planned[key]["last_read_at"] = params["last_read_at"]
+                continue
+            if planned is None:
+                seen.add(key)
+            self.planned_count += 1
+            yield params
+
+    def in_shard_params(self, job_params):
+        """
+        Yield the job_params of this shard, duplicates included
+        """
+        for params in job_params:
+            if self.shard_count > 1 and not self.in_shard(run_key(params)):
+                self.other_shards_count += 1
+                continue
+            self.planned_count += 1
+            yield params
+
+    def stats(self):
+        return {
+            "order": self.order,
+            "deduplicate": self.deduplicate_manifest or self.order != "manifest",
+            "shard_index": self.shard_index,
+            "shard_count": self.shard_count,
+            "planned_count": self.planned_count,
+            "duplicate_count": self.duplicate_count,
+            "other_shards_count": self.other_shards_count,
+        }
+
+
+def segment_name():
+    # unique per driver, so concurrent jobs can share a checkpoint
+    return f"{time.time_ns()}-{uuid.uuid4().hex}.ndjson"
+
+
+class Checkpoint:
+    """
+    Durable record of which (pipeline_run_id, background_id) pairs of a job
+    were indexed, or failed, so that a restarted job skips the completed pairs
+    whatever its concurrency. Records are buffered and written every
+    `max_runs` records or `max_seconds`, each time as a new NDJSON object under
+    `uri` (s3://bucket/prefix or a local directory), so nothing is rewritten.
+    A pair that is recorded as completed in any object is complete. Loading
+    merges many segments into one, so that a resumed job does not fetch
+    thousands of them each time.
+    """
+
+    def __init__(
+        self,
+        uri,
+        max_runs=CHECKPOINT_EVERY_RUNS,
+        max_seconds=CHECKPOINT_EVERY_SECONDS,
+    ):
+        self.uri = uri.rstrip("/")
+        self.max_runs = max_runs
+        self.max_seconds = max_seconds
+        # the pairs completed by earlier runs of the job
+        self.completed = set()
+        # {run_key: error} of the pairs that have not completed yet
+        self.failed = {}
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.plan = None
+
+    def load(self, plan=None):
+        """
+        Read the records written so far, only those of the plan's shard if given
+        """
+        self.plan = plan
+        sharded = plan is not None and plan.shard_count > 1
+        segments = []
+        for segment, body in config.read_objects(self.uri + "/segments/"):
+            segments.append(segment)
+            for line in body.splitlines():
+                record = json.loads(line)
+                key = run_key(record)
+                if sharded and not plan.in_shard(key):
+                    continue
+                if record["status"] == SUCCEEDED:
+                    self.completed.add(key)
+                    self.failed.pop(key, None)
+                elif key not in self.completed:
+                    self.failed[key] = record.get("error")
+        log.info(
+            "Checkpoint %s has %s completed and %s failed runs in %s segments",
+            self.uri,
+            len(self.completed),
+            len(self.failed),
+            len(segments),
+        )
+        # the shards of a job share the checkpoint and run at the same time, and
+        # each only loads its own records
+        if len(segments) > COMPACT_SEGMENTS and not sharded:
+            self.compact(segments)
+        return self
+
+    def compact(self, segments):
+        """
+        Replace the given segments with one holding the loaded records. The
+        merged segment is written before any is deleted, so a failure only
+        leaves records twice, and the job goes on either way.
+        """
+        records = [
+            {"pipeline_run_id": key[0], "background_id": key[1], "status": SUCCEEDED}
+            for key in self.completed
+        ] + [
+            {
+                "pipeline_run_id": key[0],
+                "background_id": key[1],
+                "status": FAILED,
+                "error": error,
+            }
+            for key, error in self.failed.items()
+        ]
+        body = "".join(json.dumps(record) + "\n" for record in records).encode()
+        try:
+            config.write_object(f"{self.uri}/segments/{segment_name()}", body)
+            config.delete_objects(segments)
+        except Exception:
+            log.warning("Could not compact checkpoint %s", self.uri, exc_info=True)
+            return
+        log.info("Compacted %s segments of checkpoint %s", len(segments), self.uri)
+
+    def is_complete(self, params):
+        return run_key(params) in self.completed
+
+    async def record(self, runs, error=None):
+        for run in runs:
+            key = run_key(run)
+            if error is None:
+                # only the pairs completed by earlier runs are kept in memory,
+                # to skip them; this run does not invoke a pair twice
+                self.failed.pop(key, None)
+            else:
+                self.failed[key] = str(error)[:MAX_ERROR_LENGTH]
+            self.pending.append(
+                {
+                    "pipeline_run_id": key[0],
+                    "background_id": key[1],
+                    "status": SUCCEEDED if error is None else FAILED,
+                    **({} if error is None else {"error": self.failed[key]}),
+                }
             )
-            error_response = response
-            break
-        success_count += 1
-        if success_count in checkpoints:
-            success_percent = math.floor((success_count / len(job_params)) * 100)
-            log.info(
-                "batch %s is %s percent complete (%s successful invocations)",
-                batch_number,
-                success_percent,
-                success_count,
+        if (
+            len(self.pending) >= self.max_runs
+            or time.monotonic() - self.last_flush >= self.max_seconds
+        ):
+            await self.flush()
+
+    async def flush(self):
+        records, self.pending = self.pending, []
+        self.last_flush = time.monotonic()
+        if not records:
+            return
+        name = segment_name()
+        body = "".join(json.dumps(record) + "\n" for record in records).encode()
+        try:
+            await write_object(f"{self.uri}/segments/{name}", body)
+        except Exception:
+            # a restarted job would invoke these pairs again, but one that goes
+            # on without a checkpoint would redo the whole job
+            log.exception("Could not write %s records to %s", len(records), self.uri)
+            raise
+
+    async def write_dead_letters(self):
+        """
+        Write the pairs that failed and never completed to dead_letters.ndjson,
+        or dead_letters-shard-<index>-of-<count>.ndjson for a shard
+        """
+        dead_letters = self.dead_letters()
+        body = "".join(json.dumps(record) + "\n" for record in dead_letters).encode()
+        await write_object(
+            f"{self.uri}/dead_letters{self.plan.suffix if self.plan else ''}.ndjson",
+            body,
+        )
+        return dead_letters
+
+    def dead_letters(self):
+        return [
+            {"pipeline_run_id": key[0], "background_id": key[1], "error": error}
+            for key, error in self.failed.items()
+        ]
+
+
+class ConcurrencyController:
+    """
+    Additive-increase/multiplicative-decrease limit on the number of in-flight
+    invocations. Every invocation that comes back quickly raises the limit by
+    `increase` per round of `limit` invocations, up to `maximum`. A throttle
+    (Lambda's TooManyRequestsException, or OpenSearch rejecting writes) or a
+    smoothed latency above `target_latency` multiplies it by `decrease`, down
+    to `minimum`. Invocations that started before the last decrease cannot
+    decrease it again, so one burst of rejections only counts once. The limit
+    never goes below one invocation, or the workers would wait forever.
+    """
+
+    def __init__(
+        self,
+        maximum,
+        minimum=1,
+        initial=None,
+        target_latency=None,
+        increase=1,
+        decrease=0.5,
+    ):
+        if maximum < 1:
+            raise ValueError(f"concurrency must be at least 1, not {maximum}")
+        self.maximum = maximum
+        self.minimum = max(1, min(minimum, maximum))
+        self.limit = float(max(self.minimum, min(initial or maximum, maximum)))
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.latency = None
+        self.in_flight = 0
+        self.decreases = 0
+        self._decreased_at = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """
+        Wait for a free slot, return the start time to pass to release()
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started, outcome):
+        now = time.monotonic()
+        async with self._condition:
+            self.in_flight -= 1
+            if outcome != THROTTLED:
+                latency = now - started
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else LATENCY_SMOOTHING * latency
+                    + (1 - LATENCY_SMOOTHING) * self.latency
+                )
+            too_slow = (
+                self.target_latency is not None
+                and self.latency is not None
+                and self.latency > self.target_latency
             )
-    return {"success_count": success_count, "error_response": error_response}
+            if outcome == THROTTLED or too_slow:
+                if started >= self._decreased_at:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._decreased_at = now
+                    self.decreases += 1
+                    log.info(
+                        "Lowered concurrency to %s (%s)",
+                        int(self.limit),
+                        outcome if outcome == THROTTLED else "slow",
+                    )
+            elif outcome == SUCCEEDED:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._condition.notify_all()
 
 
-def chunks(lst, number_of_chunks):
+def classify(response=None, error=None):
     """
-    Yield n number of striped chunks from l.
-    Source: https://stackoverflow.com/a/54802737
+    Tell a throttled invocation, which is worth retrying more slowly, from one
+    that succeeded or failed
     """
-    for i in range(0, number_of_chunks):
-        yield lst[i::number_of_chunks]
+    if error is not None:
+        if isinstance(error, botocore.exceptions.ClientError) and (
+            error.response.get("Error", {}).get("Code") in THROTTLE_ERROR_CODES
+            or error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 429
+        ):
+            return THROTTLED
+        return FAILED
+    if "FunctionError" in response:
+        # OpenSearch failed or rejected the writes, e.g. TransportError(429,
+        # 'es_rejected_execution_exception') once the lambda ran out of retries
+        message = str(response["Payload"].get("errorMessage", ""))
+        if _is_transport_error(response) or any(
+            marker in message for marker in REJECTION_MARKERS
+        ):
+            return THROTTLED
+        return FAILED
+    return SUCCEEDED
+
 
+def error_category(response=None, error=None):
+    """
+    Name what went wrong with an invocation: the ClientError code or exception
+    class, or the errorType the lambda raised
+    """
+    if error is not None:
+        if isinstance(error, botocore.exceptions.ClientError):
+            return error.response.get("Error", {}).get("Code", "ClientError")
+        return type(error).__name__
+    return response["Payload"].get("errorType") or response["FunctionError"]
 
-async def gather_results(tasks):
-    return await asyncio.gather(*tasks)
 
+class BackfillReport:
+    """
+    Statistics of every invocation attempt of a job, across all workers: a
+    latency histogram, invocations per second over time, error categories, the
+    slowest runs, and the sum of the `metrics` the lambda returned (see
+    lambdas/taxon-indexing/chalicelib/metrics.py). Only counters are kept, so
+    its size does not depend on the number of runs.
+    """
 
-def parallel_runs(job_params, skip, index_names, concurrency):
-    # loop = asyncio.get_event_loop()
-    tasks = []
-    batches = chunks(job_params, concurrency)
-    # skip on a per-batch basis (requires that subsequent runs use the same concurrency)
-    if skip:
-        batches = [batch[skip:] for batch, skip in zip(batches, skip)]
-    for i, batch in enumerate(batches):
-        tasks.append(run(batch, i, index_names))
-    return asyncio.run(gather_results(tasks))
+    def __init__(self):
+        self.started = time.monotonic()
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_SECONDS) + 1)
+        self.latency_count = 0
+        self.latency_total = 0
+        self.latency_max = 0
+        # {interval index: {outcome: count}}
+        self.timeline = {}
+        # {outcome: {category: count}}
+        self.errors = {THROTTLED: {}, FAILED: {}}
+        # min-heap of the (seconds, pipeline_run_id, background_id) of the slowest runs
+        self.slowest = []
+        self.lambda_metrics_count = 0
+        self.lambda_metrics = {"phases_ms": {}}
+        self.bulk_latency_max_ms = None
+
+    def add(self, params, seconds, outcome, response=None, error=None):
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_SECONDS, seconds)] += 1
+        self.latency_count += 1
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        interval = int((time.monotonic() - self.started) // TIMELINE_INTERVAL_SECONDS)
+        counts = self.timeline.setdefault(interval, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+        if outcome != SUCCEEDED:
+            category = error_category(response, error)
+            errors = self.errors[outcome]
+            errors[category] = errors.get(category, 0) + 1
+            return
+        entry = (seconds, params["pipeline_run_id"], params["background_id"])
+        if len(self.slowest) < SLOWEST_RUNS:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+        metrics = response["Payload"].get("metrics")
+        if metrics:
+            self.add_lambda_metrics(metrics)
+
+    def add_lambda_metrics(self, metrics):
+        self.lambda_metrics_count += 1
+        totals = self.lambda_metrics
+        for name, value in metrics.items():
+            if name == "phases_ms":
+                for phase, ms in value.items():
+                    totals["phases_ms"][phase] = totals["phases_ms"].get(phase, 0) + ms
+            elif name == "bulk_latency_ms":
+                if value.get("max") is not None:
+                    self.bulk_latency_max_ms = max(
+                        self.bulk_latency_max_ms or 0, value["max"]
+                    )
+            elif name != "docs_per_second" and isinstance(value, (int, float)):
+                totals[name] = totals.get(name, 0) + value
+
+    def percentile(self, q):
+        """
+        The upper bound of the histogram bucket of the q-th percentile latency
+        """
+        if not self.latency_count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.latency_count))
+        for i, count in enumerate(itertools.accumulate(self.histogram)):
+            if count >= rank:
+                if i < len(HISTOGRAM_BOUNDS_SECONDS):
+                    return HISTOGRAM_BOUNDS_SECONDS[i]
+                return round(self.latency_max, 3)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        lambda_seconds = self.lambda_metrics.get("total_ms", 0) / 1000
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "invocations": self.latency_count,
+            "invocations_per_second": (
+                round(self.latency_count / elapsed, 2) if elapsed else 0
+            ),
+            "latency_seconds": {
+                "mean": (
+                    round(self.latency_total / self.latency_count, 3)
+                    if self.latency_count
+                    else None
+                ),
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99),
+                "max": round(self.latency_max, 3),
+                # the count of attempts that took at most `le` seconds, and more
+                # than the previous bucket's
+                "histogram": [
+                    {"le": bound, "count": count}
+                    for bound, count in zip(
+                        list(HISTOGRAM_BOUNDS_SECONDS) + [None], self.histogram
+                    )
+                ],
+            },
+            "timeline": [
+                {
+                    "start_seconds": interval * TIMELINE_INTERVAL_SECONDS,
+                    **counts,
+                    "invocations_per_second": round(
+                        sum(counts.values()) / TIMELINE_INTERVAL_SECONDS, 2
+                    ),
+                }
+                for interval, counts in sorted(self.timeline.items())
+            ],
+            "errors": self.errors,
+            "slowest_runs": [
+                {
+                    "pipeline_run_id": pipeline_run_id,
+                    "background_id": background_id,
+                    "seconds": round(seconds, 3),
+                }
+                for seconds, pipeline_run_id, background_id in sorted(
+                    self.slowest, reverse=True
+                )
+            ],
+            "lambda_metrics": {
+                "invocations": self.lambda_metrics_count,
+                **self.lambda_metrics,
+                "docs_per_lambda_second": (
+                    round(self.lambda_metrics.get("documents", 0) / lambda_seconds)
+                    if lambda_seconds
+                    else None
+                ),
+                "bulk_latency_max_ms": self.bulk_latency_max_ms,
+            },
+        }
+
+
+class JobQueue:
+    """
+    Invoke the lambda for every job_params, from workers that each pull the
+    next params from a shared queue, so a slow invocation only holds up its own
+    worker. How many invocations are in flight is up to the controller. A
+    failed params is recorded in the checkpoint and the job goes on; the
+    failures are retried once the queue is empty. A worker that raises, e.g.
+    when the checkpoint cannot be written, stops the job.
+    """
+
+    def __init__(
+        self,
+        index_names,
+        controller,
+        checkpoint,
+        refresh_mode=None,
+        refresh_coalescer=None,
+        max_attempts=MAX_ATTEMPTS,
+        max_failures=None,
+        retry_passes=RETRY_PASSES,
+    ):
+        self.index_names = index_names
+        self.controller = controller
+        self.checkpoint = checkpoint
+        self.refresh_mode = refresh_mode
+        self.refresh_coalescer = refresh_coalescer
+        self.max_attempts = max_attempts
+        self.max_failures = max_failures
+        self.retry_passes = retry_passes
+        self.success_count = 0
+        self.skipped_count = 0
+        self.throttled_count = 0
+        # the params that failed in the first pass, each counted once
+        self.failure_count = 0
+        # the failed attempts of the retry passes
+        self.retry_failure_count = 0
+        self.retry_pass = 0
+        # the params that failed in the current pass, to retry in the next one
+        self.failed = []
+        self.error_response = None
+        self.total = 0
+        self.progress_steps = set()
+        self.backfill_report = BackfillReport()
+
+    @property
+    def stopped(self):
+        return self.max_failures is not None and self.failure_count >= self.max_failures
+
+    def params_for(self, params):
+        # only used to plan the order
+        params.pop("last_read_at", None)
+        if "scored_taxon_counts_index_name" in self.index_names:
+            params["scored_taxon_counts_index_name"] = self.index_names[
+                "scored_taxon_counts_index_name"
+            ]
+        if "pipeline_runs_index_name" in self.index_names:
+            params["pipeline_runs_index_name"] = self.index_names[
+                "pipeline_runs_index_name"
+            ]
+        if self.refresh_mode:
+            params["refresh_mode"] = self.refresh_mode
+        return params
+
+    async def invoke(self, params):
+        """
+        Invoke the lambda for one params, retrying throttled invocations.
+        Return the error response of a failed invocation, or None.
+        """
+        payload = json.dumps(self.params_for(params))
+        for attempt in range(1, self.max_attempts + 1):
+            started = await self.controller.acquire()
+            response = error = None
+            try:
+                response = await invoke_once(
+                    config.params["lambda_function_name"], payload
+                )
+            except Exception as exc:
+                error = exc
+            outcome = classify(response, error)
+            self.backfill_report.add(
+                params, time.monotonic() - started, outcome, response, error
+            )
+            await self.controller.release(started, outcome)
+            if outcome == SUCCEEDED:
+                return None
+            if outcome == FAILED or attempt == self.max_attempts:
+                if error is not None:
+                    log.error(
+                        "Couldn't invoke function %s for %s: %s",
+                        config.params["lambda_function_name"],
+                        payload,
+                        error,
+                        exc_info=error,
+                    )
+                    return error
+                log.error(
+                    "Function %s returned error: %s",
+                    config.params["lambda_function_name"],
+                    response,
+                )
+                return response
+            self.throttled_count += 1
+            log.warning("Invocation for %s throttled, retrying", payload)
+            await asyncio.sleep(THROTTLE_WAIT_SECONDS)
+
+    async def worker(self, queue):
+        while True:
+            params = await queue.get()
+            try:
+                if params is None:
+                    return
+                if self.stopped:
+                    continue
+                error_response = await self.invoke(params)
+                if error_response is not None:
+                    await self.failed_runs([params], error_response)
+                elif self.refresh_coalescer:
+                    await self.finalize(self.refresh_coalescer.add(params))
+                else:
+                    await self.completed_runs([params])
+            finally:
+                queue.task_done()
+
+    async def finalize(self, flush):
+        """
+        Await a RefreshCoalescer add or flush, and record the runs it finalized
+        """
+        try:
+            runs = await flush
+        except FinalizeError as error:
+            log.exception("Finalizing runs failed: %s", error)
+            await self.failed_runs(error.runs, error)
+            return
+        await self.completed_runs(runs)
+
+    async def completed_runs(self, runs):
+        await self.checkpoint.record(runs)
+        for _ in runs:
+            self.success_count += 1
+            if self.total is None:
+                if self.success_count % PROGRESS_EVERY_RUNS == 0:
+                    log.info(
+                        "job has %s successful invocations (concurrency %s)",
+                        self.success_count,
+                        int(self.controller.limit),
+                    )
+            elif self.success_count in self.progress_steps:
+                log.info(
+                    "job is %s percent complete (%s successful invocations, concurrency %s)",
+                    math.floor((self.success_count / self.total) * 100),
+                    self.success_count,
+                    int(self.controller.limit),
+                )
+
+    async def failed_runs(self, runs, error_response):
+        self.error_response = self.error_response or error_response
+        if self.retry_pass:
+            self.retry_failure_count += len(runs)
+        else:
+            self.failure_count += len(runs)
+        self.failed += runs
+        await self.checkpoint.record(runs, error_response)
+        if self.stopped:
+            log.error("Stopping after %s failures", self.failure_count)
+
+    async def run_pass(self, job_params):
+        workers = self.controller.maximum
+        queue = asyncio.Queue(maxsize=workers * 2)
+        tasks = [asyncio.create_task(self.worker(queue)) for _ in range(workers)]
+        try:
+            async for params in iterate_in_thread(job_params):
+                # stop taking new work after too many failures, let in-flight work
+                # finish
+                if self.stopped:
+                    break
+                if self.checkpoint.is_complete(params):
+                    self.skipped_count += 1
+                    continue
+                await self.put(queue, params, tasks)
+            for _ in tasks:
+                await self.put(queue, None, tasks)
+            await asyncio.gather(*tasks)
+        finally:
+            # after a worker raised, stop the others rather than leave them invoking
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self.refresh_coalescer:
+            # finalize the runs of the last, partial group
+            await self.finalize(self.refresh_coalescer.flush())
+
+    async def put(self, queue, params, tasks):
+        """
+        Put params on the queue, or raise the error of a worker that died
+        while waiting for room: once every worker is dead nothing takes from it
+        """
+        if not queue.full():
+            queue.put_nowait(params)
+            return
+        put = asyncio.ensure_future(queue.put(params))
+        waiting = {put, *tasks}
+        try:
+            while not put.done():
+                done, waiting = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+                # a worker that took its None returns, any other raised
+                for task in done:
+                    if task is not put and task.exception() is not None:
+                        task.result()
+        finally:
+            put.cancel()
+
+    async def run(self, job_params):
+        # a streamed manifest has no length
+        self.total = len(job_params) if hasattr(job_params, "__len__") else None
+        if self.total is not None:
+            self.progress_steps = {
+                math.floor(i * 0.01 * self.total) for i in range(1, 101)
+            }
+        await self.run_pass(job_params)
+        for retry_pass in range(1, self.retry_passes + 1):
+            if not self.failed or self.stopped:
+                break
+            failed, self.failed = self.failed, []
+            log.info("Retrying %s failed runs (pass %s)", len(failed), retry_pass)
+            self.retry_pass = retry_pass
+            await self.run_pass(failed)
+        await self.checkpoint.flush()
+        dead_letters = await self.checkpoint.write_dead_letters()
+        return self.report(dead_letters)
+
+    def report(self, dead_letters):
+        return {
+            "success_count": self.success_count,
+            "skipped_count": self.skipped_count,
+            "failure_count": self.failure_count,
+            "retry_failure_count": self.retry_failure_count,
+            "throttled_count": self.throttled_count,
+            "dead_letter_count": len(dead_letters),
+            "dead_letters": dead_letters[:MAX_REPORTED_DEAD_LETTERS],
+            "checkpoint_uri": self.checkpoint.uri,
+            # stopped early after max_failures, some params were not invoked
+            "stopped": self.stopped,
+            "error_response": self.error_response,
+            "concurrency": int(self.controller.limit),
+            "concurrency_decreases": self.controller.decreases,
+        }
+
+
+async def run_queue(
+    job_params,
+    index_names,
+    concurrency_options,
+    refresh_options,
+    checkpoint_options,
+    plan,
+    report_uri=None,
+):
+    refresh_mode = refresh_options["refresh_mode"] if refresh_options else None
+    refresh_coalescer = None
+    if refresh_mode == "deferred":
+        refresh_coalescer = RefreshCoalescer(
+            index_names,
+            refresh_options["refresh_every_runs"],
+            refresh_options["refresh_every_seconds"],
+        )
+    controller = ConcurrencyController(**concurrency_options)
+    checkpoint_options = dict(checkpoint_options)
+    max_failures = checkpoint_options.pop("max_failures", None)
+    checkpoint = await asyncio.to_thread(Checkpoint(**checkpoint_options).load, plan)
+    job_params = await asyncio.to_thread(plan, job_params)
+    job_queue = JobQueue(
+        index_names,
+        controller,
+        checkpoint,
+        refresh_mode,
+        refresh_coalescer,
+        max_failures=max_failures,
+    )
+    # a connection per worker, plus one for the refresh coalescer's finalize calls
+    async with lambda_client(controller.maximum + 1):
+        report = await job_queue.run(job_params)
+    report["plan"] = plan.stats()
+    report["report_uri"] = report_uri or "{}/reports/{}{}.json".format(
+        checkpoint.uri,
+        datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        plan.suffix,
+    )
+    body = json.dumps(
+        {**report, "invocations": job_queue.backfill_report.summary()},
+        indent=2,
+        default=str,
+    )
+    await write_object(report["report_uri"], body.encode())
+    log.info("Wrote the backfill report to %s", report["report_uri"])
+    return report
+
+
+def parallel_runs(
+    job_params,
+    index_names,
+    concurrency,
+    checkpoint_options,
+    refresh_options=None,
+    concurrency_options=None,
+    plan=None,
+    report_uri=None,
+):
+    """
+    Invoke the lambda for each job_params (a list, or an iterator such as
+    read_manifest) in the plan that the checkpoint does not have as completed,
+    with at most `concurrency` invocations in flight. `checkpoint_options` are
+    passed on to Checkpoint (plus `max_failures`, the number of failures after
+    which the job stops taking new work), and `concurrency_options` to
+    ConcurrencyController. The report, with a BackfillReport of the
+    invocations, is also written as JSON to `report_uri` (by default under the
+    checkpoint's reports/).
+    """
+    concurrency_options = {**(concurrency_options or {}), "maximum": concurrency}
+    return asyncio.run(
+        run_queue(
+            job_params,
+            index_names,
+            concurrency_options,
+            refresh_options,
+            checkpoint_options,
+            plan or Plan(),
+            report_uri,
+        )
+    )
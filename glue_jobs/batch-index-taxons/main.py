@@ -1,9 +1,13 @@
 import config
 import job
 import logging
+import os
 
 log = logging.getLogger()
 
+# stop taking new work after this many failed pairs, e.g. a broken deploy
+DEFAULT_MAX_FAILURES = 100
+
 
 def configure_logger():
     global_logger = logging.getLogger()
@@ -23,24 +27,51 @@ def main():
     )
     # TODO validate input json
 
-    # flatten input json into list of job params
-    job_params = [
-        {"pipeline_run_id": pipeline_run_id, "background_id": background_id}
-        for record in input_file["job_params"]
-        for pipeline_run_id in record["pipeline_run_ids"]
-        for background_id in record["background_ids"]
-    ]
+    if "manifest_uri" in input_file:
+        # streamed while the job runs
+        log.info("Reading job params from %s", input_file["manifest_uri"])
+        job_params = job.read_manifest(input_file["manifest_uri"])
+    else:
+        # flatten input json into list of job params
+        job_params = list(job.expand_job_params(input_file["job_params"]))
 
-    skip = []
     if "skip" in input_file:
-        log.info("Skipping inputs: %s", input_file["skip"])
-        skip = input_file["skip"]
+        # the job resumes from its checkpoint instead
+        raise ValueError("skip is no longer supported, see checkpoint_uri")
+
+    checkpoint_options = {
+        "uri": input_file.get("checkpoint_uri")
+        or "s3://{}/checkpoints/{}".format(
+            config.params["input_s3_bucket"],
+            os.path.splitext(config.params["input_s3_path"])[0],
+        ),
+        "max_runs": input_file.get("checkpoint_every_runs", job.CHECKPOINT_EVERY_RUNS),
+        "max_seconds": input_file.get(
+            "checkpoint_every_seconds", job.CHECKPOINT_EVERY_SECONDS
+        ),
+        "max_failures": input_file.get("max_failures", DEFAULT_MAX_FAILURES),
+    }
+    log.info("Checkpoint options: %s", checkpoint_options)
 
     concurrency = 50
     if "concurrency" in input_file:
         log.info("Concurrency: %s", input_file["concurrency"])
         concurrency = input_file["concurrency"]
 
+    concurrency_options = {
+        "minimum": input_file.get("min_concurrency", 1),
+        "initial": input_file.get("initial_concurrency", concurrency),
+        "target_latency": input_file.get("target_latency_seconds"),
+    }
+    log.info("Concurrency options: %s", concurrency_options)
+
+    refresh_options = {
+        "refresh_mode": input_file.get("refresh_mode", "immediate"),
+        "refresh_every_runs": input_file.get("refresh_every_runs", 100),
+        "refresh_every_seconds": input_file.get("refresh_every_seconds", 60),
+    }
+    log.info("Refresh options: %s", refresh_options)
+
     index_names = {
         "scored_taxon_counts_index_name": config.params[
             "scored_taxon_counts_index_name"
@@ -48,12 +79,30 @@ def main():
         "pipeline_runs_index_name": config.params["pipeline_runs_index_name"],
     }
 
-    log.info("Running job with %s inputs", len(job_params) - sum(skip))
-    reports = job.parallel_runs(job_params, skip, index_names, concurrency)
-    for report in reports:
-        if report["error_response"]:
-            raise Exception("Job failed: %s", reports)
-    log.info("Job finished successfully: %s", reports)
+    plan = job.Plan(
+        input_file.get("order", job.DEFAULT_ORDER),
+        # Glue arguments, so several runs of one input file can split it
+        int(config.params.get("shard_index") or 0),
+        int(config.params.get("shard_count") or 1),
+        input_file.get("deduplicate", True),
+    )
+    log.info("Plan: %s", plan.stats())
+
+    if isinstance(job_params, list):
+        log.info("Running job with %s inputs", len(job_params))
+    report = job.parallel_runs(
+        job_params,
+        index_names,
+        concurrency,
+        checkpoint_options,
+        refresh_options,
+        concurrency_options,
+        plan,
+        input_file.get("report_uri"),
+    )
+    if report["dead_letter_count"] or report["stopped"]:
+        raise Exception("Job failed: %s", report)
+    log.info("Job finished successfully: %s", report)
 
 
 config.init()
@@ -0,0 +1,21 @@
+import pytest
+
+import config
+import job
+from test.stubs import StubLambda
+
+
+@pytest.fixture(autouse=True)
+def lambda_function_name(mocker):
+    mocker.patch.dict(config.params, {"lambda_function_name": "taxon-indexing"})
+    mocker.patch.object(job, "THROTTLE_WAIT_SECONDS", 0)
+
+
+@pytest.fixture
+def stub(mocker):
+    def stub(outcomes=None, finalize=None):
+        invoke = StubLambda(outcomes, finalize)
+        mocker.patch.object(job, "invoke_once", invoke)
+        return invoke
+
+    return stub
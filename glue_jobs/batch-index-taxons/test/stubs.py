@@ -0,0 +1,91 @@
+"""
+Responses, errors and a stand-in for invoke_once shared by the job's tests
+"""
+
+import asyncio
+import json
+
+import botocore.exceptions
+
+import job
+
+
+def ok(metrics=None):
+    return {"Payload": {"metrics": metrics} if metrics else {}}
+
+
+def function_error(error_type="Exception", message="boom"):
+    return {
+        "FunctionError": "Unhandled",
+        "Payload": {"errorType": error_type, "errorMessage": message},
+    }
+
+
+def client_error(code, status=400):
+    return botocore.exceptions.ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        "Invoke",
+    )
+
+
+def pairs(*keys):
+    return [
+        {"pipeline_run_id": pipeline_run_id, "background_id": background_id}
+        for pipeline_run_id, background_id in keys
+    ]
+
+
+class StubLambda:
+    """
+    Stands in for invoke_once: answers each run with the next of its
+    `outcomes` (a response, or an exception to raise), then with ok(), and
+    records the payloads it was invoked with
+    """
+
+    def __init__(self, outcomes=None, finalize=None):
+        self.outcomes = {key: list(values) for key, values in (outcomes or {}).items()}
+        self.finalize = list(finalize or [])
+        self.payloads = []
+
+    async def __call__(self, function_name, payload):
+        payload = json.loads(payload)
+        self.payloads.append(payload)
+        await asyncio.sleep(0)
+        if "finalize_runs" in payload:
+            outcome = self.finalize.pop(0) if self.finalize else ok()
+        else:
+            outcomes = self.outcomes.get(job.run_key(payload), [])
+            outcome = outcomes.pop(0) if outcomes else ok()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    @property
+    def invoked(self):
+        return [
+            job.run_key(payload)
+            for payload in self.payloads
+            if "pipeline_run_id" in payload
+        ]
+
+
+def run_job(uri, job_params, concurrency=2, max_failures=None, refresh_coalescer=None):
+    async def run():
+        checkpoint = job.Checkpoint(uri, max_runs=2).load()
+        job_queue = job.JobQueue(
+            {"scored_taxon_counts_index_name": "scored_taxon_counts"},
+            job.ConcurrencyController(concurrency),
+            checkpoint,
+            refresh_mode="deferred" if refresh_coalescer else None,
+            refresh_coalescer=refresh_coalescer,
+            max_failures=max_failures,
+        )
+        # a job that hangs fails the test instead of the suite
+        return await asyncio.wait_for(job_queue.run(job_params), 30)
+
+    return asyncio.run(run())
+
+
+def read_ndjson(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
@@ -0,0 +1,241 @@
+import asyncio
+import os
+
+import pytest
+import tenacity
+
+import config
+import job
+from test.stubs import client_error, function_error, ok, pairs, read_ndjson, run_job
+
+
+def write_segments(path, segments):
+    async def write():
+        for runs in segments:
+            checkpoint = job.Checkpoint(str(path), max_runs=len(runs))
+            await checkpoint.record(runs)
+
+    asyncio.run(write())
+
+
+class TestCheckpoint:
+    def test_loads_completed_and_failed_pairs(self, tmp_path):
+        uri = str(tmp_path)
+
+        async def write():
+            checkpoint = job.Checkpoint(uri, max_runs=10)
+            await checkpoint.record(pairs((1, 1), (2, 1)), "boom")
+            await checkpoint.flush()
+            await checkpoint.record(pairs((1, 1)))
+            await checkpoint.flush()
+
+        asyncio.run(write())
+        checkpoint = job.Checkpoint(uri).load()
+
+        assert checkpoint.completed == {(1, 1)}
+        assert checkpoint.failed == {(2, 1): "boom"}
+        assert len(os.listdir(tmp_path / "segments")) == 2
+
+    def test_flushes_every_max_runs(self, tmp_path):
+        async def record():
+            checkpoint = job.Checkpoint(str(tmp_path), max_runs=2)
+            await checkpoint.record(pairs((1, 1)))
+            assert not (tmp_path / "segments").exists()
+            await checkpoint.record(pairs((2, 1)))
+
+        asyncio.run(record())
+
+        assert len(os.listdir(tmp_path / "segments")) == 1
+
+    def test_loads_only_the_plans_shard(self, tmp_path):
+        asyncio.run(
+            job.Checkpoint(str(tmp_path), max_runs=1).record(
+                pairs(*[(id, 1) for id in range(10)])
+            )
+        )
+        plan = job.Plan(shard_index=0, shard_count=2)
+
+        checkpoint = job.Checkpoint(str(tmp_path)).load(plan)
+
+        assert checkpoint.completed == {
+            key for key in checkpoint.completed if plan.in_shard(key)
+        }
+        assert 0 < len(checkpoint.completed) < 10
+
+    def test_compacts_many_segments_into_one(self, tmp_path, mocker):
+        mocker.patch.object(job, "COMPACT_SEGMENTS", 2)
+        write_segments(tmp_path, [pairs((1, 1))] * 2 + [pairs((2, 1)), pairs((3, 1))])
+        asyncio.run(
+            job.Checkpoint(str(tmp_path), max_runs=1).record(pairs((3, 1)), "boom")
+        )
+
+        first = job.Checkpoint(str(tmp_path)).load()
+        second = job.Checkpoint(str(tmp_path)).load()
+
+        assert len(os.listdir(tmp_path / "segments")) == 1
+        assert first.completed == second.completed == {(1, 1), (2, 1), (3, 1)}
+        assert second.failed == {}
+
+    def test_keeps_failed_pairs_when_compacting(self, tmp_path, mocker):
+        mocker.patch.object(job, "COMPACT_SEGMENTS", 1)
+        write_segments(tmp_path, [pairs((1, 1))])
+        asyncio.run(
+            job.Checkpoint(str(tmp_path), max_runs=1).record(pairs((2, 1)), "boom")
+        )
+
+        job.Checkpoint(str(tmp_path)).load()
+        checkpoint = job.Checkpoint(str(tmp_path)).load()
+
+        assert checkpoint.completed == {(1, 1)}
+        assert checkpoint.failed == {(2, 1): "boom"}
+
+    def test_sharded_load_does_not_compact(self, tmp_path, mocker):
+        mocker.patch.object(job, "COMPACT_SEGMENTS", 1)
+        write_segments(tmp_path, [pairs((1, 1)), pairs((2, 1)), pairs((3, 1))])
+
+        job.Checkpoint(str(tmp_path)).load(job.Plan(shard_index=0, shard_count=2))
+
+        assert len(os.listdir(tmp_path / "segments")) == 3
+
+    def test_load_goes_on_when_compaction_fails(self, tmp_path, mocker):
+        mocker.patch.object(job, "COMPACT_SEGMENTS", 1)
+        mocker.patch.object(config, "delete_objects", side_effect=OSError("denied"))
+        write_segments(tmp_path, [pairs((1, 1)), pairs((2, 1))])
+
+        checkpoint = job.Checkpoint(str(tmp_path)).load()
+
+        assert checkpoint.completed == {(1, 1), (2, 1)}
+        # the merged segment was written, the others are still there
+        assert len(os.listdir(tmp_path / "segments")) == 3
+        assert job.Checkpoint(str(tmp_path)).load().completed == {(1, 1), (2, 1)}
+
+
+class TestJobQueueFailures:
+    def test_resume_skips_completed_pairs_at_another_concurrency(self, tmp_path, stub):
+        job_params = pairs(*[(id, 1) for id in range(10)])
+        stub({(3, 1): [function_error(), function_error()]})
+        first = run_job(str(tmp_path), job_params, concurrency=2)
+        assert first["dead_letter_count"] == 1
+
+        invoke = stub()
+        second = run_job(str(tmp_path), job_params, concurrency=5)
+
+        assert invoke.invoked == [(3, 1)]
+        assert second["skipped_count"] == 9
+        assert second["success_count"] == 1
+        assert second["dead_letter_count"] == 0
+
+    def test_retry_pass_retries_failures_once_the_queue_is_empty(self, tmp_path, stub):
+        invoke = stub({(1, 1): [function_error()]})
+
+        report = run_job(str(tmp_path), pairs((1, 1), (2, 1), (3, 1)), concurrency=1)
+
+        assert invoke.invoked == [(1, 1), (2, 1), (3, 1), (1, 1)]
+        assert report["success_count"] == 3
+        assert report["dead_letter_count"] == 0
+        assert read_ndjson(tmp_path / "dead_letters.ndjson") == []
+
+    def test_writes_dead_letters_of_pairs_that_never_completed(self, tmp_path, stub):
+        stub(
+            {
+                (2, 1): [
+                    function_error("KeyError"),
+                    client_error("ServiceException", 500),
+                ]
+            }
+        )
+
+        report = run_job(str(tmp_path), pairs((1, 1), (2, 1)))
+
+        assert report["dead_letter_count"] == 1
+        (dead_letter,) = read_ndjson(tmp_path / "dead_letters.ndjson")
+        assert job.run_key(dead_letter) == (2, 1)
+        assert "ServiceException" in dead_letter["error"]
+        assert report["error_response"]["Payload"]["errorType"] == "KeyError"
+        assert report["failure_count"] == 1
+        assert report["retry_failure_count"] == 1
+
+    def test_retry_failures_do_not_count_towards_max_failures(self, tmp_path, stub):
+        job_params = pairs((1, 1), (2, 1), (3, 1))
+        stub(
+            {
+                job.run_key(params): [function_error(), function_error()]
+                for params in job_params[:2]
+            }
+        )
+
+        report = run_job(str(tmp_path), job_params, max_failures=3)
+
+        assert not report["stopped"]
+        assert report["failure_count"] == 2
+        assert report["retry_failure_count"] == 2
+
+    def test_stops_after_max_failures(self, tmp_path, stub):
+        job_params = pairs(*[(id, 1) for id in range(10)])
+        invoke = stub(
+            {job.run_key(params): [function_error()] for params in job_params}
+        )
+
+        report = run_job(str(tmp_path), job_params, concurrency=1, max_failures=3)
+
+        assert report["stopped"]
+        assert len(invoke.invoked) == 3
+        assert report["dead_letter_count"] == 3
+
+    def test_coalesced_finalize_failure_marks_its_runs_failed(self, tmp_path, stub):
+        # the first group of two fails in both passes, the last group of one succeeds
+        invoke = stub(finalize=[function_error(), ok(), function_error()])
+        coalescer = job.RefreshCoalescer(
+            {"scored_taxon_counts_index_name": "scored_taxon_counts"},
+            max_runs=2,
+            max_seconds=60,
+        )
+
+        report = run_job(
+            str(tmp_path), pairs((1, 1), (2, 1), (3, 1)), refresh_coalescer=coalescer
+        )
+
+        finalized = [
+            [job.run_key(run) for run in payload["finalize_runs"]]
+            for payload in invoke.payloads
+            if "finalize_runs" in payload
+        ]
+        assert invoke.payloads[0]["refresh_mode"] == "deferred"
+        assert len(finalized) == 3
+        assert finalized[0] == finalized[2]
+        assert report["dead_letter_count"] == 2
+        assert report["success_count"] == 1
+        assert sorted(map(job.run_key, report["dead_letters"])) == sorted(finalized[0])
+
+    def test_fails_when_the_checkpoint_cannot_be_written(self, tmp_path, stub, mocker):
+        invoke = stub()
+        write = mocker.patch.object(
+            config, "write_object", side_effect=OSError("SlowDown")
+        )
+        mocker.patch.object(job.write_object.retry, "wait", tenacity.wait_none())
+        job_params = pairs(*[(id, 1) for id in range(100)])
+
+        with pytest.raises(OSError, match="SlowDown"):
+            run_job(str(tmp_path), job_params, concurrency=2)
+
+        # every worker died on its first segment instead of the job hanging
+        assert write.call_count == 2 * job.WRITE_ATTEMPTS
+        assert len(invoke.invoked) < len(job_params)
+
+    def test_retries_checkpoint_writes(self, tmp_path, stub, mocker):
+        stub()
+        write_object = config.write_object
+        errors = [OSError("SlowDown")]
+
+        def write(uri, body):
+            if errors:
+                raise errors.pop()
+            write_object(uri, body)
+
+        mocker.patch.object(config, "write_object", write)
+        mocker.patch.object(job.write_object.retry, "wait", tenacity.wait_none())
+
+        report = run_job(str(tmp_path), pairs((1, 1), (2, 1)))
+
+        assert report["success_count"] == 2
+        assert job.Checkpoint(str(tmp_path)).load().completed == {(1, 1), (2, 1)}
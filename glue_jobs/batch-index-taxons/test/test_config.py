@@ -0,0 +1,61 @@
+import os
+
+import config
+
+
+class TestObjects:
+    def test_reads_local_objects(self, tmp_path):
+        for name in ["b", "a"]:
+            (tmp_path / name).write_bytes(name.encode())
+
+        objects = list(config.read_objects(str(tmp_path)))
+
+        assert objects == [(str(tmp_path / "a"), b"a"), (str(tmp_path / "b"), b"b")]
+        assert list(config.read_objects(str(tmp_path / "missing"))) == []
+
+    def test_reads_s3_objects_with_one_client(self, mocker):
+        s3 = mocker.Mock()
+        s3.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "checkpoint/segments/1"}]},
+            {"Contents": [{"Key": "checkpoint/segments/2"}]},
+        ]
+        s3.get_object.side_effect = lambda Bucket, Key: {
+            "Body": mocker.Mock(read=lambda: Key.encode())
+        }
+        client = mocker.patch.object(config.boto3, "client", return_value=s3)
+
+        objects = list(config.read_objects("s3://bucket/checkpoint/segments/"))
+
+        assert objects == [
+            ("s3://bucket/checkpoint/segments/1", b"checkpoint/segments/1"),
+            ("s3://bucket/checkpoint/segments/2", b"checkpoint/segments/2"),
+        ]
+        s3.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="bucket", Prefix="checkpoint/segments/"
+        )
+        # one to list, one shared by the threads that read
+        assert client.call_count == 2
+
+    def test_deletes_s3_objects_in_batches(self, mocker):
+        s3 = mocker.patch.object(config.boto3, "client").return_value
+        s3.delete_objects.return_value = {}
+        mocker.patch.object(config, "DELETE_BATCH_SIZE", 2)
+
+        config.delete_objects([f"s3://bucket/segments/{i}" for i in range(5)])
+
+        batches = [
+            [obj["Key"] for obj in call.kwargs["Delete"]["Objects"]]
+            for call in s3.delete_objects.call_args_list
+        ]
+        assert batches == [
+            ["segments/0", "segments/1"],
+            ["segments/2", "segments/3"],
+            ["segments/4"],
+        ]
+
+    def test_deletes_local_objects(self, tmp_path):
+        (tmp_path / "a").write_bytes(b"a")
+
+        config.delete_objects([str(tmp_path / "a")])
+
+        assert os.listdir(tmp_path) == []
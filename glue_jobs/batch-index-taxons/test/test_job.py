@@ -0,0 +1,138 @@
+import asyncio
+import os
+
+import pytest
+
+import job
+from test.stubs import client_error, function_error, ok, pairs, run_job
+
+
+class TestConcurrencyController:
+    def test_burst_of_throttles_decreases_once(self):
+        async def run():
+            controller = job.ConcurrencyController(8)
+            started = [await controller.acquire() for _ in range(8)]
+            for start in started:
+                await controller.release(start, job.THROTTLED)
+            return controller
+
+        controller = asyncio.run(run())
+
+        assert controller.limit == 4
+        assert controller.decreases == 1
+        assert controller.in_flight == 0
+
+    def test_throttle_after_the_decrease_decreases_again(self):
+        async def run():
+            controller = job.ConcurrencyController(8)
+            await controller.release(await controller.acquire(), job.THROTTLED)
+            await controller.release(await controller.acquire(), job.THROTTLED)
+            return controller
+
+        controller = asyncio.run(run())
+
+        assert controller.limit == 2
+        assert controller.decreases == 2
+
+    def test_additive_increase_per_round_up_to_maximum(self):
+        async def run():
+            controller = job.ConcurrencyController(5, initial=4)
+            for _ in range(4):
+                await controller.release(await controller.acquire(), job.SUCCEEDED)
+            limit = controller.limit
+            for _ in range(20):
+                await controller.release(await controller.acquire(), job.SUCCEEDED)
+            return limit, controller.limit
+
+        one_round, many_rounds = asyncio.run(run())
+
+        assert 4.9 < one_round < 5
+        assert many_rounds == 5
+
+    def test_never_below_minimum(self):
+        async def run():
+            controller = job.ConcurrencyController(4, minimum=3)
+            await controller.release(await controller.acquire(), job.THROTTLED)
+            return controller
+
+        assert asyncio.run(run()).limit == 3
+
+    @pytest.mark.parametrize("minimum, initial", [(0, 1), (1, 0.5), (-1, 0.2)])
+    def test_throttle_at_the_floor_still_lets_an_invocation_through(
+        self, minimum, initial
+    ):
+        async def run():
+            controller = job.ConcurrencyController(4, minimum=minimum, initial=initial)
+            await controller.release(await controller.acquire(), job.THROTTLED)
+            await asyncio.wait_for(controller.acquire(), 1)
+            return controller
+
+        controller = asyncio.run(run())
+
+        assert controller.limit == 1
+        assert controller.in_flight == 1
+
+    def test_rejects_no_concurrency(self):
+        with pytest.raises(ValueError):
+            job.ConcurrencyController(0)
+
+    def test_slow_invocations_decrease(self):
+        async def run():
+            controller = job.ConcurrencyController(4, target_latency=5)
+            await controller.acquire()
+            await controller.release(job.time.monotonic() - 10, job.SUCCEEDED)
+            return controller
+
+        controller = asyncio.run(run())
+
+        assert controller.limit == 2
+        assert controller.latency >= 10
+
+
+class TestClassify:
+    @pytest.mark.parametrize(
+        "response, error, outcome",
+        [
+            (ok(), None, job.SUCCEEDED),
+            (None, client_error("TooManyRequestsException", 429), job.THROTTLED),
+            (None, client_error("ServiceException", 429), job.THROTTLED),
+            (None, client_error("ServiceException", 500), job.FAILED),
+            (None, TimeoutError(), job.FAILED),
+            (function_error("TransportError"), None, job.THROTTLED),
+            (
+                function_error("BulkIndexError", "es_rejected_execution_exception"),
+                None,
+                job.THROTTLED,
+            ),
+            (function_error("KeyError", "'taxon_counts'"), None, job.FAILED),
+        ],
+    )
+    def test_outcome(self, response, error, outcome):
+        assert job.classify(response, error) == outcome
+
+
+class TestJobQueue:
+    def test_invokes_every_params_once(self, tmp_path, stub):
+        invoke = stub()
+
+        report = run_job(str(tmp_path), pairs((1, 1), (2, 1), (3, 1)))
+
+        assert sorted(invoke.invoked) == [(1, 1), (2, 1), (3, 1)]
+        assert (
+            invoke.payloads[0]["scored_taxon_counts_index_name"]
+            == "scored_taxon_counts"
+        )
+        assert report["success_count"] == 3
+        assert report["dead_letter_count"] == 0
+        assert not report["stopped"]
+        assert os.path.exists(tmp_path / "dead_letters.ndjson")
+
+    def test_retries_throttled_invocations(self, tmp_path, stub):
+        invoke = stub({(1, 1): [client_error("TooManyRequestsException", 429)]})
+
+        report = run_job(str(tmp_path), pairs((1, 1)))
+
+        assert invoke.invoked == [(1, 1), (1, 1)]
+        assert report["throttled_count"] == 1
+        assert report["success_count"] == 1
+        assert report["concurrency_decreases"] == 1
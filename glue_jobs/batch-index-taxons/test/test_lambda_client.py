@@ -0,0 +1,90 @@
+import asyncio
+import base64
+import contextlib
+import json
+
+import job
+from test.stubs import pairs
+
+
+class StubPayload:
+    def __init__(self, body):
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+
+class StubClient:
+    """
+    Stands in for an aiobotocore Lambda client, echoing each payload back
+    """
+
+    def __init__(self):
+        self.invocations = []
+
+    async def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+        return {
+            "Payload": StubPayload(kwargs["Payload"].encode()),
+            "LogResult": base64.b64encode(b"START RequestId"),
+        }
+
+
+def stub_create_client(mocker):
+    clients = []
+
+    @contextlib.asynccontextmanager
+    async def create_client(max_pool_connections=job.DEFAULT_POOL_CONNECTIONS):
+        clients.append((StubClient(), max_pool_connections))
+        yield clients[-1][0]
+
+    mocker.patch.object(job, "create_client", create_client)
+    return clients
+
+
+class TestLambdaClient:
+    def test_invocations_share_one_client(self, mocker):
+        clients = stub_create_client(mocker)
+
+        async def run():
+            async with job.lambda_client(11):
+                return await asyncio.gather(
+                    *(
+                        job.invoke_once("taxon-indexing", json.dumps(i))
+                        for i in range(5)
+                    )
+                )
+
+        responses = asyncio.run(run())
+
+        ((client, max_pool_connections),) = clients
+        assert max_pool_connections == 11
+        assert len(client.invocations) == 5
+        assert [response["Payload"] for response in responses] == list(range(5))
+        assert responses[0]["LogResult"] == b"START RequestId"
+        assert job._client is None
+
+    def test_invocation_outside_a_job_opens_its_own_client(self, mocker):
+        clients = stub_create_client(mocker)
+
+        async def run():
+            await job.invoke_once("taxon-indexing", "{}")
+            await job.invoke_once("taxon-indexing", "{}")
+
+        asyncio.run(run())
+
+        assert len(clients) == 2
+        assert clients[0][0].invocations[0]["FunctionName"] == "taxon-indexing"
+
+    def test_job_pools_a_connection_per_worker_and_one_to_finalize(
+        self, tmp_path, stub, mocker
+    ):
+        stub()
+        lambda_client = mocker.patch.object(
+            job, "lambda_client", return_value=contextlib.nullcontext()
+        )
+
+        job.parallel_runs(pairs((1, 1)), {}, 7, {"uri": str(tmp_path)})
+
+        lambda_client.assert_called_once_with(8)
@@ -0,0 +1,110 @@
+import asyncio
+import gzip
+import io
+import json
+
+import pytest
+
+import config
+import job
+from test.stubs import run_job
+
+RECORDS = [
+    {"pipeline_run_id": 1, "background_id": 10},
+    {"pipeline_run_ids": [2, 3], "background_ids": [10, 20]},
+    {"pipeline_run_id": 4, "background_id": 20, "last_read_at": "2024-01-01"},
+]
+PAIRS = [(1, 10), (2, 10), (2, 20), (3, 10), (3, 20), (4, 20)]
+
+
+def manifest_body(records=RECORDS):
+    # blank lines, e.g. a trailing newline, are skipped
+    lines = [json.dumps(record) for record in records]
+    return ("\n".join(lines[:2]) + "\n\n  \n" + "\n".join(lines[2:]) + "\n").encode()
+
+
+class StubS3Body(io.BytesIO):
+    """
+    Stands in for a botocore StreamingBody
+    """
+
+    def iter_lines(self, chunk_size):
+        return iter(self.getvalue().splitlines())
+
+
+class TestExpandJobParams:
+    def test_expands_every_combination(self):
+        job_params = list(job.expand_job_params(RECORDS))
+
+        assert [job.run_key(params) for params in job_params] == PAIRS
+        assert job_params[-1]["last_read_at"] == "2024-01-01"
+        assert "last_read_at" not in job_params[0]
+
+
+class TestReadManifest:
+    @pytest.mark.parametrize("name", ["manifest.ndjson", "manifest.ndjson.gz"])
+    def test_reads_local_manifest(self, tmp_path, name):
+        body = manifest_body()
+        (tmp_path / name).write_bytes(
+            gzip.compress(body) if name.endswith(".gz") else body
+        )
+
+        job_params = job.read_manifest(str(tmp_path / name))
+
+        assert not hasattr(job_params, "__len__")
+        assert [job.run_key(params) for params in job_params] == PAIRS
+
+    @pytest.mark.parametrize("key", ["manifest.ndjson", "manifest.ndjson.gz"])
+    def test_streams_s3_manifest(self, mocker, key):
+        body = manifest_body()
+        stream = StubS3Body(gzip.compress(body) if key.endswith(".gz") else body)
+        s3 = mocker.patch.object(config.boto3, "client").return_value
+        s3.get_object.return_value = {"Body": stream}
+
+        job_params = list(job.read_manifest("s3://bucket/manifests/" + key))
+
+        assert [job.run_key(params) for params in job_params] == PAIRS
+        s3.get_object.assert_called_once_with(Bucket="bucket", Key=f"manifests/{key}")
+        assert stream.closed
+
+
+class TestIterateInThread:
+    def test_yields_every_item_in_batches(self):
+        read = []
+
+        def items():
+            for i in range(5):
+                read.append(i)
+                yield i
+
+        async def run():
+            return [item async for item in job.iterate_in_thread(items(), 2)]
+
+        assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+        assert read == [0, 1, 2, 3, 4]
+
+
+class TestStreamedJob:
+    def test_runs_a_gzipped_manifest(self, tmp_path, stub):
+        manifest = tmp_path / "manifest.ndjson.gz"
+        manifest.write_bytes(gzip.compress(manifest_body()))
+        invoke = stub()
+
+        report = run_job(str(tmp_path / "checkpoint"), job.read_manifest(str(manifest)))
+
+        assert sorted(invoke.invoked) == PAIRS
+        assert "last_read_at" not in invoke.payloads[-1]
+        assert report["success_count"] == len(PAIRS)
+        assert report["dead_letter_count"] == 0
+
+    def test_resumes_a_manifest(self, tmp_path, stub):
+        manifest = tmp_path / "manifest.ndjson.gz"
+        manifest.write_bytes(gzip.compress(manifest_body()))
+        stub()
+        run_job(str(tmp_path / "checkpoint"), job.read_manifest(str(manifest)))
+
+        invoke = stub()
+        report = run_job(str(tmp_path / "checkpoint"), job.read_manifest(str(manifest)))
+
+        assert invoke.invoked == []
+        assert report["skipped_count"] == len(PAIRS)
@@ -0,0 +1,88 @@
+import contextlib
+import logging
+
+import pytest
+
+import job
+from test.stubs import pairs
+
+
+class TestPlan:
+    def test_deduplicates_in_manifest_order(self):
+        plan = job.Plan()
+
+        planned = list(plan(iter(pairs((2, 1), (1, 1), (2, 1)))))
+
+        assert [job.run_key(params) for params in planned] == [(2, 1), (1, 1)]
+        assert plan.stats()["duplicate_count"] == 1
+
+    def test_manifest_order_without_deduplicate_keeps_no_pairs(self, mocker):
+        plan = job.Plan(shard_index=0, shard_count=2, deduplicate=False)
+        deduplicate = mocker.spy(plan, "deduplicate")
+        job_params = pairs(*[(id, 1) for id in range(20)] * 2)
+
+        planned = list(plan(iter(job_params)))
+
+        in_shard = [
+            params for params in job_params if plan.in_shard(job.run_key(params))
+        ]
+        assert planned == in_shard
+        assert plan.stats()["duplicate_count"] == 0
+        assert plan.stats()["planned_count"] == len(in_shard)
+        assert not plan.stats()["deduplicate"]
+        deduplicate.assert_not_called()
+
+    def test_background_order(self):
+        planned = job.Plan("background")(pairs((3, 2), (2, 1), (1, 2)))
+
+        assert [job.run_key(params) for params in planned] == [(2, 1), (1, 2), (3, 2)]
+
+    def test_recently_read_order_keeps_latest_read_of_duplicates(self):
+        job_params = [
+            {"pipeline_run_id": 1, "background_id": 1, "last_read_at": "2024-01-01"},
+            {"pipeline_run_id": 2, "background_id": 1, "last_read_at": "2024-02-01"},
+            {"pipeline_run_id": 3, "background_id": 1},
+            {"pipeline_run_id": 1, "background_id": 1, "last_read_at": "2024-03-01"},
+        ]
+
+        planned = job.Plan("recently_read")(job_params)
+
+        assert [job.run_key(params) for params in planned] == [(1, 1), (2, 1), (3, 1)]
+
+    def test_shards_split_every_pair_once(self):
+        job_params = pairs(*[(id, id % 3) for id in range(100)])
+        plans = [job.Plan(shard_index=i, shard_count=3) for i in range(3)]
+
+        planned = [job.run_key(params) for plan in plans for params in plan(job_params)]
+
+        assert sorted(planned) == sorted(job.run_key(params) for params in job_params)
+        assert all(plan.other_shards_count for plan in plans)
+        assert plans[1].suffix == "-shard-1-of-3"
+
+    def test_rejects_unknown_order_and_shard(self):
+        with pytest.raises(ValueError):
+            job.Plan("random")
+        with pytest.raises(ValueError):
+            job.Plan(shard_index=2, shard_count=2)
+
+    def test_manifest_order_keeps_a_list_a_list(self):
+        plan = job.Plan()
+
+        planned = plan(pairs((2, 1), (1, 1), (2, 1)))
+
+        assert isinstance(planned, list)
+        assert [job.run_key(params) for params in planned] == [(2, 1), (1, 1)]
+        assert plan.stats()["planned_count"] == 2
+
+
+class TestPlannedJob:
+    def test_logs_percent_progress_of_a_list(self, tmp_path, stub, mocker, caplog):
+        mocker.patch.object(job, "lambda_client", return_value=contextlib.nullcontext())
+        stub()
+        caplog.set_level(logging.INFO)
+
+        job.parallel_runs(
+            pairs(*[(id, 1) for id in range(4)]), {}, 2, {"uri": str(tmp_path)}
+        )
+
+        assert "job is 100 percent complete" in caplog.text
@@ -0,0 +1,75 @@
+import contextlib
+import json
+
+import job
+from test.stubs import client_error, function_error, ok, pairs
+
+
+class TestErrorCategory:
+    def test_error_category(self):
+        assert job.error_category(error=client_error("TooManyRequestsException")) == (
+            "TooManyRequestsException"
+        )
+        assert job.error_category(error=TimeoutError()) == "TimeoutError"
+        assert job.error_category(function_error("KeyError")) == "KeyError"
+
+
+class TestParallelRuns:
+    def test_writes_the_report(self, tmp_path, stub, mocker):
+        mocker.patch.object(
+            job, "lambda_client", lambda *args: contextlib.nullcontext()
+        )
+        stub({(2, 1): [ok({"documents": 5, "total_ms": 1000})]})
+
+        report = job.parallel_runs(
+            pairs((1, 1), (2, 1)),
+            {"scored_taxon_counts_index_name": "scored_taxon_counts"},
+            2,
+            {"uri": str(tmp_path), "max_failures": 10},
+            report_uri=str(tmp_path / "report.json"),
+        )
+
+        with open(tmp_path / "report.json") as f:
+            written = json.load(f)
+        assert report["success_count"] == written["success_count"] == 2
+        assert written["plan"]["planned_count"] == 2
+        assert written["invocations"]["lambda_metrics"]["documents"] == 5
+
+
+class TestBackfillReport:
+    def test_summary(self):
+        report = job.BackfillReport()
+        report.add(
+            pairs((1, 1))[0],
+            0.1,
+            job.SUCCEEDED,
+            ok({"documents": 10, "total_ms": 2000}),
+        )
+        report.add(
+            pairs((2, 1))[0],
+            3,
+            job.SUCCEEDED,
+            ok({"documents": 30, "phases_ms": {"mysql": 5}}),
+        )
+        report.add(
+            pairs((3, 1))[0],
+            0.2,
+            job.THROTTLED,
+            error=client_error("TooManyRequestsException"),
+        )
+        report.add(pairs((4, 1))[0], 400, job.FAILED, function_error("KeyError"))
+
+        summary = report.summary()
+
+        assert summary["invocations"] == 4
+        assert summary["latency_seconds"]["p50"] == 0.25
+        assert summary["latency_seconds"]["p99"] == 400
+        assert summary["errors"] == {
+            job.THROTTLED: {"TooManyRequestsException": 1},
+            job.FAILED: {"KeyError": 1},
+        }
+        assert [run["pipeline_run_id"] for run in summary["slowest_runs"]] == [2, 1]
+        assert summary["lambda_metrics"]["invocations"] == 2
+        assert summary["lambda_metrics"]["documents"] == 40
+        assert summary["lambda_metrics"]["phases_ms"] == {"mysql": 5}
+        assert summary["lambda_metrics"]["docs_per_lambda_second"] == 20
@@ -0,0 +1,53 @@
+#!/usr/bin/env bash
+# Local test harness for the Glue jobs, the counterpart of
+# lambdas/run_lambda_tests.sh.
+#
+# The suites stub the Lambda invocations and write checkpoints to a temporary
+# directory, so they need no live AWS; a clean venv with the job's runtime deps
+# fully exercises them.
+#
+# Usage:   glue_jobs/run_glue_tests.sh
+#          PYTHON=python3.12 glue_jobs/run_glue_tests.sh   # pin an interpreter
+set -euo pipefail
+cd "$(dirname "$0")"
+
+PY="${PYTHON:-}"
+if [ -z "$PY" ]; then
+  for c in python3.12 python3.11 python3; do command -v "$c" >/dev/null 2>&1 && PY="$c" && break; done
+fi
+[ -n "$PY" ] || { echo "no python3 found"; exit 2; }
+echo ">> interpreter: $("$PY" --version 2>&1)"
+
+# Glue jobs that ship a unit-test suite, each with a line-coverage FLOOR set one
+# point below the coverage measured when it was introduced, like the lambdas'
+# (see lambdas/run_lambda_tests.sh). Coverage is scoped to job.py and config.py;
+# main.py reads the Glue arguments and runs the job at import, so the suites
+# never import it.
+#
+# TESTED and FLOORS are parallel arrays: FLOORS[i] is the floor for TESTED[i].
+TESTED=(batch-index-taxons)
+FLOORS=(95)
+
+rc=0
+i=0
+for d in "${TESTED[@]}"; do
+  floor="${FLOORS[$i]}"
+  i=$((i + 1))
+  echo ">> testing: $d (coverage floor: ${floor}%)"
+  venv="$(mktemp -d)/v"
+  "$PY" -m venv "$venv"
+  # shellcheck disable=SC1091
+  . "$venv/bin/activate"
+  pip install -q --upgrade pip
+  # the modules job.py imports beyond the standard library; awsglue only exists
+  # inside Glue and config.py runs without it
+  pip install -q boto3 aiobotocore tenacity pytest pytest-mock pytest-cov
+  ( cd "$d" && AWS_DEFAULT_REGION=us-west-2 \
+      python -m pytest test/ -q \
+        --cov=job --cov=config --cov-report=term-missing \
+        --cov-fail-under="$floor" ) || rc=1
+  deactivate
+done
+
+[ "$rc" -eq 0 ] && echo ">> ALL GLUE JOB TESTS PASSED" || echo ">> GLUE JOB TESTS FAILED"
+exit $rc
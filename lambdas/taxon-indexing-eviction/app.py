@@ -70,7 +70,7 @@ def handle_evictions(dry_run=False):
         by_pipeline_candidates,
         by_pipeline_and_background_id_candidates,
     ) = discover_eviction_candidates(
-        [pr["pipeline_run_id"] for pr in pipelines_being_deleted]
+        [pr["pipeline_run_id"] for pr in pipelines_being_deleted], capacity
     )
 
     logger.info("Reporting eviction candidates...")
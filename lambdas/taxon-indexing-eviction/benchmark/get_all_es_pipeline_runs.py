@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare reading every pipeline_run_id of the pipeline_runs index the old way
+(recursive 10k pages of _source, concatenated into one list) with
+es_queries.get_all_es_pipeline_runs (a point in time paged with search_after,
+doc values only, streamed). Start a local OpenSearch first, then run from
+lambdas/taxon-indexing-eviction:
+
+    docker run --rm -d -p 9200:9200 -e discovery.type=single-node \
+        -e DISABLE_SECURITY_PLUGIN=true opensearchproject/opensearch:2.11.1
+    python -m benchmark.get_all_es_pipeline_runs --runs 500000 --backgrounds 2
+
+The pipeline_runs index is re-seeded when it does not have --runs x
+--backgrounds records. Prints a JSON report with the time and the peak traced
+memory of each.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmark import local
+
+
+def recursive_get_all_es_pipeline_runs(search_after=None):
+    """
+    get_all_es_pipeline_runs before it streamed, for comparison
+    """
+    from chalicelib import es_queries
+
+    query = {
+        "size": 10000,
+        "_source": ["pipeline_run_id"],
+        "query": {"match_all": {}},
+        "sort": {"background_id": "asc", "pipeline_run_id": "asc"},
+    }
+    if search_after:
+        query["search_after"] = search_after
+    hits = es_queries.es().search(body=query, index="pipeline_runs")["hits"]["hits"]
+    if hits:
+        return [
+            hit["_source"]["pipeline_run_id"] for hit in hits
+        ] + recursive_get_all_es_pipeline_runs(search_after=hits[-1]["sort"])
+    return []
+
+
+def measure(name, read):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for _ in read():
+        count += 1
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "implementation": name,
+        "pipeline_run_ids": count,
+        "seconds": round(seconds, 2),
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    local.add_arguments(parser)
+    parser.add_argument("--runs", type=int, default=500000)
+    parser.add_argument("--backgrounds", type=int, default=2)
+    args = parser.parse_args()
+    local.configure(args)
+    local.seed_pipeline_runs(args.es_host, args.runs, args.backgrounds)
+
+    from chalicelib import es_queries
+
+    # the recursion is one level per 10k page
+    sys.setrecursionlimit(
+        max(sys.getrecursionlimit(), args.runs * args.backgrounds // 10000 + 1000)
+    )
+    report = {
+        "documents": args.runs * args.backgrounds,
+        "results": [
+            measure("recursive", recursive_get_all_es_pipeline_runs),
+            measure("point_in_time", es_queries.get_all_es_pipeline_runs),
+        ],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
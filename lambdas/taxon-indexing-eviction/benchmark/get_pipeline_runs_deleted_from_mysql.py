@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compare finding the pipeline runs deleted from MySQL the old way (every MySQL id
+fetched at once and every ES id in a list, then a set difference) with
+change_data_detection.get_pipeline_runs_deleted_from_mysql (the two ascending id
+streams merged in lockstep). Start a local OpenSearch and MySQL first, then run
+from lambdas/taxon-indexing-eviction:
+
+    docker run --rm -d -p 9200:9200 -e discovery.type=single-node \
+        -e DISABLE_SECURITY_PLUGIN=true opensearchproject/opensearch:2.11.1
+    docker run --rm -d -p 3306:3306 -e MYSQL_ALLOW_EMPTY_PASSWORD=yes mysql:8.0
+    python -m benchmark.get_pipeline_runs_deleted_from_mysql --runs 500000
+
+Every --deleted-every'th run is only in OpenSearch. Prints a JSON report with the
+time and the peak traced memory of each.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import pymysql
+
+from benchmark import local
+
+
+def set_difference_get_pipeline_runs_deleted_from_mysql():
+    """
+    get_pipeline_runs_deleted_from_mysql before it streamed, for comparison
+    """
+    from chalicelib import es_queries, sql_queries
+
+    with sql_queries.conn().cursor(pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute("""SELECT id FROM pipeline_runs""")
+        sql_pipeline_run_ids = [row["id"] for row in cursor.fetchall()]
+    es_pipeline_run_ids = list(es_queries.get_all_es_pipeline_runs())
+    return list(set(es_pipeline_run_ids) - set(sql_pipeline_run_ids))
+
+
+def measure(name, find):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for _ in find():
+        count += 1
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "implementation": name,
+        "deleted_pipeline_run_ids": count,
+        "seconds": round(seconds, 2),
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    local.add_arguments(parser)
+    parser.add_argument("--runs", type=int, default=500000)
+    parser.add_argument("--backgrounds", type=int, default=1)
+    parser.add_argument("--deleted-every", type=int, default=100)
+    args = parser.parse_args()
+    local.configure(args)
+    local.seed_pipeline_runs(args.es_host, args.runs, args.backgrounds)
+    local.seed_mysql_pipeline_runs(
+        args,
+        (
+            pipeline_run_id
+            for pipeline_run_id in range(1, args.runs + 1)
+            if pipeline_run_id % args.deleted_every
+        ),
+    )
+
+    from chalicelib import change_data_detection
+
+    report = {
+        "pipeline_runs": args.runs,
+        "documents": args.runs * args.backgrounds,
+        "results": [
+            measure(
+                "set_difference", set_difference_get_pipeline_runs_deleted_from_mysql
+            ),
+            measure(
+                "sorted_merge",
+                change_data_detection.get_pipeline_runs_deleted_from_mysql,
+            ),
+        ],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare the pipeline_run_id collections of discover_eviction_candidates: a list
+(how the candidates were kept), a set, and id_sets.PipelineRunIdSet. Needs no
+services; run from lambdas/taxon-indexing-eviction:
+
+    python -m benchmark.id_sets --ids 10000000
+
+For each, the JSON report has the time and peak traced memory to build a
+collection of --ids ids, the time per membership test, and the time and peak
+memory of the difference with a second collection of the same size. A list's
+membership test is a scan, so it is timed over fewer lookups and its
+difference is left out.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from chalicelib.id_sets import PipelineRunIdSet
+
+IMPLEMENTATIONS = {
+    "list": list,
+    "set": set,
+    "pipeline_run_id_set": PipelineRunIdSet,
+}
+
+
+def timed(function):
+    """
+    Return the result of function, how long it took and the peak traced
+    memory it allocated
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def difference(collection, other):
+    if isinstance(collection, PipelineRunIdSet):
+        return collection.difference(other)
+    return collection - other
+
+
+def measure(name, ids, other_ids, lookups):
+    build = IMPLEMENTATIONS[name]
+    collection, build_seconds, build_peak = timed(lambda: build(ids))
+    if name == "list":
+        # a scan per lookup, so fewer of them
+        lookups = lookups[: max(len(lookups) // 1000, 10)]
+    start = time.perf_counter()
+    found = sum(1 for id in lookups if id in collection)
+    lookup_seconds = time.perf_counter() - start
+    result = {
+        "implementation": name,
+        "build_seconds": round(build_seconds, 2),
+        "build_peak_traced_mb": round(build_peak / 1024 / 1024, 1),
+        "lookup_microseconds": round(lookup_seconds / len(lookups) * 1e6, 3),
+        "lookups_found": found,
+    }
+    if name != "list":
+        other = build(other_ids)
+        remaining, seconds, peak = timed(lambda: difference(collection, other))
+        result["difference_seconds"] = round(seconds, 2)
+        result["difference_peak_traced_mb"] = round(peak / 1024 / 1024, 1)
+        result["difference_ids"] = len(remaining)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--ids", type=int, default=10000000)
+    parser.add_argument("--lookups", type=int, default=1000000)
+    parser.add_argument(
+        "--implementations",
+        nargs="+",
+        choices=list(IMPLEMENTATIONS),
+        default=list(IMPLEMENTATIONS),
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # ids are sparse, like pipeline runs left after deletions
+    id_space = args.ids * 2
+    ids = rng.sample(range(id_space), args.ids)
+    other_ids = rng.sample(range(id_space), args.ids)
+    lookups = [rng.randrange(id_space) for _ in range(args.lookups)]
+
+    report = {
+        "ids": args.ids,
+        "results": [
+            measure(name, ids, other_ids, lookups) for name in args.implementations
+        ],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
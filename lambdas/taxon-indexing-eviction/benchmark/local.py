@@ -0,0 +1,120 @@
+"""
+Point the eviction lambda's config at local services for the benchmarks, instead
+of the SSM parameters of a deployed environment.
+"""
+
+import os
+
+import pymysql
+from opensearchpy import OpenSearch
+from opensearchpy.helpers import streaming_bulk
+
+PIPELINE_RUNS_MAPPING = {
+    "properties": {
+        "pipeline_run_id": {"type": "long"},
+        "background_id": {"type": "long"},
+        "created_at": {"type": "date"},
+        "last_read_at": {"type": "date"},
+        "is_complete": {"type": "boolean"},
+    }
+}
+
+INSERT_CHUNK_SIZE = 10000
+
+
+def add_arguments(parser):
+    parser.add_argument("--es-host", default="http://localhost:9200")
+    parser.add_argument("--mysql-host", default="127.0.0.1")
+    parser.add_argument("--mysql-port", default="3306")
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-database", default="taxon_indexing_eviction_benchmark")
+
+
+def configure(args):
+    """
+    Set the environment variables chalicelib.config reads, before it is first used
+    """
+    os.environ.setdefault("DEPLOYMENT_ENVIRONMENT", "benchmark")
+    os.environ["LOCAL_MODE"] = "1"
+    os.environ["ES_HOST"] = args.es_host
+    os.environ["MYSQL_HOST"] = args.mysql_host
+    os.environ["MYSQL_PORT"] = args.mysql_port
+    os.environ["MYSQL_USERNAME"] = args.mysql_user
+    os.environ["MYSQL_PASSWORD"] = ""
+    os.environ["MYSQL_DB"] = args.mysql_database
+
+
+def seed_pipeline_runs(es_host, runs, backgrounds, documents=None):
+    """
+    (Re)create the pipeline_runs index with a record for each of `runs`
+    pipeline runs and `backgrounds` backgrounds, unless it already has exactly
+    that many records. `documents` yields the records instead, if given.
+    """
+    client = OpenSearch(es_host, timeout=300)
+    count = runs * backgrounds
+    if client.indices.exists(index="pipeline_runs"):
+        if client.count(index="pipeline_runs")["count"] == count:
+            return client
+        client.indices.delete(index="pipeline_runs")
+    client.indices.create(
+        index="pipeline_runs",
+        body={
+            "settings": {
+                "number_of_shards": 1,
+                "number_of_replicas": 0,
+                "refresh_interval": -1,
+            },
+            "mappings": PIPELINE_RUNS_MAPPING,
+        },
+    )
+    if documents is None:
+        documents = (
+            {
+                "pipeline_run_id": pipeline_run_id,
+                "background_id": background_id,
+                "created_at": "2020-01-01T00:00:00Z",
+                "is_complete": True,
+            }
+            for pipeline_run_id in range(1, runs + 1)
+            for background_id in range(1, backgrounds + 1)
+        )
+    actions = (
+        {
+            "_index": "pipeline_runs",
+            "_id": f"{document['pipeline_run_id']}_{document['background_id']}",
+            "_source": document,
+        }
+        for document in documents
+    )
+    for ok, item in streaming_bulk(
+        client, actions, chunk_size=10000, raise_on_error=True
+    ):
+        pass
+    client.indices.put_settings(index="pipeline_runs", body={"refresh_interval": "1s"})
+    client.indices.refresh(index="pipeline_runs")
+    return client
+
+
+def seed_mysql_pipeline_runs(args, pipeline_run_ids):
+    """
+    (Re)create the pipeline_runs table of the benchmark database with only an id
+    column, holding `pipeline_run_ids`
+    """
+    conn = pymysql.connect(
+        host=args.mysql_host,
+        port=int(args.mysql_port),
+        user=args.mysql_user,
+        autocommit=True,
+    )
+    with conn.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.mysql_database}`")
+        cursor.execute(f"USE `{args.mysql_database}`")
+        cursor.execute("DROP TABLE IF EXISTS pipeline_runs")
+        cursor.execute("CREATE TABLE pipeline_runs (id BIGINT PRIMARY KEY)")
+        rows = [(pipeline_run_id,) for pipeline_run_id in pipeline_run_ids]
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            end = start + INSERT_CHUNK_SIZE
+            cursor.executemany(
+                "INSERT INTO pipeline_runs (id) VALUES (%s)", rows[start:end]
+            )
+    conn.close()
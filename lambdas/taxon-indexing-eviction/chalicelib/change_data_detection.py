@@ -1,42 +1,132 @@
 # type: ignore
 
 import logging
+from datetime import datetime, timezone
 
-from chalicelib.sql_queries import get_all_mysql_pipeline_run_ids
-from chalicelib.es_queries import get_all_es_pipeline_runs, find_expired_pipeline_runs
+import chalicelib.config as config
+from chalicelib import change_data_state
+from chalicelib.id_sets import PipelineRunIdSet, sorted_difference
+from chalicelib.reporter import report_change_data_detection
+from chalicelib.sql_queries import (
+    get_all_mysql_pipeline_run_ids,
+    get_mysql_pipeline_run_range_checksums,
+)
+from chalicelib.es_queries import (
+    get_all_es_pipeline_runs,
+    get_es_pipeline_run_range_checksums,
+    find_expired_pipeline_runs,
+)
 
 logger = logging.getLogger()
 
+# batches of expired runs held back waiting to fill up, at most
+MAX_PENDING_BATCHES = 10
+
 
 def get_pipeline_runs_deleted_from_mysql():
     """
-    Return a list of pipeline_run_ids that are in ES but have been deleted from MySQL
+    Yield the pipeline_run_ids that are in ES but have been deleted from MySQL,
+    in ascending order, as the two sorted id streams are merged. With
+    CHANGE_DATA_STATE_S3_URI set, only the id ranges that changed since the
+    last run are compared.
     """
+    state_uri = config.get_parameters()["CHANGE_DATA_STATE_S3_URI"]
+    if state_uri:
+        yield from get_pipeline_runs_deleted_from_mysql_incrementally(state_uri)
+        return
+
+    report_change_data_detection({"scan": "full"})
+    yield from sorted_difference(
+        get_all_es_pipeline_runs(), get_all_mysql_pipeline_run_ids()
+    )
 
-    sql_pipeline_run_ids = get_all_mysql_pipeline_run_ids()
-    es_pipeline_run_ids = get_all_es_pipeline_runs()
 
-    deleted_pipeline_run_ids = list(
-        set(es_pipeline_run_ids) - set(sql_pipeline_run_ids)
+def get_pipeline_runs_deleted_from_mysql_incrementally(state_uri):
+    """
+    Like get_pipeline_runs_deleted_from_mysql, but only compare the id ranges
+    whose checksums changed since the state at state_uri was written, unless a
+    full scan is due. The state is written once every id has been yielded.
+    """
+    range_size = change_data_state.RANGE_SIZE
+    state = change_data_state.read_state(state_uri)
+    now = datetime.now(timezone.utc)
+    # checksums are taken before the ids are read, so a change made while they
+    # are read is compared again next run
+    ranges = change_data_state.range_checksums(
+        get_mysql_pipeline_run_range_checksums(range_size),
+        get_es_pipeline_run_range_checksums(range_size),
     )
 
-    return deleted_pipeline_run_ids
+    id_spans = None
+    full_scan_at = now
+    interval = config.get_parameters()["FULL_SCAN_INTERVAL_IN_HOURS"]
+    if not change_data_state.full_scan_due(state, now, interval):
+        changed_id_spans = change_data_state.changed_id_spans(state, ranges)
+        if len(changed_id_spans) <= change_data_state.MAX_CHANGED_SPANS:
+            id_spans = changed_id_spans
+            full_scan_at = datetime.fromisoformat(state["full_scan_at"])
 
+    if id_spans is None:
+        report_change_data_detection({"scan": "full", "ranges": len(ranges)})
+    else:
+        report_change_data_detection(
+            {
+                "scan": "incremental",
+                "ranges": len(ranges),
+                "changed_ids": sum(end - start for start, end in id_spans),
+                "changed_id_spans": len(id_spans),
+            }
+        )
 
-def get_expired_pipeline_runs_by_background_id(pipelines_to_exclude):
+    dirty_ranges = set()
+    for pipeline_run_id in sorted_difference(
+        get_all_es_pipeline_runs(id_spans), get_all_mysql_pipeline_run_ids(id_spans)
+    ):
+        dirty_ranges.add(pipeline_run_id // range_size)
+        yield pipeline_run_id
+
+    # leave out the ranges that still have deleted runs, so that they are
+    # compared again until the runs are evicted
+    change_data_state.write_state(
+        state_uri,
+        {
+            id_range: checksums
+            for id_range, checksums in ranges.items()
+            if id_range not in dirty_ranges
+        },
+        full_scan_at,
+    )
+
+
+def get_expired_pipeline_run_batches(
+    pipelines_to_exclude, batch_size, max_pending_batches=MAX_PENDING_BATCHES
+):
     """
-    Return a dict of background_id to pipeline_run_ids for pipeline runs that have expired
+    Yield (background_id, pipeline_run_ids) batches of at most batch_size
+    expired pipeline runs, roughly the least recently read first. Expired runs
+    are read as the batches are taken. A batch is yielded once it is full, or
+    when more than max_pending_batches batches' worth of runs are waiting, in
+    which case the batch with the oldest run goes first. The rest are yielded
+    once every expired run has been read.
     """
+    pipelines_to_exclude = PipelineRunIdSet(pipelines_to_exclude)
 
-    expired_pipeline_runs = find_expired_pipeline_runs()
-
-    pipeline_runs_by_background_id = {}
-    for pipeline_run in expired_pipeline_runs:
-        if pipeline_run["pipeline_run_id"] not in pipelines_to_exclude:
-            background_id = pipeline_run["background_id"]
-            pipeline_runs_with_background_id = (
-                pipeline_runs_by_background_id.setdefault(background_id, [])
-            )
-            pipeline_runs_with_background_id.append(pipeline_run["pipeline_run_id"])
+    # background_id to its runs not yet yielded, in order of their oldest run
+    pending = {}
+    pending_count = 0
+    for pipeline_run in find_expired_pipeline_runs():
+        if pipeline_run["pipeline_run_id"] in pipelines_to_exclude:
+            continue
+        background_id = pipeline_run["background_id"]
+        batch = pending.setdefault(background_id, [])
+        batch.append(pipeline_run["pipeline_run_id"])
+        pending_count += 1
+        if len(batch) >= batch_size:
+            pending_count -= len(batch)
+            yield background_id, pending.pop(background_id)
+        elif pending_count > batch_size * max_pending_batches:
+            background_id = next(iter(pending))
+            pending_count -= len(pending[background_id])
+            yield background_id, pending.pop(background_id)
 
-    return pipeline_runs_by_background_id
+    yield from pending.items()
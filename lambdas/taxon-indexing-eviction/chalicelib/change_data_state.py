@@ -0,0 +1,123 @@
+# type: ignore
+
+"""
+State kept between eviction runs so that deleted pipeline runs can be found
+without comparing every id in MySQL with every id in ES.
+
+The pipeline_run_id space is split into ranges of RANGE_SIZE ids. For each range
+the state has a checksum of the MySQL ids and of the ES records in it, as of the
+last run. A run compares only the ranges whose checksums changed since. Ranges
+that still had deleted runs in ES are left out of the state, so they are compared
+again until the runs are evicted. A full scan still runs every
+FULL_SCAN_INTERVAL_IN_HOURS, to catch anything the checksums cannot see.
+"""
+
+import functools
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+STATE_VERSION = 1
+# pipeline_run_ids per range
+RANGE_SIZE = 10000
+# when more spans of consecutive ranges changed, a full scan is about as cheap
+MAX_CHANGED_SPANS = 500
+
+
+@functools.lru_cache(maxsize=None)
+def s3():
+    return boto3.client("s3")
+
+
+def _bucket_and_key(uri):
+    parsed = urlparse(uri)
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+def read_state(uri):
+    """
+    Return the state last written to uri, or None when there is none or it
+    cannot be used
+    """
+    bucket, key = _bucket_and_key(uri)
+    try:
+        body = s3().get_object(Bucket=bucket, Key=key)["Body"].read()
+        state = json.loads(gzip.decompress(body))
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] != "NoSuchKey":
+            logger.warning("Could not read %s: %s", uri, ex)
+        return None
+    except (OSError, ValueError) as ex:
+        logger.warning("Could not parse %s: %s", uri, ex)
+        return None
+
+    if state.get("version") != STATE_VERSION or state.get("range_size") != RANGE_SIZE:
+        return None
+    return state
+
+
+def write_state(uri, ranges, full_scan_at):
+    """
+    Write the checksums of the reconciled ranges and the time of the last full
+    scan to uri. If it cannot be written, the next run compares more ranges.
+    """
+    state = {
+        "version": STATE_VERSION,
+        "range_size": RANGE_SIZE,
+        "full_scan_at": full_scan_at.isoformat(),
+        "ranges": {str(id_range): checksums for id_range, checksums in ranges.items()},
+    }
+    bucket, key = _bucket_and_key(uri)
+    try:
+        s3().put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=gzip.compress(json.dumps(state, separators=(",", ":")).encode()),
+            ContentType="application/json",
+            ContentEncoding="gzip",
+        )
+    except ClientError as ex:
+        logger.warning("Could not write %s: %s", uri, ex)
+
+
+def range_checksums(mysql_checksums, es_checksums):
+    """
+    Combine the per-range checksums of MySQL and ES into
+    {range: [mysql count, mysql checksum, es count, es checksum]}
+    """
+    return {
+        id_range: mysql_checksums.get(id_range, [0, 0])
+        + es_checksums.get(id_range, [0, 0])
+        for id_range in mysql_checksums.keys() | es_checksums.keys()
+    }
+
+
+def full_scan_due(state, now, interval_in_hours):
+    return state is None or now - datetime.fromisoformat(
+        state["full_scan_at"]
+    ) >= timedelta(hours=interval_in_hours)
+
+
+def changed_id_spans(state, ranges):
+    """
+    Return the [start, end) pipeline_run_id spans of consecutive ranges whose
+    checksums are not the ones in state. A range that is now empty on both
+    sides has nothing to compare.
+    """
+    spans = []
+    for id_range in sorted(ranges):
+        if state["ranges"].get(str(id_range)) == ranges[id_range]:
+            continue
+        start = id_range * RANGE_SIZE
+        if spans and spans[-1][1] == start:
+            spans[-1][1] = start + RANGE_SIZE
+        else:
+            spans.append([start, start + RANGE_SIZE])
+    return spans
@@ -47,6 +47,10 @@ expected_parameters = {
     "PIPELINE_RUNS_PER_TASK": {"type": "int", "secret": False, "default": 500},
     "PIPELINE_RUN_TTL_IN_DAYS": {"type": "int", "secret": False, "default": 30},
     "DRY_RUN": {"type": "bool", "secret": False, "default": False},
+    # e.g. s3://bucket/taxon-indexing-eviction/change_data_state.json.gz; when
+    # set, deleted pipeline runs are found incrementally (see change_data_state)
+    "CHANGE_DATA_STATE_S3_URI": {"type": "str", "secret": False, "default": None},
+    "FULL_SCAN_INTERVAL_IN_HOURS": {"type": "int", "secret": False, "default": 168},
 }
 
 
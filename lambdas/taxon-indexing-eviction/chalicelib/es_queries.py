@@ -9,6 +9,11 @@ from opensearchpy import OpenSearch, NotFoundError
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# hits per page of search_all
+PAGE_SIZE = 10000
+# how long a point in time is kept between two pages
+PIT_KEEP_ALIVE = "5m"
+
 
 @functools.lru_cache(maxsize=None)
 def es():
@@ -247,35 +252,109 @@ def bulk_delete_pipeline_runs(pipeline_runs):
     return response
 
 
-def get_all_es_pipeline_runs(search_after=None):
+def search_all(index, query, page_size=PAGE_SIZE):
+    """
+    Yield every hit of a query, page by page, from a point in time of the
+    index so that the pages are consistent with each other. The query's sort
+    must be unique per document for search_after to page through it.
+    """
+    pit = {
+        "id": es().create_pit(index=index, keep_alive=PIT_KEEP_ALIVE)["pit_id"],
+        "keep_alive": PIT_KEEP_ALIVE,
+    }
+    body = {**query, "size": page_size, "pit": pit, "track_total_hits": False}
+    try:
+        while True:
+            response = es().search(body=body)
+            hits = response["hits"]["hits"]
+            yield from hits
+            if len(hits) < page_size:
+                return
+            # the id may change between pages
+            pit["id"] = response.get("pit_id", pit["id"])
+            body["search_after"] = hits[-1]["sort"]
+    finally:
+        try:
+            es().delete_pit(body={"pit_id": [pit["id"]]})
+        except Exception as ex:
+            # it expires after PIT_KEEP_ALIVE anyway
+            logger.warning("Could not delete point in time: %s", ex)
+
+
+def get_all_es_pipeline_runs(id_ranges=None):
     """
-    Get all of the pipeline_runs from ES
+    Yield the distinct pipeline_run_ids of the pipeline_runs index in
+    ascending order. Only one page of hits is held at a time, and they are read
+    from doc values rather than _source. With id_ranges, only the ids in those
+    [start, end) ranges.
     """
     query = {
-        "size": 10000,
-        "_source": ["pipeline_run_id"],
+        "_source": False,
+        "docvalue_fields": ["pipeline_run_id"],
         "query": {"match_all": {}},
-        "sort": {"background_id": "asc", "pipeline_run_id": "asc"},
+        # a pipeline run has a record per background, background_id makes the
+        # sort unique
+        "sort": [{"pipeline_run_id": "asc"}, {"background_id": "asc"}],
     }
+    if id_ranges is not None:
+        if not id_ranges:
+            return
+        query["query"] = {
+            "bool": {
+                "should": [
+                    {"range": {"pipeline_run_id": {"gte": start, "lt": end}}}
+                    for start, end in id_ranges
+                ],
+                "minimum_should_match": 1,
+            }
+        }
 
-    if search_after:
-        query["search_after"] = search_after
+    previous = None
+    for hit in search_all("pipeline_runs", query):
+        pipeline_run_id = hit["fields"]["pipeline_run_id"][0]
+        if pipeline_run_id != previous:
+            yield pipeline_run_id
+            previous = pipeline_run_id
 
-    response = es().search(body=query, index="pipeline_runs")
 
-    hits = response["hits"]["hits"]
-    if hits:
-        return [
-            hit["_source"]["pipeline_run_id"] for hit in hits
-        ] + get_all_es_pipeline_runs(search_after=hits[-1]["sort"])
+def get_es_pipeline_run_range_checksums(range_size):
+    """
+    Return {range: [count, checksum]} of the pipeline_runs records in each range
+    of range_size pipeline_run_ids (range = pipeline_run_id // range_size) that
+    has any: the number of records and the sum of their pipeline_run_ids.
+    """
+    query = {
+        "size": 0,
+        "aggs": {
+            "id_ranges": {
+                # one bucket per range, so at most search.max_buckets ranges
+                "histogram": {
+                    "field": "pipeline_run_id",
+                    "interval": range_size,
+                    "min_doc_count": 1,
+                },
+                "aggs": {"id_sum": {"sum": {"field": "pipeline_run_id"}}},
+            }
+        },
+    }
 
-    return []
+    response = es().search(body=query, index="pipeline_runs")
+    return {
+        int(bucket["key"])
+        // range_size: [
+            bucket["doc_count"],
+            int(bucket["id_sum"]["value"]),
+        ]
+        for bucket in response["aggregations"]["id_ranges"]["buckets"]
+    }
 
 
 def find_expired_pipeline_runs():
     """
-    Find all of the pipeline_run records that have expired and
-    return their pipeline_run_ids and background_ids
+    Yield the pipeline_run_id and background_id of every pipeline_run record
+    that has expired, the least recently read first: the ones never read by
+    created_at, then the others by last_read_at. Records are read a page at a
+    time, as they are needed.
     """
     # either it was last read a year ago
     # or it was created a year ago and never read
@@ -283,7 +362,6 @@ def find_expired_pipeline_runs():
 
     query = {
         "_source": ["pipeline_run_id", "background_id"],
-        "size": 10000,
         "query": {
             "bool": {
                 "should": [
@@ -299,7 +377,14 @@ def find_expired_pipeline_runs():
                 ]
             }
         },
+        # pipeline_run_id and background_id make the sort unique
+        "sort": [
+            {"last_read_at": {"order": "asc", "missing": "_first"}},
+            {"created_at": "asc"},
+            {"pipeline_run_id": "asc"},
+            {"background_id": "asc"},
+        ],
     }
 
-    response = es().search(body=query, index="pipeline_runs")
-    return [hit["_source"] for hit in response["hits"]["hits"]]
+    for hit in search_all("pipeline_runs", query):
+        yield hit["_source"]
@@ -0,0 +1,118 @@
+# type: ignore
+
+import numpy as np
+
+
+def sorted_difference(ids, excluded_ids):
+    """
+    Yield the ids that are not in excluded_ids, walking both in lockstep. Both
+    must be ascending and distinct; neither is held in memory.
+    """
+    excluded_ids = iter(excluded_ids)
+    excluded_id = next(excluded_ids, None)
+    for id in ids:
+        while excluded_id is not None and excluded_id < id:
+            excluded_id = next(excluded_ids, None)
+        if excluded_id != id:
+            yield id
+
+
+def _sorted_unique(ids):
+    """
+    Sort an int64 array in place and return it without repeated ids
+    """
+    ids.sort()
+    repeated = ids[1:] == ids[:-1]
+    if repeated.any():
+        return np.delete(ids, np.flatnonzero(repeated) + 1)
+    return ids
+
+
+class PipelineRunIdSet:
+    """
+    An immutable set of integer pipeline_run_ids, kept as a sorted NumPy array
+    of 64-bit integers: 8 bytes per id, where a set of ints takes about 60.
+    Membership is a binary search, and union and difference are vectorized.
+    """
+
+    __slots__ = ("ids",)
+
+    # ids looked up at a time by isin, which bounds its temporary arrays
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, ids=()):
+        if isinstance(ids, PipelineRunIdSet):
+            self.ids = ids.ids
+        elif isinstance(ids, (list, tuple)):
+            self.ids = _sorted_unique(np.array(ids, dtype=np.int64))
+        else:
+            self.ids = _sorted_unique(np.fromiter(ids, dtype=np.int64))
+
+    @classmethod
+    def from_sorted(cls, ids):
+        """
+        Build a set from strictly ascending ids without sorting them
+        """
+        id_set = cls.__new__(cls)
+        id_set.ids = np.fromiter(ids, dtype=np.int64)
+        if not np.all(id_set.ids[1:] > id_set.ids[:-1]):
+            raise ValueError("pipeline_run_ids are not strictly ascending")
+        return id_set
+
+    @classmethod
+    def _of(cls, ids):
+        id_set = cls.__new__(cls)
+        id_set.ids = ids
+        return id_set
+
+    def __contains__(self, id):
+        i = np.searchsorted(self.ids, id)
+        return bool(i < len(self.ids) and self.ids[i] == id)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return isinstance(other, PipelineRunIdSet) and np.array_equal(
+            self.ids, other.ids
+        )
+
+    def __repr__(self):
+        return f"PipelineRunIdSet({self.tolist()})"
+
+    def tolist(self):
+        """
+        Return the ids as a list of ints, e.g. for the JSON report
+        """
+        return self.ids.tolist()
+
+    def isin(self, ids):
+        """
+        Return a boolean array of whether each of an int64 array of ids is in
+        the set
+        """
+        found = np.zeros(len(ids), dtype=bool)
+        if not len(self.ids):
+            return found
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            end = start + self.CHUNK_SIZE
+            positions = np.searchsorted(self.ids, ids[start:end])
+            np.minimum(positions, len(self.ids) - 1, out=positions)
+            found[start:end] = self.ids[positions] == ids[start:end]
+        return found
+
+    def union(self, other):
+        other = PipelineRunIdSet(other)
+        return PipelineRunIdSet._of(
+            _sorted_unique(np.concatenate([self.ids, other.ids]))
+        )
+
+    def difference(self, other):
+        return PipelineRunIdSet._of(self.ids[~PipelineRunIdSet(other).isin(self.ids)])
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes
@@ -92,6 +92,13 @@ def report_capacity(capacity):
     _final_report["capacity"] = capacity
 
 
+def report_change_data_detection(detection_report):
+    """Report how pipeline runs deleted from MySQL are being found"""
+    logger.info("Change data detection: %s", detection_report)
+
+    _final_report["change_data_detection"] = detection_report
+
+
 def report_eviction_candidates(
     by_pipeline_candidates, by_pipeline_and_background_id_candidates
 ):
@@ -7,6 +7,9 @@ import pymysql
 
 from chalicelib import config
 
+# ids read from the server per query
+FETCH_SIZE = 10000
+
 
 @functools.lru_cache(maxsize=None)
 def conn():
@@ -34,7 +37,61 @@ def conn():
         )
 
 
-def get_all_mysql_pipeline_run_ids():
-    with conn().cursor(pymysql.cursors.SSDictCursor) as cursor:
-        cursor.execute("""SELECT id FROM pipeline_runs""")
-        return [row["id"] for row in cursor.fetchall()]
+def id_range_filter(column, id_ranges):
+    """
+    Return a WHERE clause and its args limiting column to the [start, end)
+    id_ranges
+    """
+    clause = " OR ".join([f"({column} >= %s AND {column} < %s)"] * len(id_ranges))
+    return clause, [bound for id_range in id_ranges for bound in id_range]
+
+
+def get_all_mysql_pipeline_run_ids(id_ranges=None):
+    """
+    Yield every pipeline_runs.id in ascending order, read FETCH_SIZE ids at a
+    time with a query per batch that starts after the last id read. No cursor
+    stays open between batches, so the ids can be consumed slowly (e.g. merged
+    against ES pages) without holding a result stream open on the server. With
+    id_ranges, only the ids in those [start, end) ranges.
+    """
+    sql = """SELECT id FROM pipeline_runs WHERE id > %s"""
+    args = []
+    if id_ranges is not None:
+        if not id_ranges:
+            return
+        where, args = id_range_filter("id", id_ranges)
+        sql += f" AND ({where})"
+    # the primary key order, so MySQL does not have to sort
+    sql += " ORDER BY id LIMIT %s"
+    last_id = -1
+    while True:
+        with conn().cursor() as cursor:
+            cursor.execute(sql, [last_id, *args, FETCH_SIZE])
+            rows = cursor.fetchall()
+        for (pipeline_run_id,) in rows:
+            yield pipeline_run_id
+        if len(rows) < FETCH_SIZE:
+            return
+        last_id = rows[-1][0]
+
+
+def get_mysql_pipeline_run_range_checksums(range_size):
+    """
+    Return {range: [count, checksum]} of the pipeline_runs ids in each range of
+    range_size ids (range = id // range_size) that has any. The checksum is the
+    XOR of the CRC32 of the ids, so it changes when an id is added or removed.
+    MySQL aggregates the primary key index; only a row per range is sent back.
+    """
+    with conn().cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id DIV %s AS id_range, COUNT(*), BIT_XOR(CRC32(id))
+            FROM pipeline_runs
+            GROUP BY id_range
+            """,
+            (range_size,),
+        )
+        return {
+            int(id_range): [int(count), int(checksum)]
+            for id_range, count, checksum in cursor.fetchall()
+        }
@@ -1,6 +1,9 @@
 # type: ignore
 
+import itertools
 import logging
+import math
+from contextlib import closing
 
 from chalicelib.config import get_parameters
 from chalicelib.es_queries import (
@@ -16,8 +19,9 @@ from chalicelib.es_queries import (
 )
 from chalicelib.change_data_detection import (
     get_pipeline_runs_deleted_from_mysql,
-    get_expired_pipeline_runs_by_background_id,
+    get_expired_pipeline_run_batches,
 )
+from chalicelib.id_sets import PipelineRunIdSet, sorted_difference
 from chalicelib.reporter import (
     report_task_statuses,
     report_task_cleanup,
@@ -216,31 +220,49 @@ def check_capacity(running_task_count):
     return max(get_parameters()["EVICTION_TASK_CONCURRENCY"] - running_task_count, 0)
 
 
-def discover_eviction_candidates(pipelines_being_deleted):
+def discover_eviction_candidates(pipelines_being_deleted, capacity):
     """
     Given the list of pipelines currently being deleted by an ES task,
     return a tuple of pipelines that need to be deleted by pipeline_run_id
     and pipelines that need to be deleted by pipeline_run_id and background_id.
     Filter out pipelines that are already being deleted before returning.
+    Expired pipelines are read, the least recently read first, only until they
+    fill the tasks that capacity leaves after the deleted pipelines' tasks.
     """
 
     logger.info("Getting pipeline runs deleted from MySQL...")
 
-    deleted_pipeline_run_ids = [
-        pr
-        for pr in get_pipeline_runs_deleted_from_mysql()
-        if pr not in pipelines_being_deleted
-    ]
+    pipelines_being_deleted = PipelineRunIdSet(pipelines_being_deleted)
+    # get_pipeline_runs_deleted_from_mysql yields ascending ids
+    deleted_pipeline_run_ids = PipelineRunIdSet.from_sorted(
+        sorted_difference(
+            get_pipeline_runs_deleted_from_mysql(), pipelines_being_deleted
+        )
+    )
 
     # if an expired pipeline_run is already going to be deleted by a
     # deleted_pipeline_run_ids eviciton job, we don't need to start an expired eviction
     # task for it
     logger.info("Getting expired pipeline runs by background_id...")
-    expired_pipeline_run_ids = get_expired_pipeline_runs_by_background_id(
-        pipelines_being_deleted + deleted_pipeline_run_ids
+    runs_per_task = get_parameters()["PIPELINE_RUNS_PER_TASK"]
+    # evict_by_pipeline_run_ids starts the deleted pipelines' tasks first
+    expired_capacity = max(
+        capacity - math.ceil(len(deleted_pipeline_run_ids) / runs_per_task), 0
     )
+    expired_pipeline_run_ids = {}
+    with closing(
+        get_expired_pipeline_run_batches(
+            pipelines_being_deleted.union(deleted_pipeline_run_ids), runs_per_task
+        )
+    ) as expired_batches:
+        for background_id, pipeline_run_ids in itertools.islice(
+            expired_batches, expired_capacity
+        ):
+            expired_pipeline_run_ids.setdefault(background_id, []).extend(
+                pipeline_run_ids
+            )
 
-    return (deleted_pipeline_run_ids, expired_pipeline_run_ids)
+    return (deleted_pipeline_run_ids.tolist(), expired_pipeline_run_ids)
 
 
 def evict_by_pipeline_run_ids(pipeline_run_ids, remaining_capacity):
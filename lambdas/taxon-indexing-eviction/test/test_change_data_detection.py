@@ -1,6 +1,20 @@
 # type: ignore
 
-from chalicelib import change_data_detection
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from chalicelib import change_data_detection, change_data_state
+
+
+@pytest.fixture(autouse=True)
+def parameters(mocker):
+    parameters = {"CHANGE_DATA_STATE_S3_URI": None, "FULL_SCAN_INTERVAL_IN_HOURS": 24}
+    mocker.patch.object(
+        change_data_detection.config, "get_parameters", return_value=parameters
+    )
+    mocker.patch.object(change_data_detection, "report_change_data_detection")
+    return parameters
 
 
 class TestGetPipelineRunsDeletedFromMysql:
@@ -16,7 +30,7 @@ class TestGetPipelineRunsDeletedFromMysql:
             return_value=["pipeline_run_id_1", "pipeline_run_id_2"],
         )
 
-        result = change_data_detection.get_pipeline_runs_deleted_from_mysql()
+        result = list(change_data_detection.get_pipeline_runs_deleted_from_mysql())
 
         assert result == ["pipeline_run_id_2"]
 
@@ -32,81 +46,206 @@ class TestGetPipelineRunsDeletedFromMysql:
             return_value=["pipeline_run_id_1", "pipeline_run_id_2"],
         )
 
-        result = change_data_detection.get_pipeline_runs_deleted_from_mysql()
+        result = list(change_data_detection.get_pipeline_runs_deleted_from_mysql())
+
+        assert result == []
+
+    def test_deleted_ids_interleaved(self, mocker):
+        mocker.patch.object(
+            change_data_detection,
+            "get_all_mysql_pipeline_run_ids",
+            return_value=iter([2, 3, 5, 8]),
+        )
+        mocker.patch.object(
+            change_data_detection,
+            "get_all_es_pipeline_runs",
+            return_value=iter([1, 2, 4, 5, 9, 10]),
+        )
+
+        result = list(change_data_detection.get_pipeline_runs_deleted_from_mysql())
+
+        assert result == [1, 4, 9, 10]
+
+
+class TestGetPipelineRunsDeletedFromMysqlIncrementally:
+    @pytest.fixture(autouse=True)
+    def state(self, mocker, parameters):
+        parameters["CHANGE_DATA_STATE_S3_URI"] = "s3://bucket/state.json.gz"
+        mocker.patch.object(change_data_state, "RANGE_SIZE", 10)
+        mocker.patch.object(
+            change_data_detection,
+            "get_mysql_pipeline_run_range_checksums",
+            return_value={0: [2, 7], 1: [1, 5]},
+        )
+        mocker.patch.object(
+            change_data_detection,
+            "get_es_pipeline_run_range_checksums",
+            return_value={0: [2, 3], 1: [4, 44], 2: [1, 25]},
+        )
+        self.write_state = mocker.patch.object(change_data_state, "write_state")
+        self.mysql_ids = mocker.patch.object(
+            change_data_detection,
+            "get_all_mysql_pipeline_run_ids",
+            return_value=iter([1, 2, 11]),
+        )
+        self.es_ids = mocker.patch.object(
+            change_data_detection,
+            "get_all_es_pipeline_runs",
+            return_value=iter([1, 2, 11, 12, 25]),
+        )
+        return mocker.patch.object(change_data_state, "read_state")
+
+    def test_full_scan_without_state(self, state):
+        state.return_value = None
+
+        result = list(change_data_detection.get_pipeline_runs_deleted_from_mysql())
+
+        assert result == [12, 25]
+        self.es_ids.assert_called_once_with(None)
+        self.mysql_ids.assert_called_once_with(None)
+        uri, ranges, full_scan_at = self.write_state.call_args.args
+        assert uri == "s3://bucket/state.json.gz"
+        # the ranges with deleted runs are compared again next time
+        assert ranges == {0: [2, 7, 2, 3]}
+        assert datetime.now(timezone.utc) - full_scan_at < timedelta(minutes=1)
+
+    def test_compares_changed_ranges(self, state):
+        full_scan_at = datetime.now(timezone.utc) - timedelta(hours=1)
+        state.return_value = {
+            "full_scan_at": full_scan_at.isoformat(),
+            "ranges": {"0": [2, 7, 2, 3], "1": [1, 5, 3, 33]},
+        }
+        self.es_ids.return_value = iter([12, 25])
+        self.mysql_ids.return_value = iter([11])
+
+        result = list(change_data_detection.get_pipeline_runs_deleted_from_mysql())
+
+        assert result == [12, 25]
+        self.es_ids.assert_called_once_with([[10, 30]])
+        self.mysql_ids.assert_called_once_with([[10, 30]])
+        assert self.write_state.call_args.args[1:] == (
+            {0: [2, 7, 2, 3]},
+            full_scan_at,
+        )
+
+    def test_full_scan_when_due(self, state):
+        state.return_value = {
+            "full_scan_at": (
+                datetime.now(timezone.utc) - timedelta(hours=25)
+            ).isoformat(),
+            "ranges": {"0": [2, 7, 2, 3], "1": [1, 5, 4, 44], "2": [0, 0, 1, 25]},
+        }
+
+        result = list(change_data_detection.get_pipeline_runs_deleted_from_mysql())
+
+        assert result == [12, 25]
+        self.es_ids.assert_called_once_with(None)
+
+    def test_nothing_changed(self, state):
+        state.return_value = {
+            "full_scan_at": datetime.now(timezone.utc).isoformat(),
+            "ranges": {"0": [2, 7, 2, 3], "1": [1, 5, 4, 44], "2": [0, 0, 1, 25]},
+        }
+        self.es_ids.return_value = iter([])
+        self.mysql_ids.return_value = iter([])
+
+        result = list(change_data_detection.get_pipeline_runs_deleted_from_mysql())
 
         assert result == []
+        self.es_ids.assert_called_once_with([])
+        assert len(self.write_state.call_args.args[1]) == 3
+
+
+def expired_run(pipeline_run_id, background_id):
+    return {"pipeline_run_id": pipeline_run_id, "background_id": background_id}
 
 
-class TestGetExpiredPipelinesByBackgroundId:
+class TestGetExpiredPipelineRunBatches:
     def test_no_expired_pipelines(self, mocker):
         mocker.patch.object(
-            change_data_detection, "find_expired_pipeline_runs", return_value=[]
+            change_data_detection, "find_expired_pipeline_runs", return_value=iter([])
         )
 
-        result = change_data_detection.get_expired_pipeline_runs_by_background_id([])
+        result = change_data_detection.get_expired_pipeline_run_batches([], 2)
 
-        assert result == {}
+        assert list(result) == []
 
-    def test_multiple_same_background(self, mocker):
+    def test_batches_by_background(self, mocker):
         mocker.patch.object(
             change_data_detection,
             "find_expired_pipeline_runs",
-            return_value=[
-                {
-                    "pipeline_run_id": "pipeline_run_id_1",
-                    "background_id": "background_id_1",
-                },
-                {
-                    "pipeline_run_id": "pipeline_run_id_2",
-                    "background_id": "background_id_1",
-                },
-            ],
+            return_value=iter(
+                [
+                    expired_run(1, "background_id_1"),
+                    expired_run(2, "background_id_2"),
+                    expired_run(3, "background_id_2"),
+                    expired_run(4, "background_id_1"),
+                    expired_run(5, "background_id_1"),
+                ]
+            ),
         )
 
-        result = change_data_detection.get_expired_pipeline_runs_by_background_id([])
+        result = change_data_detection.get_expired_pipeline_run_batches([], 2)
 
-        assert result == {"background_id_1": ["pipeline_run_id_1", "pipeline_run_id_2"]}
+        assert list(result) == [
+            ("background_id_2", [2, 3]),
+            ("background_id_1", [1, 4]),
+            ("background_id_1", [5]),
+        ]
 
     def test_exclude_pipelines_being_deleted(self, mocker):
         mocker.patch.object(
             change_data_detection,
             "find_expired_pipeline_runs",
-            return_value=[
-                {
-                    "pipeline_run_id": "pipeline_run_id_1",
-                    "background_id": "background_id_1",
-                },
-                {
-                    "pipeline_run_id": "pipeline_run_id_2",
-                    "background_id": "background_id_2",
-                },
-            ],
+            return_value=iter(
+                [
+                    expired_run(1, "background_id_1"),
+                    expired_run(2, "background_id_2"),
+                    expired_run(3, "background_id_1"),
+                ]
+            ),
         )
 
-        result = change_data_detection.get_expired_pipeline_runs_by_background_id(
-            ["pipeline_run_id_2"]
-        )
+        result = change_data_detection.get_expired_pipeline_run_batches([2], 500)
 
-        assert result == {"background_id_1": ["pipeline_run_id_1"]}
+        assert list(result) == [("background_id_1", [1, 3])]
 
-    def test_exclude_pipelines_being_deleted_single_background(self, mocker):
+    def test_yields_oldest_batch_when_too_many_are_pending(self, mocker):
         mocker.patch.object(
             change_data_detection,
             "find_expired_pipeline_runs",
-            return_value=[
-                {
-                    "pipeline_run_id": "pipeline_run_id_1",
-                    "background_id": "background_id_1",
-                },
-                {
-                    "pipeline_run_id": "pipeline_run_id_2",
-                    "background_id": "background_id_1",
-                },
-            ],
+            return_value=iter(
+                [
+                    expired_run(1, "background_id_1"),
+                    expired_run(2, "background_id_2"),
+                    expired_run(3, "background_id_3"),
+                    expired_run(4, "background_id_2"),
+                ]
+            ),
+        )
+
+        result = change_data_detection.get_expired_pipeline_run_batches(
+            [], 3, max_pending_batches=1
         )
 
-        result = change_data_detection.get_expired_pipeline_runs_by_background_id(
-            ["pipeline_run_id_2"]
+        assert list(result) == [
+            ("background_id_1", [1]),
+            ("background_id_2", [2, 4]),
+            ("background_id_3", [3]),
+        ]
+
+    def test_reads_expired_runs_as_batches_are_taken(self, mocker):
+        def expired_runs():
+            yield expired_run(1, "background_id_1")
+            yield expired_run(2, "background_id_1")
+            raise AssertionError("read past the first batch")
+
+        mocker.patch.object(
+            change_data_detection,
+            "find_expired_pipeline_runs",
+            return_value=expired_runs(),
         )
 
-        assert result == {"background_id_1": ["pipeline_run_id_1"]}
+        result = change_data_detection.get_expired_pipeline_run_batches([], 2)
+
+        assert next(result) == ("background_id_1", [1, 2])
@@ -0,0 +1,95 @@
+# type: ignore
+
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+from chalicelib import change_data_state
+
+
+def object_body(data):
+    class Body:
+        def read(self):
+            return data
+
+    return Body()
+
+
+@pytest.fixture
+def s3(mocker):
+    client = mocker.MagicMock()
+    mocker.patch.object(change_data_state, "s3", return_value=client)
+    return client
+
+
+class TestReadState:
+    def test_round_trip(self, s3):
+        full_scan_at = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        change_data_state.write_state(
+            "s3://bucket/eviction/state.json.gz", {3: [1, 2, 3, 4]}, full_scan_at
+        )
+        put = s3.put_object.call_args.kwargs
+        assert (put["Bucket"], put["Key"]) == ("bucket", "eviction/state.json.gz")
+        s3.get_object.return_value = {"Body": object_body(put["Body"])}
+
+        state = change_data_state.read_state("s3://bucket/eviction/state.json.gz")
+
+        assert state["ranges"] == {"3": [1, 2, 3, 4]}
+        assert datetime.fromisoformat(state["full_scan_at"]) == full_scan_at
+
+    def test_no_state(self, s3):
+        s3.get_object.side_effect = ClientError(
+            {"Error": {"Code": "NoSuchKey"}}, "GetObject"
+        )
+
+        assert change_data_state.read_state("s3://bucket/state.json.gz") is None
+
+    def test_other_range_size(self, s3):
+        body = {"version": change_data_state.STATE_VERSION, "range_size": 1}
+        s3.get_object.return_value = {
+            "Body": object_body(gzip.compress(json.dumps(body).encode()))
+        }
+
+        assert change_data_state.read_state("s3://bucket/state.json.gz") is None
+
+    def test_unreadable_state(self, s3):
+        s3.get_object.return_value = {"Body": object_body(b"not gzip")}
+
+        assert change_data_state.read_state("s3://bucket/state.json.gz") is None
+
+
+class TestRangeChecksums:
+    def test_combines_both_sides(self):
+        result = change_data_state.range_checksums({1: [1, 2]}, {2: [3, 4]})
+
+        assert result == {1: [1, 2, 0, 0], 2: [0, 0, 3, 4]}
+
+
+class TestChangedIdSpans:
+    def test_coalesces_consecutive_ranges(self, mocker):
+        mocker.patch.object(change_data_state, "RANGE_SIZE", 10)
+        state = {"ranges": {"1": [1, 1, 0, 0]}}
+        ranges = {
+            0: [1, 1, 0, 0],
+            1: [1, 1, 0, 0],
+            2: [1, 1, 0, 0],
+            3: [1, 1, 0, 0],
+            5: [],
+        }
+
+        result = change_data_state.changed_id_spans(state, ranges)
+
+        assert result == [[0, 10], [20, 40], [50, 60]]
+
+
+class TestFullScanDue:
+    def test_due(self):
+        now = datetime.now(timezone.utc)
+        state = {"full_scan_at": (now - timedelta(hours=2)).isoformat()}
+
+        assert change_data_state.full_scan_due(None, now, 1)
+        assert change_data_state.full_scan_due(state, now, 1)
+        assert not change_data_state.full_scan_due(state, now, 3)
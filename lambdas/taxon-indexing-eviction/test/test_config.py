@@ -37,7 +37,9 @@ class TestGetParameters:
             "EVICTION_TASK_CONCURRENCY": 98,
             "PIPELINE_RUNS_PER_TASK": 97,
             "PIPELINE_RUN_TTL_IN_DAYS": 96,
-            "DRY_RUN": True
+            "DRY_RUN": True,
+            "CHANGE_DATA_STATE_S3_URI": None,
+            "FULL_SCAN_INTERVAL_IN_HOURS": 168,
         }
 
         ssm_spy.assert_not_called()
@@ -69,7 +71,9 @@ class TestGetParameters:
             "EVICTION_TASK_CONCURRENCY": 6,
             "PIPELINE_RUNS_PER_TASK": 500,
             "PIPELINE_RUN_TTL_IN_DAYS": 30,
-            "DRY_RUN": False
+            "DRY_RUN": False,
+            "CHANGE_DATA_STATE_S3_URI": None,
+            "FULL_SCAN_INTERVAL_IN_HOURS": 168,
         }
 
         ssm_spy.assert_not_called()
@@ -111,7 +115,9 @@ class TestGetParameters:
             "EVICTION_TASK_CONCURRENCY": 6,
             "PIPELINE_RUNS_PER_TASK": 500,
             "PIPELINE_RUN_TTL_IN_DAYS": 30,
-            "DRY_RUN": False
+            "DRY_RUN": False,
+            "CHANGE_DATA_STATE_S3_URI": None,
+            "FULL_SCAN_INTERVAL_IN_HOURS": 168,
         }
 
         ssm_spy.assert_not_called()
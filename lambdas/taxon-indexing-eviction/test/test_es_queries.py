@@ -21,3 +21,151 @@ class TestEsClientResilience:
         assert client.transport.max_retries == 3
 
         es_queries.es.cache_clear()
+
+
+def pipeline_run_hit(pipeline_run_id, background_id):
+    return {
+        "fields": {"pipeline_run_id": [pipeline_run_id]},
+        "sort": [pipeline_run_id, background_id],
+    }
+
+
+def search_responses(*pages):
+    return [
+        {"pit_id": f"pit-{i}", "hits": {"hits": hits}} for i, hits in enumerate(pages)
+    ]
+
+
+class TestSearchAll:
+    def test_pages_through_a_point_in_time(self, mocker):
+        es = mocker.patch.object(es_queries, "es").return_value
+        es.create_pit.return_value = {"pit_id": "pit"}
+        es.search.side_effect = search_responses(
+            [pipeline_run_hit(1, 1), pipeline_run_hit(2, 1)],
+            [pipeline_run_hit(3, 1)],
+        )
+        query = {"query": {"match_all": {}}, "sort": ["pipeline_run_id"]}
+
+        hits = list(es_queries.search_all("pipeline_runs", query, page_size=2))
+
+        assert [hit["sort"][0] for hit in hits] == [1, 2, 3]
+        es.create_pit.assert_called_once_with(index="pipeline_runs", keep_alive="5m")
+        second_page = es.search.call_args_list[1].kwargs["body"]
+        assert second_page["search_after"] == [2, 1]
+        assert second_page["pit"] == {"id": "pit-0", "keep_alive": "5m"}
+        assert "index" not in es.search.call_args_list[1].kwargs
+        es.delete_pit.assert_called_once_with(body={"pit_id": ["pit-0"]})
+
+    def test_deletes_the_point_in_time_when_stopped_early(self, mocker):
+        es = mocker.patch.object(es_queries, "es").return_value
+        es.create_pit.return_value = {"pit_id": "pit"}
+        es.search.side_effect = search_responses([pipeline_run_hit(1, 1)] * 2)
+
+        hits = es_queries.search_all("pipeline_runs", {}, page_size=2)
+        next(hits)
+        hits.close()
+
+        es.delete_pit.assert_called_once_with(body={"pit_id": ["pit"]})
+
+    def test_ignores_a_failed_delete(self, mocker):
+        es = mocker.patch.object(es_queries, "es").return_value
+        es.create_pit.return_value = {"pit_id": "pit"}
+        es.search.side_effect = search_responses([])
+        es.delete_pit.side_effect = Exception("gone")
+
+        assert list(es_queries.search_all("pipeline_runs", {})) == []
+
+
+class TestGetAllEsPipelineRuns:
+    def test_yields_distinct_ids_in_order(self, mocker):
+        search_all = mocker.patch.object(
+            es_queries,
+            "search_all",
+            return_value=iter(
+                [
+                    pipeline_run_hit(1, 10),
+                    pipeline_run_hit(1, 11),
+                    pipeline_run_hit(2, 10),
+                    pipeline_run_hit(5, 12),
+                ]
+            ),
+        )
+
+        assert list(es_queries.get_all_es_pipeline_runs()) == [1, 2, 5]
+        index, query = search_all.call_args.args
+        assert index == "pipeline_runs"
+        assert query["_source"] is False
+        assert query["docvalue_fields"] == ["pipeline_run_id"]
+
+    def test_only_id_ranges(self, mocker):
+        search_all = mocker.patch.object(
+            es_queries, "search_all", return_value=iter([pipeline_run_hit(12, 10)])
+        )
+
+        result = es_queries.get_all_es_pipeline_runs([[10, 20], [40, 50]])
+
+        assert list(result) == [12]
+        should = search_all.call_args.args[1]["query"]["bool"]["should"]
+        assert should == [
+            {"range": {"pipeline_run_id": {"gte": 10, "lt": 20}}},
+            {"range": {"pipeline_run_id": {"gte": 40, "lt": 50}}},
+        ]
+
+    def test_no_id_ranges(self, mocker):
+        search_all = mocker.patch.object(es_queries, "search_all")
+
+        assert list(es_queries.get_all_es_pipeline_runs([])) == []
+        search_all.assert_not_called()
+
+
+class TestGetEsPipelineRunRangeChecksums:
+    def test_checksums_by_range(self, mocker):
+        es = mocker.patch.object(es_queries, "es")
+        es.return_value.search.return_value = {
+            "aggregations": {
+                "id_ranges": {
+                    "buckets": [
+                        {"key": 0.0, "doc_count": 2, "id_sum": {"value": 3.0}},
+                        {"key": 20.0, "doc_count": 1, "id_sum": {"value": 25.0}},
+                    ]
+                }
+            }
+        }
+
+        result = es_queries.get_es_pipeline_run_range_checksums(10)
+
+        assert result == {0: [2, 3], 2: [1, 25]}
+        query = es.return_value.search.call_args.kwargs["body"]
+        assert query["aggs"]["id_ranges"]["histogram"]["interval"] == 10
+
+
+class TestFindExpiredPipelineRuns:
+    def test_streams_least_recently_read_first(self, mocker):
+        mocker.patch.object(
+            es_queries.config,
+            "get_parameters",
+            return_value={"PIPELINE_RUN_TTL_IN_DAYS": 30},
+        )
+        search_all = mocker.patch.object(
+            es_queries,
+            "search_all",
+            return_value=iter(
+                [
+                    {"_source": {"pipeline_run_id": 1, "background_id": 10}},
+                    {"_source": {"pipeline_run_id": 2, "background_id": 10}},
+                ]
+            ),
+        )
+
+        result = es_queries.find_expired_pipeline_runs()
+
+        assert list(result) == [
+            {"pipeline_run_id": 1, "background_id": 10},
+            {"pipeline_run_id": 2, "background_id": 10},
+        ]
+        index, query = search_all.call_args.args
+        assert index == "pipeline_runs"
+        assert "size" not in query
+        assert query["sort"][0] == {
+            "last_read_at": {"order": "asc", "missing": "_first"}
+        }
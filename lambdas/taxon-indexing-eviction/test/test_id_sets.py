@@ -0,0 +1,69 @@
+# type: ignore
+
+import numpy as np
+import pytest
+
+from chalicelib import id_sets
+from chalicelib.id_sets import PipelineRunIdSet
+
+
+class TestSortedDifference:
+    def test_no_excluded_ids(self):
+        assert list(id_sets.sorted_difference([1, 2], [])) == [1, 2]
+
+    def test_all_excluded(self):
+        result = id_sets.sorted_difference([1, 2], [0, 1, 2, 3])
+
+        assert list(result) == []
+
+    def test_reads_lazily(self):
+        def ids():
+            yield 1
+            raise AssertionError("read past the first id")
+
+        result = id_sets.sorted_difference(ids(), iter([2, 3]))
+
+        assert next(result) == 1
+
+
+class TestPipelineRunIdSet:
+    def test_sorts_and_deduplicates(self):
+        id_set = PipelineRunIdSet([5, 1, 3, 1])
+
+        assert list(id_set) == [1, 3, 5]
+        assert type(list(id_set)[0]) is int
+        assert len(id_set) == 3
+        assert id_set.nbytes == 24
+
+    def test_membership(self):
+        id_set = PipelineRunIdSet([1, 3, 5])
+
+        assert 3 in id_set
+        assert 4 not in id_set
+        assert 6 not in id_set
+        assert 1 not in PipelineRunIdSet()
+
+    def test_from_sorted_rejects_unsorted_ids(self):
+        with pytest.raises(ValueError):
+            PipelineRunIdSet.from_sorted([1, 3, 2])
+        with pytest.raises(ValueError):
+            PipelineRunIdSet.from_sorted([1, 3, 3])
+
+    def test_union(self):
+        result = PipelineRunIdSet([1, 4]).union([4, 2, 9])
+
+        assert result == PipelineRunIdSet([1, 2, 4, 9])
+
+    def test_difference(self):
+        result = PipelineRunIdSet([1, 2, 4, 9]).difference([4, 2, 7])
+
+        assert result == PipelineRunIdSet([1, 9])
+
+    def test_isin_in_chunks(self, mocker):
+        mocker.patch.object(PipelineRunIdSet, "CHUNK_SIZE", 2)
+        ids = np.array([0, 1, 2, 5, 9, 10], dtype=np.int64)
+
+        result = PipelineRunIdSet([1, 5, 9]).isin(ids)
+
+        assert result.tolist() == [False, True, False, True, True, False]
+        assert not PipelineRunIdSet().isin(ids).any()
@@ -0,0 +1,72 @@
+# type: ignore
+
+from chalicelib import sql_queries
+
+
+def mock_cursor(mocker):
+    cursor = mocker.MagicMock()
+    cursor.__enter__.return_value = cursor
+    connection = mocker.MagicMock()
+    connection.cursor.return_value = cursor
+    mocker.patch.object(sql_queries, "conn", return_value=connection)
+    return connection, cursor
+
+
+class TestGetAllMysqlPipelineRunIds:
+    def test_reads_ids_in_batches_after_the_last_id(self, mocker):
+        connection, cursor = mock_cursor(mocker)
+        mocker.patch.object(sql_queries, "FETCH_SIZE", 2)
+        cursor.fetchall.side_effect = [[(1,), (2,)], [(5,)]]
+
+        result = sql_queries.get_all_mysql_pipeline_run_ids()
+
+        assert list(result) == [1, 2, 5]
+        connection.cursor.assert_called_with()
+        sql = cursor.execute.call_args.args[0]
+        assert "WHERE id > %s" in sql
+        assert "ORDER BY id LIMIT %s" in sql
+        assert [call.args[1] for call in cursor.execute.call_args_list] == [
+            [-1, 2],
+            [2, 2],
+        ]
+
+    def test_no_cursor_open_while_ids_are_consumed(self, mocker):
+        connection, cursor = mock_cursor(mocker)
+        mocker.patch.object(sql_queries, "FETCH_SIZE", 2)
+        cursor.fetchall.side_effect = [[(1,), (2,)], [(3,), (4,)], []]
+
+        result = sql_queries.get_all_mysql_pipeline_run_ids()
+
+        for i, _ in enumerate(result):
+            # every batch read so far has been closed
+            assert cursor.__exit__.call_count == i // 2 + 1
+        assert cursor.execute.call_count == 3
+        assert cursor.__exit__.call_count == 3
+
+    def test_only_id_ranges(self, mocker):
+        connection, cursor = mock_cursor(mocker)
+        cursor.fetchall.return_value = [(12,), (41,)]
+
+        result = sql_queries.get_all_mysql_pipeline_run_ids([[10, 20], [40, 50]])
+
+        assert list(result) == [12, 41]
+        sql, args = cursor.execute.call_args.args
+        assert "AND ((id >= %s AND id < %s) OR (id >= %s AND id < %s))" in sql
+        assert args == [-1, 10, 20, 40, 50, sql_queries.FETCH_SIZE]
+
+    def test_no_id_ranges(self, mocker):
+        connection, cursor = mock_cursor(mocker)
+
+        assert list(sql_queries.get_all_mysql_pipeline_run_ids([])) == []
+        connection.cursor.assert_not_called()
+
+
+class TestGetMysqlPipelineRunRangeChecksums:
+    def test_checksums_by_range(self, mocker):
+        connection, cursor = mock_cursor(mocker)
+        cursor.fetchall.return_value = [(0, 2, 7), (3, 1, 99)]
+
+        result = sql_queries.get_mysql_pipeline_run_range_checksums(10)
+
+        assert result == {0: [2, 7], 3: [1, 99]}
+        assert cursor.execute.call_args.args[1] == (10,)
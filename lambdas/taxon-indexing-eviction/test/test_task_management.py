@@ -1,6 +1,6 @@
 # type: ignore
 
-from chalicelib import task_management
+from chalicelib import change_data_detection, task_management
 import test.test_data as test_data
 from unittest.mock import call
 
@@ -134,27 +134,90 @@ class TestDiscoverEvictionCandidates:
     def test_should_return_eviction_candidates(self, mocker):
         mocker.patch.object(
             task_management,
-            "get_pipeline_runs_deleted_from_mysql",
-            return_value=["pipeline_run_id_1", "pipeline_run_id_5"],
+            "get_parameters",
+            return_value={"PIPELINE_RUNS_PER_TASK": 2},
         )
         mocker.patch.object(
             task_management,
-            "get_expired_pipeline_runs_by_background_id",
-            return_value={
-                "background_id_1": ["pipeline_run_id_6"],
-            },
+            "get_pipeline_runs_deleted_from_mysql",
+            return_value=iter([1, 5]),
+        )
+        get_expired_pipeline_run_batches = mocker.patch.object(
+            task_management,
+            "get_expired_pipeline_run_batches",
+            return_value=(batch for batch in [("background_id_1", [6])]),
         )
 
         result = task_management.discover_eviction_candidates(
-            ["pipeline_run_id_1", "pipeline_run_id_2"],
+            [2, 1],
+            2,
         )
 
         assert result == (
-            ["pipeline_run_id_5"],
+            [5],
             {
-                "background_id_1": ["pipeline_run_id_6"],
+                "background_id_1": [6],
             },
         )
+        get_expired_pipeline_run_batches.assert_called_once_with(
+            task_management.PipelineRunIdSet([1, 2, 5]), 2
+        )
+
+    def test_should_only_take_expired_batches_for_capacity(self, mocker):
+        mocker.patch.object(
+            task_management,
+            "get_parameters",
+            return_value={"PIPELINE_RUNS_PER_TASK": 2},
+        )
+        mocker.patch.object(
+            task_management,
+            "get_pipeline_runs_deleted_from_mysql",
+            return_value=iter([1, 2, 3]),
+        )
+
+        def expired_batches():
+            yield ("background_id_1", [6, 7])
+            yield ("background_id_2", [8])
+            yield ("background_id_1", [9, 10])
+            raise AssertionError("read past the capacity")
+
+        mocker.patch.object(
+            task_management,
+            "get_expired_pipeline_run_batches",
+            return_value=expired_batches(),
+        )
+
+        result = task_management.discover_eviction_candidates([], 5)
+
+        # two tasks for the deleted pipelines, three for the expired ones
+        assert result == (
+            [1, 2, 3],
+            {
+                "background_id_1": [6, 7, 9, 10],
+                "background_id_2": [8],
+            },
+        )
+
+    def test_should_not_read_expired_without_capacity(self, mocker):
+        mocker.patch.object(
+            task_management,
+            "get_parameters",
+            return_value={"PIPELINE_RUNS_PER_TASK": 2},
+        )
+        mocker.patch.object(
+            task_management,
+            "get_pipeline_runs_deleted_from_mysql",
+            return_value=iter([1, 2, 3]),
+        )
+        mocker.patch.object(
+            change_data_detection,
+            "find_expired_pipeline_runs",
+            side_effect=AssertionError("expired pipelines read"),
+        )
+
+        result = task_management.discover_eviction_candidates([], 2)
+
+        assert result == ([1, 2, 3], {})
 
 
 class TestEvictByPipelineRunIds:
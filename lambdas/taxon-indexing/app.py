@@ -3,11 +3,12 @@
 from chalice import Chalice
 import os
 import logging
-import json
+import itertools
 import pymysql
 from datetime import datetime
 from opensearchpy import OpenSearch
-from chalicelib import queries, config, schemas
+from chalicelib import bulk, diff, export, lineages, metrics, mysql, queries, config, schemas, summaries
+from chalicelib.packaging import package_metrics, package_metric_tuples
 from chalicelib.sentry_init import init_sentry, capture_exception
 from aws_lambda_powertools.utilities.validation import validate
 
@@ -16,7 +17,28 @@ app = Chalice(app_name="taxon-indexing-lambda")
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-DEFAULT_ES_BATCHSIZE = 1000
+# "sql" counts contigs inside the scored taxon counts query so rows stream straight
+# into the ES writes; "python" scans the contigs table into a dict first (legacy)
+DEFAULT_CONTIG_AGGREGATION = "sql"
+# How written documents are made searchable before a run is marked complete:
+#   immediate: refresh the indexes at the end of every invocation (one cluster-wide
+#              refresh per run, expensive under backfill concurrency)
+#   wait_for:  every write waits for the next scheduled refresh instead of forcing one
+#   deferred:  nothing is refreshed and runs are left incomplete; the caller batches
+#              the successful runs into a `finalize_runs` event, which refreshes once
+#              and then marks all of them complete
+DEFAULT_REFRESH_MODE = "immediate"
+# "sql" scores taxon counts against taxon_summaries inside the MySQL query; "python"
+# scores them in the lambda against per-background summaries cached across invocations
+DEFAULT_ZSCORE_COMPUTATION = "sql"
+# "sql" joins taxon_lineages in the MySQL query; "python" looks the names up in
+# per-lineage_version tables cached across invocations
+DEFAULT_LINEAGE_LOOKUP = "sql"
+ES_REFRESH_BY_MODE = {"immediate": True, "wait_for": "wait_for", "deferred": None}
+# "full" rewrites every document of the runs; "diff" reads the content hashes already
+# indexed for them, only writes new or changed documents and deletes the documents
+# of taxa that are gone
+DEFAULT_INDEX_MODE = "full"
 
 
 def build_os_client(host):
@@ -49,13 +71,45 @@ def handler(event, context):
 @app.lambda_function()
 def index_taxons(event, context):
     """
-    Read all taxon_counts for the given pipeline_run_id and then write the results to ElasticSearch
+    Read all taxon_counts for the given pipeline_run_id and then write the results to ElasticSearch.
+    Events may instead carry a list of `runs` ({pipeline_run_id, background_id} pairs), which are
+    read with a single query and written through a single bulk pipeline; the response then
+    reports the outcome of each run so the caller can retry only the runs that failed.
+    The time spent in each phase and the row, document and bulk request counts are
+    logged as a CloudWatch embedded metric format record and returned under `metrics`.
     """
+    run_metrics = metrics.InvocationMetrics()
     validate(event=event, schema=schemas.INPUT)
 
-    pipeline_run_id = event["pipeline_run_id"]
-    background_id = event["background_id"]
-    es_batchsize = event.get("es_batchsize", DEFAULT_ES_BATCHSIZE)
+    if "finalize_runs" in event:
+        return finalize_runs(event)
+
+    is_batch = "runs" in event
+    if is_batch:
+        # dict.fromkeys de-duplicates while keeping the caller's order
+        runs = list(
+            dict.fromkeys(
+                (int(run["pipeline_run_id"]), int(run["background_id"]))
+                for run in event["runs"]
+            )
+        )
+    else:
+        pipeline_run_id = event["pipeline_run_id"]
+        background_id = event["background_id"]
+        runs = [(int(pipeline_run_id), int(background_id))]
+    es_batchsize = event.get("es_batchsize", bulk.DEFAULT_BATCHSIZE)
+    es_batch_size_mb = event.get("es_batch_size_mb", bulk.DEFAULT_BATCH_SIZE_MB)
+    contig_aggregation = event.get("contig_aggregation", DEFAULT_CONTIG_AGGREGATION)
+    es_bulk_concurrency = event.get("es_bulk_concurrency", bulk.DEFAULT_CONCURRENCY)
+    refresh_mode = event.get("refresh_mode", DEFAULT_REFRESH_MODE)
+    zscore_computation = event.get("zscore_computation", DEFAULT_ZSCORE_COMPUTATION)
+    summaries_cache_mb = event.get("summaries_cache_mb", summaries.DEFAULT_CACHE_MB)
+    lineage_lookup = event.get("lineage_lookup", DEFAULT_LINEAGE_LOOKUP)
+    lineage_cache_mb = event.get("lineage_cache_mb", lineages.DEFAULT_CACHE_MB)
+    index_mode = event.get("index_mode", DEFAULT_INDEX_MODE)
+    export_uri = event.get("export_uri", export.EXPORT_URI)
+    # debug mode: log the MySQL query plans and return them in the response
+    explain_queries = event.get("explain_queries", False)
     scored_taxon_counts_index_name = event.get(
         "scored_taxon_counts_index_name", "scored_taxon_counts"
     )
@@ -67,81 +121,281 @@ def index_taxons(event, context):
     # `es` client built from the DEPLOYMENT_ENVIRONMENT-configured host (unchanged behavior).
     es_host = event.get("es_host")
     es_client = build_os_client(es_host) if es_host else es
-
-    create_pipeline_run(
-        pipeline_run_id, background_id, pipeline_runs_index_name, es_client
-    )
-    if "LOCAL_MODE" in os.environ:
-        # in local mode, passing a password parameter (even None)
-        # will cause the connection to fail
-        conn = pymysql.connect(
-            host=params["mysql_host"],
-            port=int(params["mysql_port"]),
-            user=params["mysql_username"],
-            db=params["mysql_db"],
-            connect_timeout=10,
+    # created first so a missing pyarrow fails the invocation before anything is written
+    exporter = export.RunExporter(export_uri) if export_uri else None
+
+    with run_metrics.phase("pipeline_runs_index"):
+        create_pipeline_runs(
+            runs,
+            pipeline_runs_index_name,
+            es_client,
+            refresh=ES_REFRESH_BY_MODE[refresh_mode],
         )
+    document_diff = None
+    if index_mode == "diff":
+        # read before the unbuffered MySQL cursor is opened, so the scroll does
+        # not hold it open
+        with run_metrics.phase("diff"):
+            document_diff = diff.DocumentDiff(
+                diff.get_content_hashes(es_client, scored_taxon_counts_index_name, runs)
+            )
+    with run_metrics.phase("mysql_connection"):
+        conn, mysql_connection = mysql.get_connection(params)
+    logger.info("MySQL connection: %s", mysql_connection)
+
+    query_plans = {}
+    summaries_cache = None
+    lineage_cache = None
+    try:
+        if lineage_lookup == "python":
+            with run_metrics.phase("lineage_lookup"):
+                lineage_tables, lineage_cache = lineages.get_lineage_tables(
+                    conn,
+                    sorted({pipeline_run_id for pipeline_run_id, _ in runs}),
+                    lineage_cache_mb,
+                )
+            logger.info("taxon_lineages cache: %s", lineage_cache)
+        if zscore_computation == "python":
+            with run_metrics.phase("zscores"):
+                summary_tables, summaries_cache = summaries.get_background_summaries(
+                    conn,
+                    sorted({background_id for _, background_id in runs}),
+                    summaries_cache_mb,
+                )
+            logger.info("taxon_summaries cache: %s", summaries_cache)
+
+        # rows are read as plain tuples unless a python stage below needs dicts,
+        # which saves building a dict per row (see package_metric_tuples)
+        tuple_rows = "python" not in (contig_aggregation, zscore_computation, lineage_lookup)
+        with conn.cursor(
+            pymysql.cursors.SSCursor if tuple_rows else pymysql.cursors.SSDictCursor
+        ) as cursor:
+            contig_data = None
+            if contig_aggregation == "python":
+                with run_metrics.phase("contig_scan"):
+                    query_plans["contigs"] = mysql.execute(
+                        cursor,
+                        queries.get_contigs_by_pipeline_run_ids_query(
+                            [pipeline_run_id for pipeline_run_id, _ in runs]
+                        ),
+                        explain=explain_queries,
+                    )
+                    contig_data = package_contigs(yield_all_records(cursor, batchsize=1000))
+
+            with run_metrics.phase("score_query"):
+                query_plans["scored_taxon_counts"] = mysql.execute(
+                    cursor,
+                    queries.get_scored_taxon_counts_for_runs_query(
+                        runs,
+                        include_contig_counts=contig_data is None,
+                        include_scores=zscore_computation == "sql",
+                        include_lineages=lineage_lookup == "sql",
+                    ),
+                    explain=explain_queries,
+                )
+            # the highest number of taxon_counts for a given pipeline_run_id
+            # appears to top out at around 60k and more commonly tops out at
+            # 20k; fetch in batches anyway so ES writes start while the
+            # unbuffered cursor is still streaming rows.
+            row_batches = run_metrics.iterate(
+                "score_query", yield_record_batches(cursor, batchsize=1000), count="rows", size=len
+            )
+            if tuple_rows:
+                taxon_metrics = package_metric_tuples(
+                    itertools.chain.from_iterable(row_batches),
+                    [column[0] for column in cursor.description],
+                )
+            else:
+                if lineage_lookup == "python":
+                    row_batches = run_metrics.iterate(
+                        "lineage_lookup", lineages.add_lineages(row_batches, lineage_tables)
+                    )
+                if zscore_computation == "python":
+                    rows = run_metrics.iterate(
+                        "zscores", summaries.score_rows(row_batches, summary_tables)
+                    )
+                else:
+                    rows = itertools.chain.from_iterable(row_batches)
+                taxon_metrics = package_metrics(rows, contig_data)
+            taxon_metrics = run_metrics.iterate("packaging", taxon_metrics, count="documents")
+            if exporter:
+                taxon_metrics = run_metrics.iterate("export", exporter.tap(taxon_metrics))
+            if document_diff:
+                taxon_metrics = run_metrics.iterate("diff", document_diff.changed(taxon_metrics))
+            bodies = run_metrics.iterate(
+                "serialization",
+                bulk.batch_es_index_bodies(
+                    taxon_metrics,
+                    scored_taxon_counts_index_name,
+                    batchsize=es_batchsize,
+                    batch_size_mb=es_batch_size_mb,
+                ),
+            )
+            if document_diff:
+                # the removed documents are only known once every packaged
+                # document has been compared, so they are deleted last
+                bodies = itertools.chain(
+                    bodies,
+                    bulk.batch_es_delete_bodies(
+                        document_diff.removed_ids(),
+                        scored_taxon_counts_index_name,
+                        batchsize=es_batchsize,
+                    ),
+                )
+            with run_metrics.phase("bulk_wait"):
+                bulk_result = bulk.parallel_bulk_index(
+                    es_client,
+                    bodies,
+                    concurrency=es_bulk_concurrency,
+                    # a single run fails the invocation like any other error; in a batch a
+                    # failed document only fails its own run
+                    raise_on_error=not is_batch,
+                    # with wait_for each bulk request only returns once its documents are
+                    # searchable, so no explicit refresh is needed below
+                    refresh="wait_for" if refresh_mode == "wait_for" else None,
+                )
+            run_metrics.add_bulk_result(bulk_result)
+            if exporter:
+                run_metrics.add("exported_files", len(exporter.files))
+            if document_diff:
+                diff_stats = document_diff.stats()
+                run_metrics.add("unchanged_documents", diff_stats["unchanged"])
+                run_metrics.add("removed_documents", diff_stats["removed"])
+    except BaseException:
+        # the unbuffered cursor may have been abandoned part way through its
+        # results, so don't hand this connection to the next invocation
+        mysql.discard_connection()
+        raise
+
+    if refresh_mode == "immediate":
+        # refresh the index so that all written records are available to search before returning
+        with run_metrics.phase("refresh"):
+            refresh_index(scored_taxon_counts_index_name, es_client)
+
+    run_errors = errors_by_run(bulk_result["errors"])
+    if refresh_mode != "deferred":
+        with run_metrics.phase("pipeline_runs_index"):
+            complete_pipeline_runs(
+                [run for run in runs if run not in run_errors],
+                pipeline_runs_index_name,
+                es_client,
+                refresh=ES_REFRESH_BY_MODE[refresh_mode],
+            )
+
+    if not is_batch:
+        run_params = {
+            "pipeline_run_id": pipeline_run_id,
+            "background_id": background_id,
+        }
     else:
-        conn = pymysql.connect(
-            host=params["mysql_host"],
-            port=int(params["mysql_port"]),
-            user=params["mysql_username"],
-            passwd=params["mysql_password"],
-            db=params["mysql_db"],
-            ssl={"enable_tls": True},
-            connect_timeout=10,
+        run_params = {"run_count": len(runs)}
+    response = {
+        "success": not run_errors,
+        "params": {
+            **run_params,
+            "es_batchsize": es_batchsize,
+            "es_batch_size_mb": es_batch_size_mb,
+            "contig_aggregation": contig_aggregation,
+            "es_bulk_concurrency": es_bulk_concurrency,
+            "refresh_mode": refresh_mode,
+            "zscore_computation": zscore_computation,
+            "lineage_lookup": lineage_lookup,
+            "index_mode": index_mode,
+            "export_uri": export_uri,
+        },
+        "retried_items": bulk_result["retried"],
+        "mysql_connection": mysql_connection,
+    }
+    if is_batch:
+        response["runs"] = [
+            {
+                "pipeline_run_id": pipeline_run_id,
+                "background_id": background_id,
+                "success": (pipeline_run_id, background_id) not in run_errors,
+                **(
+                    {"error": run_errors[(pipeline_run_id, background_id)]}
+                    if (pipeline_run_id, background_id) in run_errors
+                    else {}
+                ),
+            }
+            for pipeline_run_id, background_id in runs
+        ]
+    if explain_queries:
+        response["query_plans"] = query_plans
+    if summaries_cache:
+        response["summaries_cache"] = summaries_cache
+    if lineage_cache:
+        response["lineage_cache"] = lineage_cache
+    if exporter:
+        response["exported_files"] = exporter.files
+    response["metrics"] = run_metrics.summary()
+    run_metrics.emit(
+        response["metrics"],
+        pipeline_run_ids=sorted({pipeline_run_id for pipeline_run_id, _ in runs}),
+        background_ids=sorted({background_id for _, background_id in runs}),
+    )
+    return response
+
+
+def finalize_runs(event):
+    """
+    Make the scored_taxon_counts of runs indexed with refresh_mode=deferred
+    searchable with a single refresh, and only then mark those runs complete
+    """
+    runs = list(
+        dict.fromkeys(
+            (int(run["pipeline_run_id"]), int(run["background_id"]))
+            for run in event["finalize_runs"]
         )
+    )
+    scored_taxon_counts_index_name = event.get(
+        "scored_taxon_counts_index_name", "scored_taxon_counts"
+    )
+    pipeline_runs_index_name = event.get("pipeline_runs_index_name", "pipeline_runs")
+    es_host = event.get("es_host")
+    es_client = build_os_client(es_host) if es_host else es
 
-    with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
-        cursor.execute(queries.get_contigs_by_pipeline_run_id_query(pipeline_run_id))
+    refresh_index(scored_taxon_counts_index_name, es_client)
+    complete_pipeline_runs(runs, pipeline_runs_index_name, es_client, refresh=True)
 
-        contig_data = package_contigs(yield_all_records(cursor, batchsize=1000))
+    return {"success": True, "params": {"finalized_run_count": len(runs)}}
 
-        cursor.execute(
-            queries.get_scored_taxon_counts_query(pipeline_run_id, background_id)
-        )
-        for batch in batch_es_index_bodies(
-            package_metrics(
-                # the highest number of taxon_counts for a given pipeline_run_id
-                # appears to top out at around 60k and more commonly tops out at
-                # 20k, so all results should fit in memory just fine.
-                yield_all_records(cursor),
-                contig_data,
-            ),
-            scored_taxon_counts_index_name,
-            batchsize=es_batchsize,
-        ):
-            bulk_index_taxon_metrics(batch, es_client)
-
-    # refresh the index so that all written records are available to search before returning
+
+def refresh_index(index_name, es_client=None):
+    """
+    Refresh the given index so that all written records are available to search
+    """
+    es_client = es_client or es
     try:
-        response = es_client.indices.refresh(index=scored_taxon_counts_index_name)
+        response = es_client.indices.refresh(index=index_name)
     except Exception as exc:
         # The heatmap ES timeout used to die silently in CloudWatch; make it
         # visible in Sentry, then re-raise so the Lambda still fails.
         capture_exception(exc)
         raise
     logger.info(response)
-    complete_pipeline_run(
-        pipeline_run_id, background_id, pipeline_runs_index_name, es_client
-    )
 
-    conn.close()
 
-    return {
-        "success": True,
-        "params": {
-            "pipeline_run_id": pipeline_run_id,
-            "background_id": background_id,
-            "es_batchsize": es_batchsize,
-        },
-    }
+def errors_by_run(bulk_errors):
+    """
+    Group failed scored_taxon_counts writes by their (pipeline_run_id, background_id).
+    Return the first error of each failed run, keyed by that pair.
+    """
+    run_errors = {}
+    for bulk_error in bulk_errors:
+        # ids are {tax_id}_{tax_level}_{pipeline_run_id}_{background_id} (tax_id may be negative)
+        _, pipeline_run_id, background_id = bulk_error["_id"].rsplit("_", 2)
+        run_errors.setdefault(
+            (int(pipeline_run_id), int(background_id)), bulk_error["error"]
+        )
+    return run_errors
 
 
 def package_contigs(sql_results):
     """
     Return the number of contigs that were found for each
-    pipeline/taxon/count_type combination.
+    pipeline/taxon/count_type combination, as
+    {pipeline_run_id: {taxid: {count_type: contigs}}}.
     Adapted from https://github.com/chanzuckerberg/czid-web-private/blob/
     d12952/app/models/pipeline_run.rb#L1751-L1779
     """
@@ -157,11 +411,12 @@ def package_contigs(sql_results):
 
     summary_dict = {}
     for row in sql_results:
+        run_summary = summary_dict.setdefault(row["pipeline_run_id"], {})
         for taxid_type, count_type in taxid_and_count_types:
             taxid = row[taxid_type]
             if taxid:
-                summary_dict.setdefault(taxid, {}).setdefault(count_type, 0)
-                summary_dict[taxid][count_type] += 1
+                run_summary.setdefault(taxid, {}).setdefault(count_type, 0)
+                run_summary[taxid][count_type] += 1
 
     return summary_dict
 
@@ -173,65 +428,19 @@ def yield_all_records(cursor, batchsize=None):
     if not batchsize:
         yield from cursor.fetchall()
     else:
-        while True:
-            batch = cursor.fetchmany(batchsize)
-            if not batch or len(batch) == 0:
-                break
+        for batch in yield_record_batches(cursor, batchsize):
             yield from batch
 
 
-def package_metrics(sql_results, contig_data):
+def yield_record_batches(cursor, batchsize):
     """
-    Reduce the per-counttype MySQL rows into per-taxon objects for ES
+    Fetch records from the cursor and yield them in lists of up to batchsize rows
     """
-    current_tax_id = None
-    packaged_taxon = None
-    # sql_results are sorted by tax_id, so we can just iterate through them
-    for row in sql_results:
-        # if we're starting a new taxon, yield the previous one
-        # and then start a new one
-        if current_tax_id and current_tax_id != row["tax_id"]:
-            yield packaged_taxon
-            packaged_taxon = None
-
-        # construct the metric list entry for this row
-        metric_list_entry = {
-            "count_type": row["count_type"],
-            "counts": row["counts"],
-            "stdev": row["stdev"],
-            "mean": row["mean"],
-            "stdev_mass_normalized": row["stdev_mass_normalized"],
-            "mean_mass_normalized": row["mean_mass_normalized"],
-            "percent_identity": row["percent_identity"],
-            "e_value": row["e_value"],
-            "rpm": row["rpm"],
-            "zscore": row["zscore"],
-            "alignment_length": row["alignment_length"],
-            "contigs": contig_data.get(row["tax_id"], {}).get(row["count_type"], 0),
-        }
-        # if we're starting a new taxon, create the taxon object with the metric entry
-        if packaged_taxon is None:
-            current_tax_id = row["tax_id"]
-            packaged_taxon = {
-                "pipeline_run_id": row["pipeline_run_id"],
-                "tax_id": row["tax_id"],
-                "background_id": row["background_id"],
-                "tax_level": row["tax_level"],
-                "genus_taxid": row["genus_taxid"],
-                "family_taxid": row["family_taxid"],
-                "superkingdom_taxid": row["superkingdom_taxid"],
-                "name": row["name"],
-                "common_name": row["common_name"],
-                "genus_name": row["genus_name"],
-                "is_phage": row["is_phage"],
-                "metric_list": [metric_list_entry],
-            }
-        # if the taxon already exists, append the metric entry to the list
-        else:
-            current_tax_id = row["tax_id"]
-            packaged_taxon["metric_list"].append(metric_list_entry)
-    if packaged_taxon:
-        yield packaged_taxon
+    while True:
+        batch = cursor.fetchmany(batchsize)
+        if not batch:
+            break
+        yield batch
 
 
 def index_taxon_metrics(taxon_metrics, index_name):
@@ -246,87 +455,54 @@ def bulk_index_taxon_metrics(batch, es_client=None):
     """
     Write a batch of taxons to ES
     """
-    es_client = es_client or es
-    if batch:
-        response = es_client.bulk(batch)
-        if response["errors"]:
-            errors = [
-                item["index"]["error"]
-                for item in response["items"]
-                if "error" in item["index"]
-            ]
-            error_count = len(errors)
-            logger.info(response)
-            exc = Exception(
-                f"Bulk write failed {error_count} times. Error example: ",
-                json.dumps(errors[0]),
-            )
-            # Surface this operational failure to Sentry explicitly (it is only
-            # otherwise logged/raised); AwsLambdaIntegration also captures it at
-            # the handler boundary, but capturing here attaches the ES error.
-            capture_exception(exc)
-            raise exc
-        logger.info(response)
+    bulk.bulk_index(es_client or es, batch)
 
 
-def create_pipeline_run(pipeline_run_id, background_id, index_name, es_client=None):
+def create_pipeline_runs(runs, index_name, es_client=None, refresh=True):
     """
     Create/overwrite the pipeline_runs index record
-    for the given pipeline so that we can track the
-    completeness of the scored_taxon_counts writes
+    for each given (pipeline_run_id, background_id) so that
+    we can track the completeness of the scored_taxon_counts writes
     """
-    es_client = es_client or es
-    response = es_client.index(
-        index=index_name,
-        body={
-            "pipeline_run_id": pipeline_run_id,
-            "background_id": background_id,
-            "is_complete": False,
-            "created_at": datetime.now().isoformat(),
-        },
-        id=f"{pipeline_run_id}_{background_id}",
-        refresh=True,
-    )
-    logger.info(response)
-
-
-def complete_pipeline_run(pipeline_run_id, background_id, index_name, es_client=None):
-    """
-    Update the pipeline_run index record to indicate
-    that all scored_taxon_count records were
-    successfully written
-    """
-    es_client = es_client or es
-    response = es_client.update(
-        index=index_name,
-        body={"doc": {"is_complete": True}},
-        id=f"{pipeline_run_id}_{background_id}",
-        retry_on_conflict=3,
-        refresh=True,
+    created_at = datetime.now().isoformat()
+    body = b"".join(
+        bulk.dumps(
+            {"index": {"_index": index_name, "_id": f"{pipeline_run_id}_{background_id}"}}
+        )
+        + b"\n"
+        + bulk.dumps(
+            {
+                "pipeline_run_id": pipeline_run_id,
+                "background_id": background_id,
+                "is_complete": False,
+                "created_at": created_at,
+            }
+        )
+        + b"\n"
+        for pipeline_run_id, background_id in runs
     )
-    logger.info(response)
+    bulk.bulk_index(es_client or es, body, refresh=refresh)
 
 
-def batch_es_index_bodies(taxon_metrics_list, index_name, batchsize):
+def complete_pipeline_runs(runs, index_name, es_client=None, refresh=True):
     """
-    Batch taxons for more efficient ES bulk writes
+    Update the pipeline_run index record of each given
+    (pipeline_run_id, background_id) to indicate that all
+    scored_taxon_count records were successfully written
     """
-    count = 0
-    bulk_body = ""
-    for taxon_metrics in taxon_metrics_list:
-        es_id = (
-            f'{taxon_metrics["tax_id"]}'
-            f'_{taxon_metrics["tax_level"]}'
-            f'_{taxon_metrics["pipeline_run_id"]}'
-            f'_{taxon_metrics["background_id"]}'
-        )
-        bulk_body += (
-            f'{{"index": ' f'{{"_index": "{index_name}", "_id":"{es_id}" }}}} \n'
+    body = b"".join(
+        bulk.dumps(
+            {
+                "update": {
+                    "_index": index_name,
+                    "_id": f"{pipeline_run_id}_{background_id}",
+                    "retry_on_conflict": 3,
+                }
+            }
         )
-        bulk_body += json.dumps(taxon_metrics, separators=(",", ":")) + "\n"
-        count += 1
-        if count == batchsize:
-            yield bulk_body
-            bulk_body = ""
-            count = 0
-    yield bulk_body
+        + b"\n"
+        + bulk.dumps({"doc": {"is_complete": True}})
+        + b"\n"
+        for pipeline_run_id, background_id in runs
+    )
+    bulk.bulk_index(es_client or es, body, refresh=refresh)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare the MySQL plans and run times of the scored taxon counts query with and
+without the indexes in recommended_indexes.sql, on synthetic data in a throwaway
+database. Start a local MySQL first, then run from lambdas/taxon-indexing:
+
+    docker run --rm -d -p 3306:3306 -e MYSQL_ALLOW_EMPTY_PASSWORD=yes mysql:8.0
+    python -m benchmark.explain_plans --taxa 20000
+
+Prints a JSON report with the EXPLAIN rows and the best of --repeat timings for
+each configuration.
+"""
+
+import argparse
+import json
+import time
+
+from benchmark import seed
+from chalicelib import mysql, queries
+
+
+def measure(cursor, query, repeat):
+    """
+    Return the query's EXPLAIN rows and its best wall time, rows fetched included
+    """
+    plan = mysql.execute(cursor, query, explain=True)
+    rows = cursor.fetchall()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mysql.execute(cursor, query)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    return {
+        "rows": len(rows),
+        "best_seconds": round(min(timings), 4),
+        "plan": [
+            {key: row.get(key) for key in ("table", "type", "key", "rows", "Extra")}
+            for row in plan
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    seed.add_mysql_arguments(parser)
+    parser.add_argument("--taxa", type=int, default=20000, help="taxa per run and count type")
+    parser.add_argument("--runs", type=int, default=4)
+    parser.add_argument("--backgrounds", type=int, default=20)
+    parser.add_argument("--lineage-versions", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    conn = seed.connect(args)
+    with conn.cursor() as cursor:
+        seed.seed(cursor, args.taxa, args.runs, args.backgrounds, args.lineage_versions)
+
+        query = queries.get_scored_taxon_counts_for_runs_query(
+            [(1, args.backgrounds)], include_contig_counts=True
+        )
+        report = {"without_recommended_indexes": measure(cursor, query, args.repeat)}
+        seed.run_statements(cursor, "recommended_indexes.sql")
+        cursor.execute("ANALYZE TABLE taxon_lineages, taxon_summaries")
+        cursor.fetchall()
+        report["with_recommended_indexes"] = measure(cursor, query, args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
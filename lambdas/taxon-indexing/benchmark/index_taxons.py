@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Run index_taxons end to end through app.handler() in LOCAL_MODE, against synthetic
+data in a local MySQL and either a local OpenSearch (--es-host) or a stub that
+accepts every bulk write. Start a local MySQL first, then run from
+lambdas/taxon-indexing:
+
+    docker run --rm -d -p 3306:3306 -e MYSQL_ALLOW_EMPTY_PASSWORD=yes mysql:8.0
+    python -m benchmark.index_taxons --taxa 1000 20000 60000
+
+The database is re-seeded for each --taxa scale, then the lambda is invoked
+--repeat times in one process, like a warm container. --event adds event options,
+e.g. --event '{"zscore_computation": "python"}'.
+
+Prints a JSON report for each scale. It has the medians of the `metrics` the
+lambda returns (see chalicelib/metrics.py): the total time, docs/sec, the time of
+each phase and the bulk request latencies. It also has the peak memory traced
+during one more invocation.
+"""
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import tracemalloc
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark import seed
+from chalicelib import bulk
+
+SCORED_TAXON_COUNTS_INDEX_NAME = "benchmark_scored_taxon_counts"
+PIPELINE_RUNS_INDEX_NAME = "benchmark_pipeline_runs"
+SHARDS = {"total": 1, "successful": 1, "failed": 0}
+
+
+class StubOpenSearchHandler(BaseHTTPRequestHandler):
+    """
+    Answers _bulk requests as if every item was written, and anything else
+    (e.g. _refresh) with an empty success. The content_hash of each written
+    document is kept, and a search returns all of an index's documents whatever
+    the query, so re-indexing the same runs with index_mode=diff skips them.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # {index: {_id: content_hash}}
+    documents = defaultdict(dict)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0]
+        if path.endswith("/_bulk"):
+            response = {"took": 0, "errors": False, "items": self.bulk(body)}
+        elif path.endswith("/_search"):
+            index = path.strip("/").split("/")[0]
+            hits = [
+                {"_id": es_id, "_source": {"content_hash": content_hash}}
+                for es_id, content_hash in self.documents[index].items()
+            ]
+            response = {"_scroll_id": "stub", "_shards": SHARDS, "hits": {"hits": hits}}
+        elif path.endswith("/_search/scroll"):
+            response = {"_scroll_id": "stub", "_shards": SHARDS, "hits": {"hits": []}}
+        else:
+            response = {"_shards": SHARDS}
+        self.respond(response)
+
+    do_PUT = do_POST
+    do_DELETE = do_POST
+
+    def do_GET(self):
+        self.respond({})
+
+    def bulk(self, body):
+        items = []
+        for action, source in bulk.split_bulk_body(body):
+            op_type, action = next(iter(json.loads(action).items()))
+            documents = self.documents[action["_index"]]
+            if op_type == "delete":
+                documents.pop(action["_id"], None)
+            elif op_type == "index":
+                documents[action["_id"]] = json.loads(source).get("content_hash")
+            items.append({op_type: {"_id": action["_id"], "status": 200}})
+        return items
+
+    def respond(self, response):
+        payload = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_opensearch():
+    """
+    Serve StubOpenSearchHandler on a free local port, return its URL
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenSearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://{}:{}".format(*server.server_address)
+
+
+def invoke(app, event):
+    """
+    Run the handler once, return the metrics of its response
+    """
+    # keep the metric records the lambda prints out of the report
+    with contextlib.redirect_stdout(sys.stderr):
+        response = app.handler(event, None)
+    if not response["success"]:
+        raise RuntimeError(f"index_taxons failed: {json.dumps(response)}")
+    return response["metrics"]
+
+
+def median(invocations, *keys):
+    """
+    The median of one value of the invocations' metrics, 0 where it is missing
+    """
+    values = []
+    for value in invocations:
+        for key in keys:
+            value = (value or {}).get(key)
+        values.append(value or 0)
+    return round(statistics.median(values), 1)
+
+
+def measure_scale(app, event, repeat):
+    """
+    Invoke the handler --repeat times, then once more with tracemalloc on
+    """
+    from chalicelib import lineages, summaries
+
+    # caches are keyed by background_id and lineage_version, which the re-seeded
+    # tables reuse, so start each scale from a cold container
+    lineages._cache = None
+    summaries._cache = None
+
+    invocations = [invoke(app, event) for _ in range(repeat)]
+    tracemalloc.start()
+    invoke(app, event)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    phases = sorted({phase for invocation in invocations for phase in invocation["phases_ms"]})
+    return {
+        "documents": invocations[0]["documents"],
+        "rows": invocations[0]["rows"],
+        "first_total_ms": invocations[0]["total_ms"],
+        "total_ms": median(invocations, "total_ms"),
+        "docs_per_second": median(invocations, "docs_per_second"),
+        "phases_ms": {phase: median(invocations, "phases_ms", phase) for phase in phases},
+        "bulk_requests": median(invocations, "bulk_requests"),
+        "bulk_mb": round(median(invocations, "bulk_bytes") / 1024 / 1024, 2),
+        "bulk_latency_ms": {
+            stat: median(invocations, "bulk_latency_ms", stat) for stat in ("p50", "p95", "max")
+        },
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+        # ru_maxrss is in KB on Linux, and never goes down within the process
+        "process_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=seed.LAMBDA_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    seed.add_mysql_arguments(parser)
+    parser.add_argument(
+        "--taxa", type=int, nargs="+", default=[1000, 20000, 60000], help="taxa per run and count type"
+    )
+    parser.add_argument("--runs", type=int, default=1, help="runs indexed by each invocation")
+    parser.add_argument("--backgrounds", type=int, default=2)
+    parser.add_argument("--lineage-versions", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--event", type=json.loads, default={}, help="extra event options, as JSON")
+    parser.add_argument("--es-host", help="a local OpenSearch, e.g. http://localhost:9200; a stub by default")
+    parser.add_argument("--output", help="write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    es_host = args.es_host or start_stub_opensearch()
+    os.environ.update(
+        {
+            "LOCAL_MODE": "1",
+            "DEPLOYMENT_ENVIRONMENT": os.environ.get("DEPLOYMENT_ENVIRONMENT", "test"),
+            "MYSQL_HOST": args.host,
+            "MYSQL_PORT": str(args.port),
+            "MYSQL_USERNAME": args.user,
+            "MYSQL_PASSWORD": args.password,
+            "MYSQL_DB": args.database,
+            "ES_HOST": es_host,
+        }
+    )
+    # app reads its parameters and builds the OpenSearch client on import
+    app = importlib.import_module("app")
+
+    if args.runs == 1:
+        runs = {"pipeline_run_id": 1, "background_id": 1}
+    else:
+        runs = {
+            "runs": [
+                {"pipeline_run_id": run, "background_id": 1 + run % args.backgrounds}
+                for run in range(1, args.runs + 1)
+            ]
+        }
+    event = {
+        **runs,
+        "scored_taxon_counts_index_name": SCORED_TAXON_COUNTS_INDEX_NAME,
+        "pipeline_runs_index_name": PIPELINE_RUNS_INDEX_NAME,
+        **args.event,
+    }
+
+    report = {
+        "commit": git_commit(),
+        "es": "stub" if not args.es_host else args.es_host,
+        "runs": args.runs,
+        "event_options": args.event,
+        "scales": [],
+    }
+    conn = seed.connect(args)
+    for taxa in args.taxa:
+        with conn.cursor() as cursor:
+            seed.seed(cursor, taxa, args.runs, args.backgrounds, args.lineage_versions)
+        report["scales"].append({"taxa": taxa, **measure_scale(app, event, args.repeat)})
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
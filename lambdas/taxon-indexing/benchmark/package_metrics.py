@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Compare packaging a synthetic run into ES bulk bodies from dict rows (SSDictCursor,
+package_metrics) and from tuple rows (SSCursor, package_metric_tuples). Both are
+fed in 1000-row fetches like index_taxons does, and the bodies are built with
+bulk.batch_es_index_bodies. Run from lambdas/taxon-indexing:
+
+    python -m benchmark.package_metrics --rows 60000
+
+Prints a JSON report for each implementation. It has the best CPU time of --repeat
+runs and the peak memory traced while packaging.
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from chalicelib import bulk
+from chalicelib.packaging import package_metric_tuples, package_metrics
+
+# the column order of queries.get_scored_taxon_counts_for_runs_query with contig counts
+COLUMNS = [
+    "pipeline_run_id", "tax_id", "count_type", "tax_level", "genus_taxid", "family_taxid",
+    "is_phage", "counts", "percent_identity", "alignment_length", "e_value", "rpm",
+    "superkingdom_taxid", "name", "genus_name", "common_name", "contigs", "background_id",
+    "created_at", "stdev", "mean", "stdev_mass_normalized", "mean_mass_normalized", "zscore",
+]
+COUNT_TYPES = ["NT", "NR", "merged_NT_NR"]
+FETCH_SIZE = 1000
+
+
+def synthetic_rows(row_count):
+    """
+    Rows of one pipeline run, sorted like the scored taxon counts query, with three
+    count types per taxon
+    """
+    rng = random.Random(0)
+    rows = []
+    for index in range(row_count):
+        tax_id = index // len(COUNT_TYPES)
+        rows.append((
+            1, tax_id, COUNT_TYPES[index % len(COUNT_TYPES)], 1, tax_id // 10, tax_id // 100,
+            0, rng.randint(1, 100000), rng.random() * 100, rng.random() * 150, rng.random(),
+            rng.random() * 1000, 2, f"taxon {tax_id}", f"genus {tax_id // 10}", "", rng.randint(0, 5),
+            7, None, rng.random() * 10, rng.random() * 100, None, None, rng.random() * 200 - 100,
+        ))
+    return rows
+
+
+def fetched(rows, as_dicts):
+    """
+    Yield the rows the way a cursor's fetchmany loop does; dict rows are built per
+    fetch like pymysql's DictCursorMixin._conv_row
+    """
+    for start in range(0, len(rows), FETCH_SIZE):
+        batch = rows[start:start + FETCH_SIZE]
+        if as_dicts:
+            batch = [dict(zip(COLUMNS, row)) for row in batch]
+        yield from batch
+
+
+def package_dicts(rows):
+    return package_metrics(fetched(rows, as_dicts=True))
+
+
+def package_tuples(rows):
+    return package_metric_tuples(fetched(rows, as_dicts=False), COLUMNS)
+
+
+def measure(package, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        size = sum(len(body) for body in bulk.batch_es_index_bodies(package(rows), "scored_taxon_counts"))
+        timings.append(time.process_time() - start)
+    # packaging alone, without the bulk bodies, which are the same size either way
+    tracemalloc.start()
+    for _ in package(rows):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "best_cpu_seconds": round(min(timings), 4),
+        "packaging_peak_traced_kb": peak // 1024,
+        "body_bytes": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=60000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    report = {
+        "rows": args.rows,
+        "dict_rows": measure(package_dicts, rows, args.repeat),
+        "tuple_rows": measure(package_tuples, rows, args.repeat),
+    }
+    report["cpu_speedup"] = round(
+        report["dict_rows"]["best_cpu_seconds"] / report["tuple_rows"]["best_cpu_seconds"], 2
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+-- The subset of the web app's schema read by chalicelib/queries.py, with the
+-- indexes the web app already has on these tables but none of the ones in
+-- ../recommended_indexes.sql. Used by the benchmarks against a throwaway database.
+
+DROP TABLE IF EXISTS taxon_counts;
+CREATE TABLE taxon_counts (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    pipeline_run_id BIGINT,
+    tax_id INT,
+    count_type VARCHAR(255),
+    tax_level INT,
+    genus_taxid INT NOT NULL DEFAULT -200,
+    family_taxid INT NOT NULL DEFAULT -300,
+    superkingdom_taxid INT,
+    is_phage TINYINT(1) NOT NULL DEFAULT 0,
+    `count` INT,
+    percent_identity FLOAT,
+    alignment_length FLOAT,
+    e_value FLOAT,
+    rpm FLOAT,
+    bpm FLOAT,
+    name VARCHAR(255),
+    UNIQUE KEY index_taxon_counts (pipeline_run_id, tax_id, count_type, tax_level)
+);
+
+DROP TABLE IF EXISTS pipeline_runs;
+CREATE TABLE pipeline_runs (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    total_ercc_reads INT,
+    technology VARCHAR(255) NOT NULL DEFAULT 'Illumina',
+    alignment_config_id BIGINT
+);
+
+DROP TABLE IF EXISTS alignment_configs;
+CREATE TABLE alignment_configs (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    lineage_version SMALLINT
+);
+
+DROP TABLE IF EXISTS taxon_lineages;
+CREATE TABLE taxon_lineages (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    taxid INT NOT NULL,
+    version_start SMALLINT NOT NULL,
+    version_end SMALLINT NOT NULL,
+    genus_name VARCHAR(255) NOT NULL DEFAULT '',
+    family_common_name VARCHAR(255) NOT NULL DEFAULT ''
+);
+
+DROP TABLE IF EXISTS taxon_summaries;
+CREATE TABLE taxon_summaries (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    background_id BIGINT,
+    tax_id INT,
+    count_type VARCHAR(255),
+    tax_level INT,
+    mean FLOAT,
+    stdev FLOAT,
+    mean_mass_normalized FLOAT,
+    stdev_mass_normalized FLOAT
+);
+
+DROP TABLE IF EXISTS contigs;
+CREATE TABLE contigs (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    pipeline_run_id BIGINT,
+    species_taxid_nt INT,
+    species_taxid_nr INT,
+    species_taxid_merged_nt_nr INT,
+    genus_taxid_nt INT,
+    genus_taxid_nr INT,
+    genus_taxid_merged_nt_nr INT,
+    lineage_json TEXT,
+    KEY index_contigs_on_pipeline_run_id (pipeline_run_id)
+);
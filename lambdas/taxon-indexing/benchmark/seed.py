@@ -0,0 +1,137 @@
+"""
+Synthetic data for the benchmarks: a throwaway database with the subset of the web
+app's schema in schema.sql, filled with generated runs, backgrounds and lineages.
+"""
+
+import os
+import random
+
+import pymysql
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COUNT_TYPES = ["NT", "NR"]
+INSERT_CHUNK_SIZE = 5000
+
+
+def add_mysql_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument(
+        "--database",
+        default="taxon_indexing_benchmark",
+        help="created if missing; its tables are dropped and re-created",
+    )
+
+
+def connect(args):
+    """
+    Connect to the server given by add_mysql_arguments, creating the database
+    """
+    conn = pymysql.connect(
+        host=args.host,
+        port=args.port,
+        user=args.user,
+        password=args.password,
+        autocommit=True,
+        cursorclass=pymysql.cursors.DictCursor,
+    )
+    with conn.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}`")
+        cursor.execute(f"USE `{args.database}`")
+    return conn
+
+
+def read_statements(path):
+    """
+    Split a .sql file into statements, dropping comment lines
+    """
+    with open(path) as f:
+        lines = [line for line in f if not line.lstrip().startswith("--")]
+    return [statement.strip() for statement in "".join(lines).split(";") if statement.strip()]
+
+
+def run_statements(cursor, filename):
+    """
+    Run the statements of a .sql file relative to lambdas/taxon-indexing
+    """
+    for statement in read_statements(os.path.join(LAMBDA_DIR, filename)):
+        cursor.execute(statement)
+
+
+def insert_rows(cursor, table, columns, rows):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        cursor.executemany(sql, rows[start:start + INSERT_CHUNK_SIZE])
+
+
+def seed(cursor, taxa, runs, backgrounds, lineage_versions):
+    """
+    Re-create the benchmark schema and fill it: every run has taxon_counts for `taxa`
+    taxa per count type, every background has summaries for all of them and every
+    taxon has one lineage row per lineage version
+    """
+    rng = random.Random(0)
+    tax_ids = range(1, taxa + 1)
+
+    run_statements(cursor, os.path.join("benchmark", "schema.sql"))
+    insert_rows(cursor, "alignment_configs", ["id", "lineage_version"], [(1, lineage_versions)])
+    insert_rows(
+        cursor,
+        "pipeline_runs",
+        ["id", "total_ercc_reads", "technology", "alignment_config_id"],
+        [(run, rng.randint(0, 1000), "Illumina", 1) for run in range(1, runs + 1)],
+    )
+    insert_rows(
+        cursor,
+        "taxon_lineages",
+        ["taxid", "version_start", "version_end", "genus_name", "family_common_name"],
+        [
+            (tax_id, version, version, f"genus {tax_id // 10}", f"family {tax_id // 100}")
+            for tax_id in tax_ids
+            for version in range(1, lineage_versions + 1)
+        ],
+    )
+    insert_rows(
+        cursor,
+        "taxon_summaries",
+        [
+            "background_id", "tax_id", "count_type", "tax_level",
+            "mean", "stdev", "mean_mass_normalized", "stdev_mass_normalized",
+        ],
+        [
+            (background, tax_id, count_type, 1 + (tax_id % 10 == 0),
+             rng.random() * 100, rng.random() * 10 + 1, None, None)
+            for background in range(1, backgrounds + 1)
+            for tax_id in tax_ids
+            for count_type in COUNT_TYPES
+        ],
+    )
+    for run in range(1, runs + 1):
+        insert_rows(
+            cursor,
+            "taxon_counts",
+            [
+                "pipeline_run_id", "tax_id", "count_type", "tax_level", "genus_taxid",
+                "count", "percent_identity", "alignment_length", "e_value", "rpm", "bpm", "name",
+            ],
+            [
+                (run, tax_id, count_type, 1 + (tax_id % 10 == 0), tax_id // 10,
+                 rng.randint(1, 10000), rng.random() * 100, rng.random() * 150,
+                 rng.random(), rng.random() * 1000, rng.random() * 1000, f"taxon {tax_id}")
+                for tax_id in tax_ids
+                for count_type in COUNT_TYPES
+            ],
+        )
+        insert_rows(
+            cursor,
+            "contigs",
+            ["pipeline_run_id", "species_taxid_nt", "species_taxid_nr", "genus_taxid_nt", "lineage_json"],
+            [
+                (run, tax_id, tax_id, tax_id // 10, '{"taxid": 1}')
+                for tax_id in rng.sample(tax_ids, taxa // 10)
+            ],
+        )
+    cursor.execute("ANALYZE TABLE taxon_counts, taxon_lineages, taxon_summaries, contigs")
+    cursor.fetchall()
@@ -0,0 +1,277 @@
+# type: ignore
+
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from opensearchpy.exceptions import TransportError
+
+from chalicelib.sentry_init import capture_exception
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+logger = logging.getLogger()
+
+DEFAULT_BATCHSIZE = 1000
+# AWS recommends 5-15MB bulk requests; much larger requests time out on the
+# small heatmap domain long before they hit http.max_content_length
+DEFAULT_BATCH_SIZE_MB = 10
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_INITIAL_BACKOFF = 2
+MAX_BACKOFF = 60
+
+# statuses that mean "the cluster is busy, try again later" rather than
+# "this document is bad". They are retried per item instead of failing the run.
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class BulkIndexError(Exception):
+    pass
+
+
+def dumps(document):
+    """
+    Serialize a document to compact JSON bytes
+    """
+    if orjson:
+        return orjson.dumps(document)
+    return json.dumps(document, separators=(",", ":")).encode("utf-8")
+
+
+def document_id(taxon_metrics):
+    """
+    The _id of a scored_taxon_counts document:
+    {tax_id}_{tax_level}_{pipeline_run_id}_{background_id}
+    """
+    return (
+        f'{taxon_metrics["tax_id"]}'
+        f'_{taxon_metrics["tax_level"]}'
+        f'_{taxon_metrics["pipeline_run_id"]}'
+        f'_{taxon_metrics["background_id"]}'
+    )
+
+
+def batch_es_index_bodies(
+    taxon_metrics_list,
+    index_name,
+    batchsize=DEFAULT_BATCHSIZE,
+    batch_size_mb=DEFAULT_BATCH_SIZE_MB,
+):
+    """
+    Batch taxons for more efficient ES bulk writes. A batch is cut once it
+    holds `batchsize` taxons or reaches `batch_size_mb`, whichever is first,
+    so a run with unusually large metric_lists still makes moderate requests.
+    Bodies are yielded as bytes, ready to hand to es_client.bulk.
+    """
+    max_bytes = batch_size_mb * 1024 * 1024
+    count = 0
+    size = 0
+    bulk_body = []
+    for taxon_metrics in taxon_metrics_list:
+        action = dumps({"index": {"_index": index_name, "_id": document_id(taxon_metrics)}})
+        source = dumps(taxon_metrics)
+        bulk_body += (action, b"\n", source, b"\n")
+        count += 1
+        size += len(action) + len(source) + 2
+        if count == batchsize or size >= max_bytes:
+            yield b"".join(bulk_body)
+            bulk_body = []
+            count = 0
+            size = 0
+    yield b"".join(bulk_body)
+
+
+def batch_es_delete_bodies(es_ids, index_name, batchsize=DEFAULT_BATCHSIZE):
+    """
+    Batch delete actions for the given document ids into bulk bodies
+    """
+    bulk_body = []
+    for es_id in es_ids:
+        bulk_body += (dumps({"delete": {"_index": index_name, "_id": es_id}}), b"\n")
+        if len(bulk_body) == 2 * batchsize:
+            yield b"".join(bulk_body)
+            bulk_body = []
+    if bulk_body:
+        yield b"".join(bulk_body)
+
+
+def split_bulk_body(body):
+    """
+    Split a newline-delimited bulk body into (action, source) line pairs; the
+    source of a delete action is None. The pairs are in request order, so they
+    line up with the response items.
+    """
+    lines = iter([line for line in body.split(b"\n") if line.strip()])
+    return [
+        (action, None if action.startswith(b'{"delete"') else next(lines))
+        for action in lines
+    ]
+
+
+def join_bulk_body(actions):
+    """
+    Inverse of split_bulk_body
+    """
+    return b"".join(
+        action + b"\n" + (source + b"\n" if source is not None else b"")
+        for action, source in actions
+    )
+
+
+def bulk_index(
+    es_client,
+    body,
+    max_retries=DEFAULT_MAX_RETRIES,
+    initial_backoff=DEFAULT_INITIAL_BACKOFF,
+    raise_on_error=True,
+    refresh=None,
+):
+    """
+    Write a single bulk body to ES. Items rejected with a retryable status
+    (e.g. 429 when the write queue is full) are resent on their own with
+    exponential backoff; any other item error fails the batch.
+    With raise_on_error=False failures are returned instead of raised, as
+    {"_id": ..., "error": ...} entries, so the caller can tell which
+    documents did not make it.
+    Return a dict with the number of retried items, the failed items, and the
+    duration of each request and the bytes sent, for the invocation metrics.
+    """
+    result = {"retried": 0, "errors": [], "request_seconds": [], "bytes": 0}
+    if not body:
+        return result
+
+    actions = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(min(initial_backoff * 2 ** (attempt - 1), MAX_BACKOFF))
+            body = join_bulk_body(actions)
+            result["retried"] += len(actions)
+
+        result["bytes"] += len(body)
+        start = time.perf_counter()
+        try:
+            response = es_client.bulk(body, refresh=refresh)
+        except TransportError as exc:
+            result["request_seconds"].append(time.perf_counter() - start)
+            # the whole request was rejected, retry all of it
+            if exc.status_code in RETRYABLE_STATUSES and attempt < max_retries:
+                logger.warning("Bulk request rejected (%s), retrying", exc.status_code)
+                actions = actions or split_bulk_body(body)
+                continue
+            if raise_on_error:
+                raise
+            capture_exception(exc)
+            result["errors"] = [
+                {"_id": _action_id(action), "error": str(exc)}
+                for action, _ in actions or split_bulk_body(body)
+            ]
+            return result
+
+        result["request_seconds"].append(time.perf_counter() - start)
+        if not response["errors"]:
+            logger.info(
+                "Bulk write of %s items took %sms",
+                len(response["items"]),
+                response.get("took"),
+            )
+            return result
+
+        actions = actions or split_bulk_body(body)
+        retryable_actions = []
+        errors = []
+        for action, item in zip(actions, response["items"]):
+            item_result = next(iter(item.values()))
+            if "error" not in item_result:
+                continue
+            errors.append(item_result)
+            if item_result.get("status") in RETRYABLE_STATUSES:
+                retryable_actions.append(action)
+
+        if len(retryable_actions) == len(errors) and attempt < max_retries:
+            logger.warning(
+                "Bulk write rejected %s items, retrying them", len(retryable_actions)
+            )
+            actions = retryable_actions
+            continue
+
+        # report a non-retryable error if there is one, it is the interesting one
+        errors.sort(key=lambda item_result: item_result.get("status") in RETRYABLE_STATUSES)
+        logger.info(response)
+        exc = BulkIndexError(
+            f"Bulk write failed {len(errors)} times. Error example: ",
+            json.dumps(errors[0]["error"]),
+        )
+        # Surface this operational failure to Sentry explicitly (it is only
+        # otherwise logged/raised); AwsLambdaIntegration also captures it at
+        # the handler boundary, but capturing here attaches the ES error.
+        capture_exception(exc)
+        if raise_on_error:
+            raise exc
+        result["errors"] = [
+            {"_id": item_result.get("_id"), "error": item_result["error"]}
+            for item_result in errors
+        ]
+        return result
+
+
+def parallel_bulk_index(
+    es_client,
+    bodies,
+    concurrency=DEFAULT_CONCURRENCY,
+    max_retries=DEFAULT_MAX_RETRIES,
+    initial_backoff=DEFAULT_INITIAL_BACKOFF,
+    raise_on_error=True,
+    refresh=None,
+):
+    """
+    Write bulk bodies to ES with up to `concurrency` requests in flight.
+    `bodies` is only advanced while there is a free slot, so a generator
+    backed by an unbuffered MySQL cursor is read no faster than ES accepts
+    the writes. Unless raise_on_error=False, the first failed batch cancels
+    the rest and is re-raised.
+    Return the combined bulk_index results of all batches.
+    """
+    result = {"retried": 0, "errors": [], "request_seconds": [], "bytes": 0}
+
+    def collect(futures):
+        for future in futures:
+            batch_result = future.result()
+            for key in result:
+                result[key] += batch_result[key]
+
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for body in bodies:
+                if len(in_flight) >= concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(
+                    executor.submit(
+                        bulk_index,
+                        es_client,
+                        body,
+                        max_retries,
+                        initial_backoff,
+                        raise_on_error,
+                        refresh,
+                    )
+                )
+            collect(in_flight)
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+    return result
+
+
+def _action_id(action):
+    """
+    Return the _id of a bulk action line
+    """
+    return next(iter(json.loads(action).values())).get("_id")
@@ -0,0 +1,75 @@
+# type: ignore
+
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+
+class LRUCache:
+    """
+    Least recently used tables by key, evicted once their combined `nbytes`
+    exceeds max_bytes. The most recently loaded table is always kept, even if
+    it alone is over budget. Empty tables are not cached, since they may be
+    data that is still being written, and are loaded again on the next get.
+
+    A table is also loaded again when get is given a different version than the
+    one it was loaded with, or once it is older than max_age seconds.
+    """
+
+    def __init__(self, name, max_bytes, max_age=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.tables = OrderedDict()
+        # key: (version, time.monotonic() when loaded)
+        self.loaded = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get(self, key, load, version=None):
+        table = self.tables.get(key)
+        if table is not None:
+            loaded_version, loaded_at = self.loaded[key]
+            if loaded_version == version and (
+                self.max_age is None or time.monotonic() - loaded_at < self.max_age
+            ):
+                self.hits += 1
+                self.tables.move_to_end(key)
+                return table
+            logger.info("Reloading %s %s, it is out of date", self.name, key)
+            self.reloads += 1
+            self.discard(key)
+        self.misses += 1
+        table = load(key)
+        if len(table):
+            self.tables[key] = table
+            self.loaded[key] = (version, time.monotonic())
+            self.nbytes += table.nbytes
+            self.evict()
+        return table
+
+    def discard(self, key):
+        table = self.tables.pop(key, None)
+        if table is not None:
+            del self.loaded[key]
+            self.nbytes -= table.nbytes
+
+    def evict(self):
+        while self.nbytes > self.max_bytes and len(self.tables) > 1:
+            key, table = self.tables.popitem(last=False)
+            del self.loaded[key]
+            self.nbytes -= table.nbytes
+            logger.info("Evicted %s %s from the cache", self.name, key)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "cached": len(self.tables),
+            "cached_mb": round(self.nbytes / (1024 * 1024), 1),
+        }
@@ -0,0 +1,99 @@
+# type: ignore
+
+import hashlib
+import json
+import logging
+
+from opensearchpy.helpers import scan
+
+from chalicelib import bulk
+
+logger = logging.getLogger()
+
+SCROLL_SIZE = 5000
+
+
+def content_hash(taxon_metrics):
+    """
+    Hash of a scored_taxon_counts document, without its content_hash field.
+    Taken over canonical JSON rather than bulk.dumps, whose bytes depend on
+    whether orjson is installed, so every build hashes a document the same way.
+    """
+    canonical = json.dumps(taxon_metrics, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_content_hashes(es_client, index_name, runs):
+    """
+    Return {_id: content_hash} of the documents already indexed for the given
+    (pipeline_run_id, background_id) pairs. Documents written without diff mode
+    have no content_hash, so they map to None and are always rewritten.
+    """
+    runs = {(pipeline_run_id, background_id) for pipeline_run_id, background_id in runs}
+    # a clause per pair hits the max_clause_count limit on large batches, so
+    # filter by terms and drop the other combinations of the two here
+    query = {
+        "_source": ["content_hash", "pipeline_run_id", "background_id"],
+        "query": {
+            "bool": {
+                "filter": [
+                    {"terms": {"pipeline_run_id": sorted({run[0] for run in runs})}},
+                    {"terms": {"background_id": sorted({run[1] for run in runs})}},
+                ]
+            }
+        },
+    }
+    return {
+        hit["_id"]: source.get("content_hash")
+        for hit in scan(
+            es_client,
+            query=query,
+            index=index_name,
+            size=SCROLL_SIZE,
+            # a run that was never indexed has no index to read yet
+            ignore_unavailable=True,
+        )
+        for source in [hit.get("_source", {})]
+        if (source.get("pipeline_run_id"), source.get("background_id")) in runs
+    }
+
+
+class DocumentDiff:
+    """
+    Compare freshly packaged documents with the content hashes already in the
+    index: only new or changed documents are passed on to be written, and the
+    documents of taxa that are gone can be deleted.
+    """
+
+    def __init__(self, existing_hashes):
+        self.existing_hashes = existing_hashes
+        self.existing = len(existing_hashes)
+        self.unchanged = 0
+
+    def changed(self, taxon_metrics_list):
+        """
+        Yield the documents whose content_hash differs from the indexed one, with
+        their new content_hash added
+        """
+        for taxon_metrics in taxon_metrics_list:
+            document_hash = content_hash(taxon_metrics)
+            if self.existing_hashes.pop(bulk.document_id(taxon_metrics), None) == document_hash:
+                self.unchanged += 1
+                continue
+            taxon_metrics["content_hash"] = document_hash
+            yield taxon_metrics
+
+    def removed_ids(self):
+        """
+        Yield the ids of indexed documents that changed() was not given. This is
+        only complete once changed() is exhausted, so chain the deletes after the
+        index bodies.
+        """
+        yield from list(self.existing_hashes)
+
+    def stats(self):
+        return {
+            "existing": self.existing,
+            "unchanged": self.unchanged,
+            "removed": len(self.existing_hashes),
+        }
@@ -0,0 +1,154 @@
+# type: ignore
+
+import io
+import logging
+import os
+from urllib.parse import urlparse
+
+import boto3
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional, see requirements-export.txt
+    pyarrow = None
+
+logger = logging.getLogger()
+
+# e.g. s3://bucket/scored_taxon_counts or a local directory; when set, every
+# invocation exports its runs there (an event's export_uri takes precedence)
+EXPORT_URI = os.environ.get("SCORED_TAXON_COUNTS_EXPORT_URI")
+FILENAME = "scored_taxon_counts.parquet"
+# Runs are partitioned by these fields, in this order. As usual for Hive-style
+# partitions they are only in the paths, not in the files.
+PARTITION_FIELDS = [
+    ("background_id", "int64"),
+    ("pipeline_run_id", "int64"),
+]
+# The other fields of a packaged document (see packaging.package_metrics) and their
+# arrow types. Every field is nullable, like the MySQL columns they come from.
+TAXON_FIELDS = [
+    ("tax_id", "int64"),
+    ("tax_level", "int32"),
+    ("genus_taxid", "int64"),
+    ("family_taxid", "int64"),
+    ("superkingdom_taxid", "int64"),
+    ("name", "string"),
+    ("common_name", "string"),
+    ("genus_name", "string"),
+    ("is_phage", "int8"),
+]
+METRIC_FIELDS = [
+    ("count_type", "string"),
+    ("counts", "int64"),
+    ("stdev", "double"),
+    ("mean", "double"),
+    ("stdev_mass_normalized", "double"),
+    ("mean_mass_normalized", "double"),
+    ("percent_identity", "double"),
+    ("e_value", "double"),
+    ("rpm", "double"),
+    ("zscore", "double"),
+    ("alignment_length", "double"),
+    ("contigs", "int64"),
+]
+
+# Kept across invocations of a warm Lambda container, see mysql._connection
+_s3 = None
+
+
+def _fields(fields):
+    return [pyarrow.field(name, pyarrow.type_for_alias(alias)) for name, alias in fields]
+
+
+def schema():
+    """
+    The arrow schema of an exported file: one row per taxon, with its
+    per-count_type metrics in a list of structs like the ES documents
+    """
+    return pyarrow.schema(
+        _fields(TAXON_FIELDS)
+        + [pyarrow.field("metric_list", pyarrow.list_(pyarrow.struct(_fields(METRIC_FIELDS))))]
+    )
+
+
+def partitioning():
+    """
+    The partitioning to read an export with, e.g.
+    pyarrow.dataset.dataset(uri, partitioning=partitioning()); its fields are
+    then added back to each row
+    """
+    return pyarrow.dataset.partitioning(pyarrow.schema(_fields(PARTITION_FIELDS)), flavor="hive")
+
+
+def partition_path(pipeline_run_id, background_id):
+    """
+    The path of a run's file under the export URI, partitioned Hive-style so
+    Athena, Spark or pyarrow.dataset can prune by background and run
+    """
+    return f"background_id={int(background_id)}/pipeline_run_id={int(pipeline_run_id)}/{FILENAME}"
+
+
+def write_file(uri, path, data):
+    """
+    Write bytes to <uri>/<path>, where uri is s3://bucket/prefix or a local directory
+    """
+    global _s3
+    parsed = urlparse(uri)
+    if parsed.scheme == "s3":
+        if _s3 is None:
+            _s3 = boto3.client("s3")
+        key = f"{parsed.path.strip('/')}/{path}".lstrip("/")
+        _s3.put_object(Bucket=parsed.netloc, Key=key, Body=data)
+        return "s3://{}/{}".format(parsed.netloc, key)
+    local_path = os.path.join(parsed.path if parsed.scheme == "file" else uri, path)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with open(local_path, "wb") as f:
+        f.write(data)
+    return local_path
+
+
+class RunExporter:
+    """
+    Also write the packaged documents of each run to a Parquet file under an
+    export URI, so analytics can scan columnar files instead of paging ES.
+    Documents arrive sorted by run (see package_metrics), so only one run's
+    documents are held at a time.
+    """
+
+    def __init__(self, uri):
+        if pyarrow is None:
+            raise ImportError("export_uri needs pyarrow, see requirements-export.txt")
+        self.uri = uri
+        self.schema = schema()
+        self.files = []
+
+    def tap(self, taxon_metrics_list):
+        """
+        Yield the documents unchanged, writing each run's file once all of its
+        documents have gone by
+        """
+        run = None
+        documents = []
+        for taxon_metrics in taxon_metrics_list:
+            taxon_run = (taxon_metrics["pipeline_run_id"], taxon_metrics["background_id"])
+            if taxon_run != run:
+                if documents:
+                    self.write(run, documents)
+                run = taxon_run
+                documents = []
+            documents.append(taxon_metrics)
+            yield taxon_metrics
+        if documents:
+            self.write(run, documents)
+
+    def write(self, run, documents):
+        # fields that are not in the schema, e.g. the partition fields and diff
+        # mode's content_hash, are left out
+        table = pyarrow.Table.from_pylist(documents, schema=self.schema)
+        f = io.BytesIO()
+        pyarrow.parquet.write_table(table, f)
+        location = write_file(self.uri, partition_path(*run), f.getvalue())
+        logger.info("Exported %s taxa to %s", len(documents), location)
+        self.files.append(location)
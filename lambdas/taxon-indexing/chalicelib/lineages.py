@@ -0,0 +1,227 @@
+# type: ignore
+
+import io
+import logging
+import os
+import zipfile
+from array import array
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+import pymysql
+from botocore.exceptions import BotoCoreError, ClientError
+
+from chalicelib import mysql, queries
+from chalicelib.cache import LRUCache
+
+logger = logging.getLogger()
+
+# a lineage_version holds a few million taxids at ~16 bytes each, plus the
+# distinct names, so two or three versions fit
+DEFAULT_CACHE_MB = 128
+# e.g. s3://bucket/taxon-indexing/lineages; when set, each lineage_version's table
+# is read from (or, the first time, written to) <uri>/taxon_lineages_v<version>.npz
+# so only one container per version has to read the whole table from MySQL
+LINEAGE_CACHE_S3_URI = os.environ.get("LINEAGE_CACHE_S3_URI")
+
+# Kept across invocations of a warm Lambda container, see mysql._connection
+_cache = None
+_s3 = None
+
+
+class LineageTable:
+    """
+    The genus_name and family_common_name of every taxid in one lineage_version.
+    Taxids are kept sorted in an int64 array, with the two names as int32 codes
+    into a shared list of distinct names (code 0 is None). Genus and family names
+    repeat across many taxids, so this is a fraction of the size of a dict.
+    """
+
+    __slots__ = ("taxids", "genus_codes", "family_codes", "names")
+
+    def __init__(self, taxids, genus_codes, family_codes, names):
+        order = np.argsort(taxids, kind="stable")
+        self.taxids = taxids[order]
+        self.genus_codes = genus_codes[order]
+        self.family_codes = family_codes[order]
+        self.names = names
+
+    def __len__(self):
+        return len(self.taxids)
+
+    @property
+    def nbytes(self):
+        return (
+            self.taxids.nbytes
+            + self.genus_codes.nbytes
+            + self.family_codes.nbytes
+            + sum(len(name) + 50 for name in self.names if name is not None)
+        )
+
+    def lookup(self, taxids):
+        """
+        Return the (genus_names, family_common_names) lists of the given taxids,
+        None for taxids that are not in this lineage_version
+        """
+        if not len(self.taxids):
+            return [None] * len(taxids), [None] * len(taxids)
+        taxids = np.asarray(taxids, dtype=np.int64)
+        positions = np.searchsorted(self.taxids, taxids)
+        positions[positions == len(self.taxids)] = 0
+        found = self.taxids[positions] == taxids
+        genus_codes = np.where(found, self.genus_codes[positions], 0)
+        family_codes = np.where(found, self.family_codes[positions], 0)
+        names = self.names
+        return (
+            [names[code] for code in genus_codes.tolist()],
+            [names[code] for code in family_codes.tolist()],
+        )
+
+    def save(self, f):
+        """
+        Write the table to a file object as a compressed .npz
+        """
+        np.savez_compressed(
+            f,
+            taxids=self.taxids,
+            genus_codes=self.genus_codes,
+            family_codes=self.family_codes,
+            # names joined by NUL bytes, so the file loads without pickle
+            names=np.frombuffer("\0".join(self.names[1:]).encode("utf-8"), dtype=np.uint8),
+            name_count=np.array([len(self.names) - 1]),
+        )
+
+    @classmethod
+    def load(cls, f):
+        data = np.load(f)
+        names = [None]
+        if data["name_count"][0]:
+            names += data["names"].tobytes().decode("utf-8").split("\0")
+        return cls(data["taxids"], data["genus_codes"], data["family_codes"], names)
+
+
+def read_lineage_table(conn, lineage_version):
+    """
+    Read a lineage_version's taxon_lineages from MySQL into a LineageTable
+    """
+    taxids = array("q")
+    genus_codes = array("i")
+    family_codes = array("i")
+    codes = {None: 0}
+    with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+        mysql.execute(cursor, queries.get_taxon_lineages_query(lineage_version))
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for taxid, genus_name, family_common_name in rows:
+                taxids.append(taxid)
+                genus_codes.append(codes.setdefault(genus_name, len(codes)))
+                family_codes.append(codes.setdefault(family_common_name, len(codes)))
+    return LineageTable(
+        np.frombuffer(taxids, dtype=np.int64),
+        np.frombuffer(genus_codes, dtype=np.int32),
+        np.frombuffer(family_codes, dtype=np.int32),
+        list(codes),
+    )
+
+
+def load_lineage_table(conn, lineage_version):
+    """
+    Load a lineage_version's LineageTable from LINEAGE_CACHE_S3_URI when it has
+    one, otherwise read it from MySQL and store it there for the next container.
+    S3 is only a shortcut: if it cannot be read or written the table still comes
+    from MySQL. A corrupt object is not overwritten, only a missing one is written.
+    """
+    global _s3
+    if not LINEAGE_CACHE_S3_URI:
+        table = read_lineage_table(conn, lineage_version)
+    else:
+        if _s3 is None:
+            _s3 = boto3.client("s3")
+        uri = urlparse(LINEAGE_CACHE_S3_URI)
+        key = f"{uri.path.strip('/')}/taxon_lineages_v{int(lineage_version)}.npz".lstrip("/")
+        table = None
+        missing = False
+        try:
+            body = _s3.get_object(Bucket=uri.netloc, Key=key)["Body"].read()
+            table = LineageTable.load(io.BytesIO(body))
+        except ClientError as exc:
+            missing = exc.response["Error"]["Code"] == "NoSuchKey"
+            if not missing:
+                logger.warning("Could not read s3://%s/%s: %s", uri.netloc, key, exc)
+        except BotoCoreError as exc:
+            logger.warning("Could not read s3://%s/%s: %s", uri.netloc, key, exc)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as exc:
+            # a truncated or corrupt object; leave it for someone to look at
+            # rather than overwriting it from every container
+            logger.warning("Could not load s3://%s/%s: %s", uri.netloc, key, exc)
+        if table is None:
+            table = read_lineage_table(conn, lineage_version)
+            if missing and len(table):
+                f = io.BytesIO()
+                table.save(f)
+                try:
+                    _s3.put_object(Bucket=uri.netloc, Key=key, Body=f.getvalue())
+                except (ClientError, BotoCoreError) as exc:
+                    logger.warning("Could not write s3://%s/%s: %s", uri.netloc, key, exc)
+    logger.info(
+        "Loaded %s taxon_lineages of lineage_version %s (%s bytes)",
+        len(table),
+        lineage_version,
+        table.nbytes,
+    )
+    return table
+
+
+def get_lineage_tables(conn, pipeline_run_ids, cache_mb=DEFAULT_CACHE_MB):
+    """
+    Return {lineage_version: LineageTable} for the lineage_versions of the given
+    pipeline runs, loading the ones that are not cached yet. A lineage_version
+    never changes once an alignment config uses it, so the cache lives as long
+    as the warm container. Also return the cache statistics, for the lambda response.
+    """
+    global _cache
+    if _cache is None:
+        _cache = LRUCache("taxon_lineages of lineage_version", cache_mb * 1024 * 1024)
+    else:
+        _cache.max_bytes = cache_mb * 1024 * 1024
+        _cache.evict()
+    with conn.cursor() as cursor:
+        mysql.execute(cursor, queries.get_lineage_versions_query(pipeline_run_ids))
+        lineage_versions = sorted(row[0] for row in cursor.fetchall() if row[0] is not None)
+    tables = {
+        lineage_version: _cache.get(
+            lineage_version,
+            lambda lineage_version: load_lineage_table(conn, lineage_version),
+        )
+        for lineage_version in lineage_versions
+    }
+    return tables, _cache.stats()
+
+
+def add_lineages(row_batches, tables):
+    """
+    Add `genus_name` and `common_name` to each row of a taxon counts query run
+    without lineages (see queries.LINEAGE_INPUT_FIELDS), given the tables from
+    get_lineage_tables. Batches are yielded as they are completed.
+    """
+    for rows in row_batches:
+        by_version = {}
+        for row in rows:
+            by_version.setdefault(row["lineage_version"], []).append(row)
+        for lineage_version, version_rows in by_version.items():
+            table = tables.get(lineage_version)
+            if table is None:
+                # no alignment config, so the SQL join would not match either
+                for row in version_rows:
+                    row["genus_name"] = row["common_name"] = None
+                continue
+            genus_names, common_names = table.lookup(
+                [row["lineage_taxon_join_id"] for row in version_rows]
+            )
+            for row, genus_name, common_name in zip(version_rows, genus_names, common_names):
+                row["genus_name"] = genus_name
+                row["common_name"] = common_name
+        yield rows
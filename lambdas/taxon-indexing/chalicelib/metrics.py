@@ -0,0 +1,134 @@
+# type: ignore
+
+import math
+import os
+import time
+from contextlib import contextmanager
+
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+NAMESPACE = os.environ.get("POWERTOOLS_METRICS_NAMESPACE", "TaxonIndexing")
+SERVICE = "taxon-indexing"
+# the time spent outside every phase, e.g. validating the event
+OTHER_PHASE = "other"
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of numbers, None when it is empty
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class InvocationMetrics:
+    """
+    The wall time of each phase of one index_taxons invocation, plus counts of
+    rows, documents and bulk requests. Rows stream from the MySQL cursor through
+    packaging and serialization into the bulk writes, so phases nest inside each
+    other; a phase's time excludes the phases it pulls from, e.g. "packaging"
+    does not include fetching rows. Phases are only entered from the thread that
+    runs the invocation.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = {}
+        self.counts = {}
+        self.bulk_request_seconds = []
+        self._phase = OTHER_PHASE
+        self._since = self.started
+
+    def _switch(self, phase):
+        now = time.perf_counter()
+        previous = self._phase
+        self.seconds[previous] = self.seconds.get(previous, 0) + now - self._since
+        self._phase = phase
+        self._since = now
+        return previous
+
+    @contextmanager
+    def phase(self, name):
+        previous = self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def iterate(self, name, items, count=None, size=None):
+        """
+        Yield from `items`, timing the work of getting each item as phase `name`.
+        With `count`, also add up the items (or their `size`) under that name.
+        """
+        items = iter(items)
+        while True:
+            previous = self._switch(name)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self._switch(previous)
+            if count:
+                self.add(count, size(item) if size else 1)
+            yield item
+
+    def add(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_bulk_result(self, result):
+        """
+        Count the requests, bytes and retried items of a bulk.parallel_bulk_index result
+        """
+        self.bulk_request_seconds += result["request_seconds"]
+        self.add("bulk_requests", len(result["request_seconds"]))
+        self.add("bulk_bytes", result["bytes"])
+        self.add("retried_items", result["retried"])
+
+    def summary(self):
+        """
+        Return the metrics so far, for the lambda response
+        """
+        self._switch(self._phase)
+        total = time.perf_counter() - self.started
+        latencies = self.bulk_request_seconds
+        return {
+            "total_ms": round(total * 1000, 1),
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.seconds.items()},
+            **self.counts,
+            "docs_per_second": round(self.counts.get("documents", 0) / total) if total else 0,
+            "bulk_latency_ms": {
+                "p50": _ms(percentile(latencies, 50)),
+                "p95": _ms(percentile(latencies, 95)),
+                "max": _ms(max(latencies, default=None)),
+            },
+        }
+
+    def emit(self, summary, **metadata):
+        """
+        Log a summary as one CloudWatch embedded metric format record, with
+        `metadata` (e.g. the pipeline run ids) as searchable properties
+        """
+        emf = Metrics(namespace=NAMESPACE, service=SERVICE)
+        emf.add_metric(name="total_ms", unit=MetricUnit.Milliseconds, value=summary["total_ms"])
+        for phase, ms in summary["phases_ms"].items():
+            emf.add_metric(name=f"{phase}_ms", unit=MetricUnit.Milliseconds, value=ms)
+        for name in self.counts:
+            unit = MetricUnit.Bytes if name.endswith("_bytes") else MetricUnit.Count
+            emf.add_metric(name=name, unit=unit, value=summary[name])
+        emf.add_metric(
+            name="docs_per_second", unit=MetricUnit.CountPerSecond, value=summary["docs_per_second"]
+        )
+        for stat, ms in summary["bulk_latency_ms"].items():
+            if ms is not None:
+                emf.add_metric(name=f"bulk_latency_{stat}_ms", unit=MetricUnit.Milliseconds, value=ms)
+        for key, value in metadata.items():
+            emf.add_metadata(key=key, value=value)
+        emf.flush_metrics()
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
@@ -0,0 +1,110 @@
+# type: ignore
+
+import logging
+import os
+import time
+
+import pymysql
+
+logger = logging.getLogger()
+
+# Kept across invocations of a warm Lambda container, like the module-level
+# OpenSearch client in app.py, so only cold starts pay for the TLS handshake.
+_connection = None
+
+
+def connect(params):
+    """
+    Open a new MySQL connection. autocommit is on so that every query sees
+    current data: with autocommit off the first SELECT would open a
+    REPEATABLE READ snapshot that a reused connection would keep reading from.
+    """
+    if "LOCAL_MODE" in os.environ:
+        # in local mode, passing a password parameter (even None)
+        # will cause the connection to fail
+        return pymysql.connect(
+            host=params["mysql_host"],
+            port=int(params["mysql_port"]),
+            user=params["mysql_username"],
+            db=params["mysql_db"],
+            connect_timeout=10,
+            autocommit=True,
+        )
+    return pymysql.connect(
+        host=params["mysql_host"],
+        port=int(params["mysql_port"]),
+        user=params["mysql_username"],
+        passwd=params["mysql_password"],
+        db=params["mysql_db"],
+        ssl={"enable_tls": True},
+        connect_timeout=10,
+        autocommit=True,
+    )
+
+
+def get_connection(params):
+    """
+    Return the connection left open by a previous invocation if it still
+    answers a ping, otherwise open a new one. A connection to an instance
+    that has since failed over is dropped by RDS, so the ping fails and the
+    new connection resolves the endpoint to the new primary.
+    Also return how the connection was acquired, for the lambda response.
+    """
+    global _connection
+    start = time.perf_counter()
+    reused = False
+    if _connection is not None:
+        try:
+            _connection.ping(reconnect=False)
+            reused = True
+        except pymysql.err.Error as exc:
+            logger.warning("Discarding stale MySQL connection: %s", exc)
+            discard_connection()
+    if _connection is None:
+        _connection = connect(params)
+    return _connection, {
+        "reused": reused,
+        "acquire_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def discard_connection():
+    """
+    Close the kept connection, e.g. after a query failed part way through and
+    left it in an unknown state, so the next invocation opens a fresh one
+    """
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except pymysql.err.Error:
+            pass
+    _connection = None
+
+
+def execute(cursor, query, explain=False):
+    """
+    Run a (sql, args) query from chalicelib.queries, binding args as parameters.
+    With explain, the query's EXPLAIN output is logged and returned first, to
+    check from a real invocation which indexes the plan uses (see
+    recommended_indexes.sql); otherwise None is returned.
+    """
+    sql, args = query
+    plan = None
+    if explain:
+        cursor.execute(f"EXPLAIN {sql}", args)
+        rows = cursor.fetchall()
+        if rows and not isinstance(rows[0], dict):
+            # tuple cursors return plain rows
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in rows]
+        plan = [
+            {
+                column: value if isinstance(value, (int, float, str, type(None))) else str(value)
+                for column, value in row.items()
+            }
+            for row in rows
+        ]
+        logger.info("Query plan: %s", plan)
+    cursor.execute(sql, args)
+    return plan
@@ -0,0 +1,139 @@
+# type: ignore
+
+
+def package_metrics(sql_results, contig_data=None):
+    """
+    Reduce the per-counttype MySQL rows into per-taxon objects for ES.
+    When contig_data is None the contig counts are read from each row's
+    `contigs` column (see queries.get_scored_taxon_counts_query).
+    """
+    current_taxon_key = None
+    packaged_taxon = None
+    # sql_results are sorted by pipeline_run_id, background_id and tax_id,
+    # so we can just iterate through them
+    for row in sql_results:
+        taxon_key = (row["pipeline_run_id"], row["background_id"], row["tax_id"])
+        # if we're starting a new taxon, yield the previous one
+        # and then start a new one
+        if current_taxon_key and current_taxon_key != taxon_key:
+            yield packaged_taxon
+            packaged_taxon = None
+
+        # construct the metric list entry for this row
+        metric_list_entry = {
+            "count_type": row["count_type"],
+            "counts": row["counts"],
+            "stdev": row["stdev"],
+            "mean": row["mean"],
+            "stdev_mass_normalized": row["stdev_mass_normalized"],
+            "mean_mass_normalized": row["mean_mass_normalized"],
+            "percent_identity": row["percent_identity"],
+            "e_value": row["e_value"],
+            "rpm": row["rpm"],
+            "zscore": row["zscore"],
+            "alignment_length": row["alignment_length"],
+            "contigs": (
+                row["contigs"]
+                if contig_data is None
+                else contig_data.get(row["pipeline_run_id"], {})
+                .get(row["tax_id"], {})
+                .get(row["count_type"], 0)
+            ),
+        }
+        # if we're starting a new taxon, create the taxon object with the metric entry
+        if packaged_taxon is None:
+            current_taxon_key = taxon_key
+            packaged_taxon = {
+                "pipeline_run_id": row["pipeline_run_id"],
+                "tax_id": row["tax_id"],
+                "background_id": row["background_id"],
+                "tax_level": row["tax_level"],
+                "genus_taxid": row["genus_taxid"],
+                "family_taxid": row["family_taxid"],
+                "superkingdom_taxid": row["superkingdom_taxid"],
+                "name": row["name"],
+                "common_name": row["common_name"],
+                "genus_name": row["genus_name"],
+                "is_phage": row["is_phage"],
+                "metric_list": [metric_list_entry],
+            }
+        # if the taxon already exists, append the metric entry to the list
+        else:
+            packaged_taxon["metric_list"].append(metric_list_entry)
+    if packaged_taxon:
+        yield packaged_taxon
+
+
+def package_metric_tuples(sql_results, columns):
+    """
+    Fast path of package_metrics for tuple rows (e.g. from an SSCursor) that carry
+    their contig counts, given the column names in row order. Reading values by
+    column index saves the dict a dict cursor builds for every row, which is the
+    bulk of the packaging cost (see benchmark/package_metrics.py). The documents
+    are the same as package_metrics makes.
+    """
+    column = {name: index for index, name in enumerate(columns)}
+    PIPELINE_RUN_ID = column["pipeline_run_id"]
+    BACKGROUND_ID = column["background_id"]
+    TAX_ID = column["tax_id"]
+    TAX_LEVEL = column["tax_level"]
+    GENUS_TAXID = column["genus_taxid"]
+    FAMILY_TAXID = column["family_taxid"]
+    SUPERKINGDOM_TAXID = column["superkingdom_taxid"]
+    NAME = column["name"]
+    COMMON_NAME = column["common_name"]
+    GENUS_NAME = column["genus_name"]
+    IS_PHAGE = column["is_phage"]
+    COUNT_TYPE = column["count_type"]
+    COUNTS = column["counts"]
+    STDEV = column["stdev"]
+    MEAN = column["mean"]
+    STDEV_MASS_NORMALIZED = column["stdev_mass_normalized"]
+    MEAN_MASS_NORMALIZED = column["mean_mass_normalized"]
+    PERCENT_IDENTITY = column["percent_identity"]
+    E_VALUE = column["e_value"]
+    RPM = column["rpm"]
+    ZSCORE = column["zscore"]
+    ALIGNMENT_LENGTH = column["alignment_length"]
+    CONTIGS = column["contigs"]
+
+    current_taxon_key = None
+    packaged_taxon = None
+    for row in sql_results:
+        taxon_key = (row[PIPELINE_RUN_ID], row[BACKGROUND_ID], row[TAX_ID])
+        metric_list_entry = {
+            "count_type": row[COUNT_TYPE],
+            "counts": row[COUNTS],
+            "stdev": row[STDEV],
+            "mean": row[MEAN],
+            "stdev_mass_normalized": row[STDEV_MASS_NORMALIZED],
+            "mean_mass_normalized": row[MEAN_MASS_NORMALIZED],
+            "percent_identity": row[PERCENT_IDENTITY],
+            "e_value": row[E_VALUE],
+            "rpm": row[RPM],
+            "zscore": row[ZSCORE],
+            "alignment_length": row[ALIGNMENT_LENGTH],
+            "contigs": row[CONTIGS],
+        }
+        if taxon_key == current_taxon_key:
+            packaged_taxon["metric_list"].append(metric_list_entry)
+            continue
+        if packaged_taxon:
+            yield packaged_taxon
+        current_taxon_key = taxon_key
+        packaged_taxon = {
+            "pipeline_run_id": row[PIPELINE_RUN_ID],
+            "tax_id": row[TAX_ID],
+            "background_id": row[BACKGROUND_ID],
+            "tax_level": row[TAX_LEVEL],
+            "genus_taxid": row[GENUS_TAXID],
+            "family_taxid": row[FAMILY_TAXID],
+            "superkingdom_taxid": row[SUPERKINGDOM_TAXID],
+            "name": row[NAME],
+            "common_name": row[COMMON_NAME],
+            "genus_name": row[GENUS_NAME],
+            "is_phage": row[IS_PHAGE],
+            "metric_list": [metric_list_entry],
+        }
+    if packaged_taxon:
+        yield packaged_taxon
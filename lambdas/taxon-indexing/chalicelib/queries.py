@@ -2,40 +2,13 @@
 # flake8: noqa
 
 
-def get_scored_taxon_counts_query(pipeline_run_id, background_id):
-    """
-    Get the scored taxon_counts for the given pipeline/background.
-    This query was constructed by referencing the following code:
-    old taxon counts query: https://github.com/chanzuckerberg/czid-web-private/blob/8be272/app/services/top_taxons_sql_service.rb#L51-L94
-    sample report z-score computation: https://github.com/chanzuckerberg/czid-web-private/blob/8be272/app/services/pipeline_report_service.rb#L684-L741
-    """
-    return f"""
-    SELECT
-        -- fields from tables
-        taxon_counts.pipeline_run_id,
-        taxon_counts.tax_id,
-        taxon_counts.count_type,
-        taxon_counts.tax_level,
-        taxon_counts.genus_taxid,
-        taxon_counts.family_taxid,
-        taxon_counts.is_phage,
-        taxon_counts.counts,
-        taxon_counts.percent_identity,
-        taxon_counts.alignment_length,
-        taxon_counts.e_value,
-        taxon_counts.rpm,
-        taxon_counts.superkingdom_taxid,
-        taxon_counts.`name`,
-        taxon_lineages.genus_name,
-        taxon_lineages.common_name,
+# The z-score of each taxon_counts row against its background's taxon_summaries,
+# selected together with the summary statistics it uses
+SCORE_FIELDS = """
         taxon_summaries.stdev,
         taxon_summaries.mean,
         taxon_summaries.stdev_mass_normalized,
         taxon_summaries.mean_mass_normalized,
-        {background_id} AS background_id,
-        -- provided and generated fields
-        NOW() AS created_at,
-        -- computed fields
         COALESCE(
             GREATEST(
                 - 99,
@@ -69,6 +42,165 @@ def get_scored_taxon_counts_query(pipeline_run_id, background_id):
             ),
             100
         ) AS zscore
+"""
+
+# Without scores, the inputs of the z-score are selected instead, so that it can be
+# computed outside MySQL from cached summaries (see chalicelib/summaries.py)
+SCORE_INPUT_FIELDS = """
+        taxon_counts.bpm,
+        pipeline_runs.technology,
+        pipeline_runs.total_ercc_reads
+"""
+
+LINEAGE_FIELDS = """
+        taxon_lineages.genus_name,
+        taxon_lineages.common_name,
+"""
+
+# Without lineages, the lineage lookup inputs are selected instead, so that the names
+# can be found in cached lineage tables (see chalicelib/lineages.py)
+LINEAGE_INPUT_FIELDS = """
+        taxon_counts.lineage_taxon_join_id,
+        pipeline_runs.lineage_version,
+"""
+
+LINEAGES_JOIN = """
+        LEFT OUTER JOIN (
+            SELECT
+                -- returned
+                genus_name,
+                family_common_name AS common_name,
+                -- for joins
+                taxid,
+                version_start,
+                version_end
+            FROM taxon_lineages
+        ) AS taxon_lineages
+            ON taxon_counts.lineage_taxon_join_id = taxon_lineages.taxid
+            AND (taxon_lineages.version_start <= pipeline_runs.lineage_version)
+            AND (taxon_lineages.version_end >= pipeline_runs.lineage_version)
+"""
+
+SUMMARIES_JOIN = """
+        LEFT OUTER JOIN (
+            SELECT
+                -- returned
+                stdev,
+                mean,
+                stdev_mass_normalized,
+                mean_mass_normalized,
+                count_type,
+                tax_level,
+                tax_id,
+                background_id
+            FROM taxon_summaries
+            WHERE background_id IN ({placeholders})
+        ) AS taxon_summaries
+            ON runs.background_id = taxon_summaries.background_id
+            AND taxon_counts.count_type = taxon_summaries.count_type
+            AND taxon_counts.tax_level = taxon_summaries.tax_level
+            AND taxon_counts.tax_id = taxon_summaries.tax_id
+"""
+
+
+def get_scored_taxon_counts_query(
+    pipeline_run_id,
+    background_id,
+    include_contig_counts=False,
+    include_scores=True,
+    include_lineages=True,
+):
+    """
+    Get the scored taxon_counts for the given pipeline/background, as a (sql, args) pair.
+    """
+    return get_scored_taxon_counts_for_runs_query(
+        [(pipeline_run_id, background_id)],
+        include_contig_counts,
+        include_scores,
+        include_lineages,
+    )
+
+
+def get_scored_taxon_counts_for_runs_query(
+    runs, include_contig_counts=False, include_scores=True, include_lineages=True
+):
+    """
+    Get the scored taxon_counts for each of the given (pipeline_run_id, background_id)
+    pairs, ordered by pipeline_run_id, background_id and tax_id so every run's rows
+    are contiguous. A pipeline run paired with several backgrounds is scored once
+    per background.
+    This query was constructed by referencing the following code:
+    old taxon counts query: https://github.com/chanzuckerberg/czid-web-private/blob/8be272/app/services/top_taxons_sql_service.rb#L51-L94
+    sample report z-score computation: https://github.com/chanzuckerberg/czid-web-private/blob/8be272/app/services/pipeline_report_service.rb#L684-L741
+
+    With include_contig_counts, each row also carries a `contigs` column holding the
+    number of contigs for its pipeline_run_id/tax_id/count_type (see
+    get_contig_counts_subquery), so the caller does not need to scan and aggregate
+    the contigs table separately.
+
+    Without include_scores, taxon_summaries is not joined at all: the rows carry the
+    z-score inputs (SCORE_INPUT_FIELDS) instead of `zscore` and the summary statistics,
+    and summaries.score_rows fills those in. Likewise without include_lineages,
+    taxon_lineages is not joined and lineages.add_lineages fills in `genus_name` and
+    `common_name` from LINEAGE_INPUT_FIELDS.
+
+    Like every query in this module, it is returned as a (sql, args) pair for
+    mysql.execute: ids are bound as %s parameters rather than interpolated, so the
+    statement text only depends on the number of runs.
+    """
+    pipeline_run_ids = sorted({int(run[0]) for run in runs})
+    background_ids = sorted({int(run[1]) for run in runs})
+    runs_table = " UNION ALL ".join(
+        ["SELECT %s AS pipeline_run_id, %s AS background_id"] * len(runs)
+    )
+    # args in the order their placeholders appear in the statement
+    args = [*pipeline_run_ids, *(int(id) for run in runs for id in run)]
+    lineage_fields = LINEAGE_FIELDS if include_lineages else LINEAGE_INPUT_FIELDS
+    lineages_join = LINEAGES_JOIN if include_lineages else ""
+    score_fields = SCORE_INPUT_FIELDS
+    summaries_join = ""
+    if include_scores:
+        score_fields = SCORE_FIELDS
+        summaries_join = SUMMARIES_JOIN.format(placeholders=_placeholders(background_ids))
+        args += background_ids
+    contigs_field = (
+        "COALESCE(contig_counts.contigs, 0) AS contigs," if include_contig_counts else ""
+    )
+    contigs_join = ""
+    if include_contig_counts:
+        contig_counts_sql, contig_counts_args = get_contig_counts_subquery(
+            [run[0] for run in runs]
+        )
+        contigs_join = f"""LEFT OUTER JOIN (
+            {contig_counts_sql}
+        ) AS contig_counts
+            ON taxon_counts.pipeline_run_id = contig_counts.pipeline_run_id
+            AND taxon_counts.tax_id = contig_counts.taxid
+            AND taxon_counts.count_type = contig_counts.count_type"""
+        args += contig_counts_args
+    sql = f"""
+    SELECT
+        -- fields from tables
+        taxon_counts.pipeline_run_id,
+        taxon_counts.tax_id,
+        taxon_counts.count_type,
+        taxon_counts.tax_level,
+        taxon_counts.genus_taxid,
+        taxon_counts.family_taxid,
+        taxon_counts.is_phage,
+        taxon_counts.counts,
+        taxon_counts.percent_identity,
+        taxon_counts.alignment_length,
+        taxon_counts.e_value,
+        taxon_counts.rpm,
+        taxon_counts.superkingdom_taxid,
+        taxon_counts.`name`,
+        {lineage_fields}
+        {contigs_field}
+        runs.background_id,
+        -- provided and generated fields
+        NOW() AS created_at,
+        {score_fields}
     FROM
         (
             SELECT
@@ -96,8 +228,10 @@ def get_scored_taxon_counts_query(pipeline_run_id, background_id):
                 END AS lineage_taxon_join_id
             FROM
                 taxon_counts
-            WHERE pipeline_run_id = '{pipeline_run_id}'
+            WHERE pipeline_run_id IN ({_placeholders(pipeline_run_ids)})
         ) AS taxon_counts
+        JOIN ({runs_table}) AS runs
+            ON taxon_counts.pipeline_run_id = runs.pipeline_run_id
         LEFT OUTER JOIN (
             SELECT
                 -- for joins
@@ -111,47 +245,75 @@ def get_scored_taxon_counts_query(pipeline_run_id, background_id):
                     ON ac.id = pr.alignment_config_id
         ) AS pipeline_runs
             ON taxon_counts.pipeline_run_id = pipeline_runs.id
-        LEFT OUTER JOIN (
-            SELECT
-                -- returned
-                genus_name,
-                family_common_name AS common_name,
-                -- for joins
-                taxid,
-                version_start,
-                version_end
-            FROM taxon_lineages
-        ) AS taxon_lineages
-            ON taxon_counts.lineage_taxon_join_id = taxon_lineages.taxid
-            AND (taxon_lineages.version_start <= pipeline_runs.lineage_version)
-            AND (taxon_lineages.version_end >= pipeline_runs.lineage_version)
-        LEFT OUTER JOIN (
-            SELECT
-                -- returned
-                stdev,
-                mean,
-                stdev_mass_normalized,
-                mean_mass_normalized,
-                count_type,
-                tax_level,
-                tax_id,
-                background_id
-            FROM taxon_summaries
-            WHERE background_id = {background_id}
-        ) AS taxon_summaries
-            ON taxon_counts.count_type = taxon_summaries.count_type
-            AND taxon_counts.tax_level = taxon_summaries.tax_level
-            AND taxon_counts.tax_id = taxon_summaries.tax_id
+        {lineages_join}
+        {summaries_join}
+        {contigs_join}
     ORDER BY
+        pipeline_run_id,
+        background_id,
         tax_id
     """
+    return sql, args
 
 
-def get_contigs_by_pipeline_run_id_query(pipeline_run_id):
+def get_contig_counts_subquery(pipeline_run_ids):
     """
-    Get all contigs for the given pipeline_run_id
+    Count the contigs for each pipeline_run_id/taxid/count_type of the given pipeline runs.
+    This is the SQL equivalent of app.package_contigs: every contig is counted once
+    for each of its species/genus taxids, under the count_type of that taxid column.
+    Cross joining against a constant 6-row table unpivots those columns in a single
+    scan of the pipeline run's contigs.
     """
-    return f"""
+    pipeline_run_ids = [int(id) for id in pipeline_run_ids]
+    sql = f"""
+    SELECT
+        pipeline_run_id,
+        taxid,
+        count_type,
+        COUNT(*) AS contigs
+    FROM
+        (
+            SELECT
+                contigs.pipeline_run_id,
+                CASE taxid_columns.n
+                    WHEN 1 THEN contigs.species_taxid_nt
+                    WHEN 2 THEN contigs.species_taxid_nr
+                    WHEN 3 THEN contigs.species_taxid_merged_nt_nr
+                    WHEN 4 THEN contigs.genus_taxid_nt
+                    WHEN 5 THEN contigs.genus_taxid_nr
+                    WHEN 6 THEN contigs.genus_taxid_merged_nt_nr
+                END AS taxid,
+                CASE taxid_columns.n
+                    WHEN 1 THEN 'NT'
+                    WHEN 2 THEN 'NR'
+                    WHEN 3 THEN 'merged_NT_NR'
+                    WHEN 4 THEN 'NT'
+                    WHEN 5 THEN 'NR'
+                    WHEN 6 THEN 'merged_NT_NR'
+                END AS count_type
+            FROM
+                contigs
+                CROSS JOIN (
+                    SELECT 1 AS n UNION ALL SELECT 2 UNION ALL SELECT 3
+                    UNION ALL SELECT 4 UNION ALL SELECT 5 UNION ALL SELECT 6
+                ) AS taxid_columns
+            WHERE contigs.pipeline_run_id IN ({_placeholders(pipeline_run_ids)}) AND lineage_json IS NOT NULL AND lineage_json != '' AND lineage_json != '{{}}'
+        ) AS contig_taxids
+    WHERE taxid IS NOT NULL AND taxid != 0
+    GROUP BY
+        pipeline_run_id,
+        taxid,
+        count_type
+    """
+    return sql, pipeline_run_ids
+
+
+def get_contigs_by_pipeline_run_ids_query(pipeline_run_ids):
+    """
+    Get all contigs for the given pipeline_run_ids
+    """
+    pipeline_run_ids = [int(id) for id in pipeline_run_ids]
+    sql = f"""
     SELECT
         pipeline_run_id,
         species_taxid_nt,
@@ -162,5 +324,88 @@ def get_contigs_by_pipeline_run_id_query(pipeline_run_id):
         genus_taxid_merged_nt_nr
     FROM
         contigs
-    WHERE pipeline_run_id = '{pipeline_run_id}' AND lineage_json IS NOT NULL AND lineage_json != '' AND lineage_json != '{{}}'
+    WHERE pipeline_run_id IN ({_placeholders(pipeline_run_ids)}) AND lineage_json IS NOT NULL AND lineage_json != '' AND lineage_json != '{{}}'
+    """
+    return sql, pipeline_run_ids
+
+
+def get_taxon_summaries_query(background_id):
+    """
+    Get the taxon_summaries statistics of a background, for summaries.load_background_summaries
+    """
+    sql = """
+    SELECT
+        tax_id,
+        tax_level,
+        count_type,
+        mean,
+        stdev,
+        mean_mass_normalized,
+        stdev_mass_normalized
+    FROM
+        taxon_summaries
+    WHERE background_id = %s
+    """
+    return sql, [int(background_id)]
+
+
+def get_taxon_summaries_versions_query(background_ids):
+    """
+    Get the number of taxon_summaries of each background and the range of their
+    ids, which changes when a background is recomputed (its rows are replaced)
+    or while it is being written. Only reads the index on background_id.
+    """
+    background_ids = [int(id) for id in background_ids]
+    sql = f"""
+    SELECT
+        background_id,
+        COUNT(*),
+        MIN(id),
+        MAX(id)
+    FROM
+        taxon_summaries
+    WHERE background_id IN ({_placeholders(background_ids)})
+    GROUP BY background_id
+    """
+    return sql, background_ids
+
+
+def get_lineage_versions_query(pipeline_run_ids):
+    """
+    Get the distinct lineage_versions used by the given pipeline runs
+    """
+    pipeline_run_ids = [int(id) for id in pipeline_run_ids]
+    sql = f"""
+    SELECT DISTINCT
+        alignment_configs.lineage_version
+    FROM
+        pipeline_runs
+        JOIN alignment_configs
+            ON alignment_configs.id = pipeline_runs.alignment_config_id
+    WHERE pipeline_runs.id IN ({_placeholders(pipeline_run_ids)})
+    """
+    return sql, pipeline_run_ids
+
+
+def get_taxon_lineages_query(lineage_version):
+    """
+    Get the genus_name and family_common_name of every taxid in a lineage_version,
+    for lineages.load_lineage_table
+    """
+    sql = """
+    SELECT
+        taxid,
+        genus_name,
+        family_common_name
+    FROM
+        taxon_lineages
+    WHERE version_start <= %s AND version_end >= %s
+    """
+    return sql, [int(lineage_version), int(lineage_version)]
+
+
+def _placeholders(values):
+    """
+    Render one %s placeholder per value, as the body of a SQL IN (...) list
     """
+    return ", ".join(["%s"] * len(values))
@@ -5,7 +5,11 @@ INPUT = {
     "$id": "http://czid.org/taxon-indexing-event.json",
     "type": "object",
     "title": "Taxon indexing event schema",
-    "required": ["pipeline_run_id", "background_id"],
+    "oneOf": [
+        {"required": ["pipeline_run_id", "background_id"]},
+        {"required": ["runs"]},
+        {"required": ["finalize_runs"]},
+    ],
     "properties": {
         "pipeline_run_id": {
             "$id": "#/properties/pipeline_run_id",
@@ -17,11 +21,164 @@ INPUT = {
             "type": "number",
             "title": "The background_id",
         },
+        "runs": {
+            "$id": "#/properties/runs",
+            "type": "array",
+            "title": "The pipeline runs to index",
+            "description": (
+                "Index several pipeline_run_id/background_id pairs in one invocation "
+                "instead of a single pipeline_run_id and background_id. The response "
+                "then reports success or failure for each run."
+            ),
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "required": ["pipeline_run_id", "background_id"],
+                "properties": {
+                    "pipeline_run_id": {"type": "number"},
+                    "background_id": {"type": "number"},
+                },
+            },
+        },
+        "finalize_runs": {
+            "$id": "#/properties/finalize_runs",
+            "type": "array",
+            "title": "The pipeline runs to mark complete",
+            "description": (
+                "Runs previously indexed with refresh_mode=deferred. The scored taxon "
+                "counts index is refreshed once and then all of these runs are marked "
+                "complete; nothing is read from MySQL."
+            ),
+            "minItems": 1,
+            "items": {"$ref": "#/properties/runs/items"},
+        },
+        "refresh_mode": {
+            "$id": "#/properties/refresh_mode",
+            "type": "string",
+            "enum": ["immediate", "wait_for", "deferred"],
+            "title": "How written documents are made searchable",
+            "description": (
+                "immediate (default) refreshes the indexes before marking the run "
+                "complete; wait_for makes each write wait for the next scheduled "
+                "refresh; deferred leaves the run incomplete for a later finalize_runs "
+                "event, so many runs can share one refresh."
+            ),
+        },
+        "index_mode": {
+            "$id": "#/properties/index_mode",
+            "type": "string",
+            "enum": ["full", "diff"],
+            "title": "Whether unchanged documents are rewritten",
+            "description": (
+                "full (default) writes every document of the runs; diff compares a "
+                "content hash of each document with the one already indexed, only "
+                "writes new or changed documents and deletes the documents of taxa "
+                "that are no longer in MySQL."
+            ),
+        },
+        "export_uri": {
+            "$id": "#/properties/export_uri",
+            "type": "string",
+            "title": "Where to also export the runs as Parquet",
+            "description": (
+                "An s3://bucket/prefix or a local directory. Each run's scored taxon "
+                "counts are also written to <export_uri>/background_id=<id>/"
+                "pipeline_run_id=<id>/scored_taxon_counts.parquet (see "
+                "chalicelib/export.py for the schema). Needs pyarrow. Defaults to the "
+                "SCORED_TAXON_COUNTS_EXPORT_URI environment variable."
+            ),
+        },
         "es_batchsize": {
             "$id": "#/properties/es_batchsize",
-            "type": "number",
+            "type": "integer",
+            "minimum": 1,
             "title": "The batchsize used for ES writes",
         },
+        "es_batch_size_mb": {
+            "$id": "#/properties/es_batch_size_mb",
+            "type": "number",
+            "exclusiveMinimum": 0,
+            "title": "The maximum payload size in MB of an ES bulk write",
+            "description": (
+                "A bulk write is sent once it reaches es_batchsize documents or "
+                "this many MB, whichever comes first."
+            ),
+        },
+        "es_bulk_concurrency": {
+            "$id": "#/properties/es_bulk_concurrency",
+            "type": "integer",
+            "minimum": 1,
+            "maximum": 10,
+            "title": "The number of concurrent ES bulk requests",
+            "description": (
+                "Bulk requests kept in flight while MySQL rows are still being read. "
+                "Capped at the OpenSearch client's default connection pool size."
+            ),
+        },
+        "contig_aggregation": {
+            "$id": "#/properties/contig_aggregation",
+            "type": "string",
+            "enum": ["sql", "python"],
+            "title": "Where contig counts are aggregated",
+            "description": (
+                "sql (default) joins per taxid/count_type contig counts into the scored "
+                "taxon counts query so documents stream to ES in a single pass; python "
+                "scans the run's contigs into an in-memory dict before the scored query."
+            ),
+        },
+        "zscore_computation": {
+            "$id": "#/properties/zscore_computation",
+            "type": "string",
+            "enum": ["sql", "python"],
+            "title": "Where z-scores are computed",
+            "description": (
+                "sql (default) joins taxon_summaries into the taxon counts query and "
+                "computes z-scores in MySQL; python loads each background's summaries "
+                "once into a cache kept by the warm lambda and computes z-scores there, "
+                "so MySQL only streams raw taxon counts."
+            ),
+        },
+        "summaries_cache_mb": {
+            "$id": "#/properties/summaries_cache_mb",
+            "type": "integer",
+            "minimum": 1,
+            "title": "Memory budget of the taxon_summaries cache",
+            "description": (
+                "With zscore_computation=python, the least recently used backgrounds "
+                "are evicted once the cached summaries exceed this many MB."
+            ),
+        },
+        "lineage_lookup": {
+            "$id": "#/properties/lineage_lookup",
+            "type": "string",
+            "enum": ["sql", "python"],
+            "title": "Where genus and family names are looked up",
+            "description": (
+                "sql (default) joins taxon_lineages by taxid and lineage_version range in "
+                "the taxon counts query; python loads each lineage_version once into a "
+                "table kept by the warm lambda (and in S3 when LINEAGE_CACHE_S3_URI is "
+                "set) and looks the names up there."
+            ),
+        },
+        "lineage_cache_mb": {
+            "$id": "#/properties/lineage_cache_mb",
+            "type": "integer",
+            "minimum": 1,
+            "title": "Memory budget of the taxon_lineages cache",
+            "description": (
+                "With lineage_lookup=python, the least recently used lineage_versions "
+                "are evicted once the cached tables exceed this many MB."
+            ),
+        },
+        "explain_queries": {
+            "$id": "#/properties/explain_queries",
+            "type": "boolean",
+            "title": "Debug mode: capture MySQL query plans",
+            "description": (
+                "Run EXPLAIN on each MySQL query before executing it; the plans are "
+                "logged and returned in the response under query_plans."
+            ),
+        },
         "scored_taxon_counts_index_name": {
             "$id": "#/properties/scored_taxon_counts_index_name",
             "type": "string",
@@ -0,0 +1,230 @@
+# type: ignore
+
+import logging
+
+import numpy as np
+import pymysql
+
+from chalicelib import mysql, queries
+from chalicelib.cache import LRUCache
+
+logger = logging.getLogger()
+
+# the lambda has 512MB; a background's summaries take ~40 bytes per
+# tax_id/tax_level/count_type, so even large backgrounds are a few MB each
+DEFAULT_CACHE_MB = 128
+# a backstop for summaries updated in place, which get_background_versions
+# cannot see
+CACHE_MAX_AGE_SECONDS = 3600
+# MySQL divides two integers into a DECIMAL with this many more decimals
+DIV_PRECISION_INCREMENT = 4
+STAT_COLUMNS = ("mean", "stdev", "mean_mass_normalized", "stdev_mass_normalized")
+
+# count_type strings are packed into the lookup keys as small integers. Codes are
+# handed out on first sight and only need to be consistent within the process.
+_count_type_codes = {}
+
+# Kept across invocations of a warm Lambda container, see mysql._connection
+_cache = None
+
+
+class BackgroundSummaries:
+    """
+    The taxon_summaries of one background as a compact table: packed
+    (tax_id, tax_level, count_type) keys in sorted order, and a matching
+    float64 row of STAT_COLUMNS for each key (NaN where MySQL has NULL)
+    """
+
+    __slots__ = ("keys", "stats")
+
+    def __init__(self, keys, stats):
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.stats = stats[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.stats.nbytes
+
+    def lookup(self, keys):
+        """
+        Return the STAT_COLUMNS rows for the given packed keys, NaN for missing keys
+        """
+        positions = np.searchsorted(self.keys, keys)
+        positions[positions == len(self.keys)] = 0
+        found = self.keys[positions] == keys if len(self.keys) else np.zeros(len(keys), bool)
+        stats = np.full((len(keys), len(STAT_COLUMNS)), np.nan)
+        stats[found] = self.stats[positions[found]]
+        return stats
+
+
+def pack_keys(tax_ids, tax_levels, count_types):
+    """
+    Pack (tax_id, tax_level, count_type) columns into one int64 key per row
+    """
+    codes = np.fromiter(
+        (_count_type_codes.setdefault(count_type, len(_count_type_codes) + 1) for count_type in count_types),
+        dtype=np.int64,
+        count=len(count_types),
+    )
+    tax_ids = np.asarray(tax_ids, dtype=np.int64)
+    tax_levels = np.asarray(tax_levels, dtype=np.int64)
+    return (tax_ids * 16 + tax_levels) * 256 + codes
+
+
+def load_background_summaries(conn, background_id):
+    """
+    Read a background's taxon_summaries into a BackgroundSummaries table
+    """
+    tax_ids, tax_levels, count_types, stats = [], [], [], []
+    with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+        mysql.execute(cursor, queries.get_taxon_summaries_query(background_id))
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for tax_id, tax_level, count_type, *row_stats in rows:
+                tax_ids.append(tax_id)
+                tax_levels.append(tax_level)
+                count_types.append(count_type)
+                stats.append(row_stats)
+    table = BackgroundSummaries(
+        pack_keys(tax_ids, tax_levels, count_types),
+        np.array(stats, dtype=np.float64).reshape(-1, len(STAT_COLUMNS)),
+    )
+    logger.info(
+        "Loaded %s taxon_summaries of background %s (%s bytes)",
+        len(table.keys),
+        background_id,
+        table.nbytes,
+    )
+    return table
+
+
+def get_background_versions(conn, background_ids):
+    """
+    Return {background_id: (count, min id, max id)} of each background's
+    taxon_summaries, which identifies the set of rows that was read
+    """
+    versions = {background_id: (0, None, None) for background_id in background_ids}
+    with conn.cursor(pymysql.cursors.Cursor) as cursor:
+        mysql.execute(cursor, queries.get_taxon_summaries_versions_query(background_ids))
+        for background_id, *version in cursor.fetchall():
+            versions[background_id] = tuple(version)
+    return versions
+
+
+def get_background_summaries(conn, background_ids, cache_mb=DEFAULT_CACHE_MB):
+    """
+    Return {background_id: BackgroundSummaries} for the given backgrounds, loading
+    the ones that are not cached yet. The cache lives as long as the warm container.
+    A cached background is loaded again when its rows changed since (see
+    get_background_versions), e.g. it was recomputed or was still being written,
+    and at least every CACHE_MAX_AGE_SECONDS. Also return the cache statistics, for
+    the lambda response.
+    """
+    global _cache
+    if _cache is None:
+        _cache = LRUCache(
+            "taxon_summaries of background", cache_mb * 1024 * 1024, CACHE_MAX_AGE_SECONDS
+        )
+    else:
+        _cache.max_bytes = cache_mb * 1024 * 1024
+        _cache.evict()
+    versions = get_background_versions(conn, background_ids)
+    tables = {
+        background_id: _cache.get(
+            background_id,
+            lambda background_id: load_background_summaries(conn, background_id),
+            versions[background_id],
+        )
+        for background_id in background_ids
+    }
+    return tables, _cache.stats()
+
+
+def mysql_divide(dividend, divisor):
+    """
+    Divide two arrays of integers the way MySQL divides INT columns: into a
+    DECIMAL with DIV_PRECISION_INCREMENT decimals, rounded half away from zero
+    """
+    scale = 10**DIV_PRECISION_INCREMENT
+    dividend = np.asarray(dividend, dtype=np.float64)
+    divisor = np.asarray(divisor, dtype=np.float64)
+    # exact while |dividend| * 2 * scale < 2**53
+    with np.errstate(divide="ignore", invalid="ignore"):
+        quotient = np.floor_divide(
+            np.abs(dividend) * 2 * scale + np.abs(divisor), 2 * np.abs(divisor)
+        )
+    return np.sign(dividend) * np.sign(divisor) * quotient / scale
+
+
+def zscores(stats, counts, rpm, bpm, technology, total_ercc_reads):
+    """
+    Vectorized equivalent of queries.SCORE_FIELDS: the z-score of each row's rpm
+    (Illumina) or bpm against the background mean and stdev, or of its ERCC
+    normalized counts when the background is mass normalized. Like MySQL, a
+    division by zero or a missing input gives no z-score, which is reported as 100,
+    and everything else is clamped to [-99, 99]. The counts (INT) divided by the
+    total ERCC reads (INT) are rounded like MySQL's DECIMAL result (mysql_divide);
+    the rest is float arithmetic, as in MySQL.
+    """
+    mean, stdev, mean_mass_normalized, stdev_mass_normalized = stats.T
+    illumina = np.asarray(technology, dtype=object) == "Illumina"
+    counts = np.asarray(counts, dtype=np.float64)
+    rpm = np.asarray(rpm, dtype=np.float64)
+    bpm = np.asarray(bpm, dtype=np.float64)
+    total_ercc_reads = np.asarray(total_ercc_reads, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zscore = np.where(
+            np.isnan(mean_mass_normalized),
+            (np.where(illumina, rpm, bpm) - mean) / stdev,
+            np.where(
+                total_ercc_reads > 0,
+                (
+                    mysql_divide(counts, np.where(illumina, total_ercc_reads, 1))
+                    - mean_mass_normalized
+                )
+                / stdev_mass_normalized,
+                np.nan,
+            ),
+        )
+    zscore[~np.isfinite(zscore)] = np.nan
+    return np.where(np.isnan(zscore), 100, np.clip(zscore, -99, 99))
+
+
+def score_rows(row_batches, tables):
+    """
+    Add the summary statistics and `zscore` of each row of the unscored taxon counts
+    query (see queries.SCORE_INPUT_FIELDS), given the background tables from
+    get_background_summaries. Rows are scored a batch at a time and yielded one by one.
+    """
+    for rows in row_batches:
+        by_background = {}
+        for row in rows:
+            by_background.setdefault(row["background_id"], []).append(row)
+        for background_id, background_rows in by_background.items():
+            stats = tables[background_id].lookup(
+                pack_keys(
+                    [row["tax_id"] for row in background_rows],
+                    [row["tax_level"] for row in background_rows],
+                    [row["count_type"] for row in background_rows],
+                )
+            )
+            scores = zscores(
+                stats,
+                [row["counts"] for row in background_rows],
+                [row["rpm"] for row in background_rows],
+                [row["bpm"] for row in background_rows],
+                [row["technology"] for row in background_rows],
+                [row["total_ercc_reads"] for row in background_rows],
+            ).tolist()
+            # NaN is not valid JSON, so missing statistics go back to None
+            stat_values = np.where(np.isnan(stats), None, stats).tolist()
+            for row, zscore, values in zip(background_rows, scores, stat_values):
+                row.update(zip(STAT_COLUMNS, values))
+                row["zscore"] = zscore
+        yield from rows
@@ -0,0 +1,35 @@
+-- Recommended composite indexes for the scored taxon counts query
+-- (chalicelib/queries.py get_scored_taxon_counts_for_runs_query).
+--
+-- The tables belong to the web app's database, so these are applied through its
+-- migrations, not by this lambda. Check `SHOW INDEX FROM <table>` first and skip
+-- any index whose leading columns an existing index already covers.
+-- `benchmark/explain_plans.py` shows the plans with and without them.
+
+-- taxon_summaries is joined on (background_id, count_type, tax_level, tax_id) for
+-- every taxon_counts row. With the four join columns leading and the four selected
+-- statistics appended, each lookup is a single covering index probe instead of a
+-- scan of the background's summaries.
+CREATE INDEX index_taxon_summaries_on_bg_count_type_level_tax_id_stats
+    ON taxon_summaries (
+        background_id,
+        count_type,
+        tax_level,
+        tax_id,
+        mean,
+        stdev,
+        mean_mass_normalized,
+        stdev_mass_normalized
+    );
+
+-- taxon_lineages is joined on taxid and a version_start/version_end range around the
+-- pipeline run's lineage_version. taxid leads so the probe is an equality lookup that
+-- range-scans the (few) versions of that taxon; the two returned names make it covering.
+CREATE INDEX index_taxon_lineages_on_taxid_version_range_names
+    ON taxon_lineages (
+        taxid,
+        version_start,
+        version_end,
+        genus_name,
+        family_common_name
+    );
@@ -0,0 +1,268 @@
+# type: ignore
+
+import json
+import threading
+
+import pytest
+from opensearchpy.exceptions import TransportError
+
+from chalicelib import bulk
+
+BODY = (
+    b'{"index":{"_index":"scored_taxon_counts","_id":"1_1_1_1"}}\n'
+    b'{"tax_id":1}\n'
+    b'{"index":{"_index":"scored_taxon_counts","_id":"2_1_1_1"}}\n'
+    b'{"tax_id":2}\n'
+)
+
+
+def taxon(tax_id, metric_count=1):
+    return {
+        "pipeline_run_id": 10,
+        "background_id": 20,
+        "tax_id": tax_id,
+        "tax_level": 1,
+        "name": "Escherichia coli",
+        "metric_list": [{"count_type": "NT", "counts": 5}] * metric_count,
+    }
+
+
+def ok(count):
+    return {
+        "errors": False,
+        "items": [{"index": {"status": 201}} for _ in range(count)],
+    }
+
+
+def item_error(status, es_id="1_1_1_1"):
+    return {
+        "index": {"_id": es_id, "status": status, "error": {"type": f"error_{status}"}}
+    }
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(mocker):
+    return mocker.patch.object(bulk.time, "sleep")
+
+
+class TestBatchEsIndexBodies:
+    def test_body_format(self):
+        (body,) = bulk.batch_es_index_bodies([taxon(1)], "scored_taxon_counts")
+
+        action, source, end = body.split(b"\n")
+        assert json.loads(action) == {
+            "index": {"_index": "scored_taxon_counts", "_id": "1_1_10_20"}
+        }
+        assert json.loads(source) == taxon(1)
+        assert end == b""
+
+    def test_batches_by_count(self):
+        bodies = list(
+            bulk.batch_es_index_bodies(
+                (taxon(tax_id) for tax_id in range(5)), "index", batchsize=2
+            )
+        )
+
+        assert [len(bulk.split_bulk_body(body)) for body in bodies] == [2, 2, 1]
+
+    def test_batches_by_size(self):
+        one_taxon_mb = len(
+            next(bulk.batch_es_index_bodies([taxon(1, 1000)], "index"))
+        ) / (1024 * 1024)
+
+        bodies = list(
+            bulk.batch_es_index_bodies(
+                (taxon(tax_id, 1000) for tax_id in range(5)),
+                "index",
+                batch_size_mb=one_taxon_mb * 1.5,
+            )
+        )
+
+        assert [len(bulk.split_bulk_body(body)) for body in bodies] == [2, 2, 1]
+
+    def test_json_fallback_matches_orjson(self, mocker):
+        with_orjson = list(bulk.batch_es_index_bodies([taxon(1)], "index"))
+        mocker.patch.object(bulk, "orjson", None)
+
+        assert list(bulk.batch_es_index_bodies([taxon(1)], "index")) == with_orjson
+
+
+class TestBatchEsDeleteBodies:
+    def test_batches_delete_actions(self):
+        bodies = list(bulk.batch_es_delete_bodies(["1_1_1_1", "2_1_1_1", "3_1_1_1"], "index", batchsize=2))
+
+        assert [len(bulk.split_bulk_body(body)) for body in bodies] == [2, 1]
+        assert json.loads(bodies[1]) == {"delete": {"_index": "index", "_id": "3_1_1_1"}}
+
+    def test_no_ids(self):
+        assert list(bulk.batch_es_delete_bodies([], "index")) == []
+
+
+class TestSplitBulkBody:
+    def test_round_trip(self):
+        actions = bulk.split_bulk_body(BODY)
+
+        assert [source for _, source in actions] == [b'{"tax_id":1}', b'{"tax_id":2}']
+        assert bulk.split_bulk_body(bulk.join_bulk_body(actions)) == actions
+
+    def test_delete_actions_have_no_source(self):
+        body = next(bulk.batch_es_delete_bodies(["3_1_1_1"], "scored_taxon_counts")) + BODY
+
+        actions = bulk.split_bulk_body(body)
+
+        assert [source for _, source in actions] == [None, b'{"tax_id":1}', b'{"tax_id":2}']
+        assert bulk.join_bulk_body(actions) == body
+
+
+class TestBulkIndex:
+    def test_empty_body(self, mocker):
+        es_client = mocker.Mock()
+
+        assert bulk.bulk_index(es_client, b"") == {
+            "retried": 0,
+            "errors": [],
+            "request_seconds": [],
+            "bytes": 0,
+        }
+        es_client.bulk.assert_not_called()
+
+    def test_success(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.return_value = ok(2)
+
+        result = bulk.bulk_index(es_client, BODY, refresh=True)
+
+        assert (result["retried"], result["errors"], result["bytes"]) == (0, [], len(BODY))
+        assert len(result["request_seconds"]) == 1
+        es_client.bulk.assert_called_once_with(BODY, refresh=True)
+
+    def test_retries_only_rejected_items(self, mocker, no_sleep):
+        es_client = mocker.Mock()
+        es_client.bulk.side_effect = [
+            {"errors": True, "items": [{"index": {"status": 201}}, item_error(429)]},
+            ok(1),
+        ]
+
+        assert bulk.bulk_index(es_client, BODY)["retried"] == 1
+        retried_body = es_client.bulk.call_args_list[1].args[0]
+        assert b'"_id":"2_1_1_1"' in retried_body
+        assert b'"_id":"1_1_1_1"' not in retried_body
+        no_sleep.assert_called_once_with(bulk.DEFAULT_INITIAL_BACKOFF)
+
+    def test_retries_rejected_request(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.side_effect = [TransportError(429, "too_many_requests"), ok(2)]
+
+        result = bulk.bulk_index(es_client, BODY)
+
+        assert result["retried"] == 2
+        assert es_client.bulk.call_count == len(result["request_seconds"]) == 2
+        assert result["bytes"] == 2 * len(BODY)
+
+    def test_raises_on_document_error(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.return_value = {
+            "errors": True,
+            "items": [item_error(429), item_error(400)],
+        }
+        capture_exception = mocker.patch.object(bulk, "capture_exception")
+
+        with pytest.raises(bulk.BulkIndexError, match="2 times") as exc_info:
+            bulk.bulk_index(es_client, BODY)
+
+        assert "error_400" in exc_info.value.args[1]
+        es_client.bulk.assert_called_once()
+        capture_exception.assert_called_once_with(exc_info.value)
+
+    def test_raises_when_retries_exhausted(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.return_value = {"errors": True, "items": [item_error(429)] * 2}
+        mocker.patch.object(bulk, "capture_exception")
+
+        with pytest.raises(bulk.BulkIndexError):
+            bulk.bulk_index(es_client, BODY, max_retries=2)
+
+        assert es_client.bulk.call_count == 3
+
+    def test_returns_document_errors(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.return_value = {
+            "errors": True,
+            "items": [{"index": {"status": 201}}, item_error(400, "2_1_1_1")],
+        }
+        mocker.patch.object(bulk, "capture_exception")
+
+        result = bulk.bulk_index(es_client, BODY, raise_on_error=False)
+
+        assert result["errors"] == [
+            {"_id": "2_1_1_1", "error": {"type": "error_400"}}
+        ]
+
+    def test_returns_rejected_request_as_errors(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.side_effect = TransportError(400, "illegal_argument")
+        mocker.patch.object(bulk, "capture_exception")
+
+        result = bulk.bulk_index(es_client, BODY, raise_on_error=False)
+
+        assert [error["_id"] for error in result["errors"]] == ["1_1_1_1", "2_1_1_1"]
+
+
+class TestParallelBulkIndex:
+    def test_writes_all_bodies(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.return_value = ok(2)
+
+        result = bulk.parallel_bulk_index(es_client, [BODY] * 10, concurrency=3)
+
+        assert (result["retried"], result["errors"], result["bytes"]) == (0, [], 10 * len(BODY))
+        assert es_client.bulk.call_count == len(result["request_seconds"]) == 10
+
+    def test_bounds_requests_in_flight(self, mocker):
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+        pulled = [0]
+
+        def slow_bulk(body, refresh=None):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            threading.Event().wait(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return ok(2)
+
+        def bodies():
+            for _ in range(20):
+                pulled[0] += 1
+                # never more than `concurrency` bodies pulled ahead of the writes
+                assert pulled[0] - es_client.bulk.call_count <= 3
+                yield BODY
+
+        es_client = mocker.Mock()
+        es_client.bulk.side_effect = slow_bulk
+
+        bulk.parallel_bulk_index(es_client, bodies(), concurrency=2)
+
+        assert es_client.bulk.call_count == 20
+        assert max_in_flight[0] <= 2
+
+    def test_propagates_failures(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.return_value = {"errors": True, "items": [item_error(400)] * 2}
+        mocker.patch.object(bulk, "capture_exception")
+
+        with pytest.raises(bulk.BulkIndexError):
+            bulk.parallel_bulk_index(es_client, [BODY] * 5, concurrency=2)
+
+    def test_collects_failures(self, mocker):
+        es_client = mocker.Mock()
+        es_client.bulk.return_value = {"errors": True, "items": [item_error(400)] * 2}
+        mocker.patch.object(bulk, "capture_exception")
+
+        result = bulk.parallel_bulk_index(
+            es_client, [BODY] * 5, concurrency=2, raise_on_error=False
+        )
+
+        assert len(result["errors"]) == 10
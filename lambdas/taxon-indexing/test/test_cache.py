@@ -0,0 +1,68 @@
+# type: ignore
+
+from chalicelib.cache import LRUCache
+
+
+class Table(list):
+    nbytes = 100
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used_by_size(self, mocker):
+        cache = LRUCache("table", max_bytes=200)
+        load = mocker.Mock(side_effect=lambda key: Table([key]))
+
+        cache.get(1, load)
+        cache.get(2, load)
+        cache.get(1, load)
+        cache.get(3, load)
+
+        assert list(cache.tables) == [1, 3]
+        assert cache.stats() == {
+            "hits": 1,
+            "misses": 3,
+            "reloads": 0,
+            "cached": 2,
+            "cached_mb": 0.0,
+        }
+
+    def test_keeps_latest_table_over_budget(self, mocker):
+        cache = LRUCache("table", max_bytes=50)
+
+        cache.get(1, mocker.Mock(return_value=Table([1])))
+
+        assert list(cache.tables) == [1]
+
+    def test_does_not_cache_empty_tables(self, mocker):
+        cache = LRUCache("table", max_bytes=1024)
+        load = mocker.Mock(return_value=Table())
+
+        cache.get(1, load)
+        cache.get(1, load)
+
+        assert load.call_count == 2
+
+    def test_reloads_other_version(self, mocker):
+        cache = LRUCache("table", max_bytes=1024)
+        load = mocker.Mock(side_effect=lambda key: Table([key]))
+
+        cache.get(1, load, version="a")
+        cache.get(1, load, version="a")
+        cache.get(1, load, version="b")
+
+        assert load.call_count == 2
+        assert cache.nbytes == 100
+        assert cache.stats()["reloads"] == 1
+
+    def test_reloads_after_max_age(self, mocker):
+        cache = LRUCache("table", max_bytes=1024, max_age=60)
+        load = mocker.Mock(side_effect=lambda key: Table([key]))
+        monotonic = mocker.patch("chalicelib.cache.time.monotonic", return_value=0)
+
+        cache.get(1, load)
+        monotonic.return_value = 30
+        cache.get(1, load)
+        monotonic.return_value = 61
+        cache.get(1, load)
+
+        assert load.call_count == 2
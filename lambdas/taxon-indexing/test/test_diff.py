@@ -0,0 +1,92 @@
+# type: ignore
+
+import pytest
+
+from chalicelib import bulk, diff
+
+
+def taxon(tax_id, counts=5):
+    return {
+        "pipeline_run_id": 10,
+        "background_id": 20,
+        "tax_id": tax_id,
+        "tax_level": 1,
+        "metric_list": [{"count_type": "NT", "counts": counts}],
+    }
+
+
+class TestGetContentHashes:
+    def test_reads_hashes_of_the_runs(self, mocker):
+        scan = mocker.patch.object(
+            diff,
+            "scan",
+            return_value=[
+                {"_id": "1_1_10_20", "_source": {"content_hash": "abc", "pipeline_run_id": 10, "background_id": 20}},
+                {"_id": "2_1_10_20", "_source": {"pipeline_run_id": 10, "background_id": 20}},
+                # matches the terms filters but is not one of the pairs
+                {"_id": "1_1_10_21", "_source": {"content_hash": "def", "pipeline_run_id": 10, "background_id": 21}},
+            ],
+        )
+
+        hashes = diff.get_content_hashes("es", "scored_taxon_counts", [(10, 20), (11, 21)])
+
+        assert hashes == {"1_1_10_20": "abc", "2_1_10_20": None}
+        query = scan.call_args.kwargs["query"]
+        assert query["_source"] == ["content_hash", "pipeline_run_id", "background_id"]
+        assert query["query"]["bool"]["filter"] == [
+            {"terms": {"pipeline_run_id": [10, 11]}},
+            {"terms": {"background_id": [20, 21]}},
+        ]
+        assert scan.call_args.kwargs["index"] == "scored_taxon_counts"
+
+    def test_query_size_does_not_grow_with_pairs(self, mocker):
+        scan = mocker.patch.object(diff, "scan", return_value=[])
+
+        diff.get_content_hashes("es", "scored_taxon_counts", [(id, 20) for id in range(5000)])
+
+        (pipeline_run_ids, background_ids) = scan.call_args.kwargs["query"]["query"]["bool"]["filter"]
+        assert len(pipeline_run_ids["terms"]["pipeline_run_id"]) == 5000
+        assert background_ids["terms"]["background_id"] == [20]
+
+
+class TestContentHash:
+    def test_does_not_depend_on_key_order_or_serializer(self, mocker):
+        document = taxon(1)
+        reordered = dict(reversed(list(document.items())))
+        expected = diff.content_hash(document)
+
+        mocker.patch.object(bulk, "orjson", None)
+
+        assert diff.content_hash(reordered) == expected
+
+    def test_changes_with_the_document(self):
+        assert diff.content_hash(taxon(1, counts=5)) != diff.content_hash(taxon(1, counts=6))
+
+
+class TestDocumentDiff:
+    @pytest.fixture
+    def document_diff(self):
+        return diff.DocumentDiff(
+            {
+                "1_1_10_20": diff.content_hash(taxon(1)),
+                "2_1_10_20": diff.content_hash(taxon(2)),
+                "3_1_10_20": None,
+                "4_1_10_20": "gone",
+            }
+        )
+
+    def test_only_passes_new_and_changed_documents(self, document_diff):
+        changed = list(document_diff.changed([taxon(1), taxon(2, counts=6), taxon(3), taxon(5)]))
+
+        assert [taxon_metrics["tax_id"] for taxon_metrics in changed] == [2, 3, 5]
+        assert changed[0]["content_hash"] == diff.content_hash(taxon(2, counts=6))
+        assert list(document_diff.removed_ids()) == ["4_1_10_20"]
+        assert document_diff.stats() == {"existing": 4, "unchanged": 1, "removed": 1}
+
+    def test_removed_ids_are_read_once_iterated(self, document_diff):
+        # app.py chains the deletes after the index bodies before any document is compared
+        removed_ids = document_diff.removed_ids()
+
+        list(document_diff.changed([taxon(1), taxon(2)]))
+
+        assert list(removed_ids) == ["3_1_10_20", "4_1_10_20"]
@@ -0,0 +1,107 @@
+# type: ignore
+
+import io
+
+import pytest
+
+from chalicelib import export
+
+pyarrow = pytest.importorskip("pyarrow")
+import pyarrow.dataset  # noqa: E402
+import pyarrow.parquet  # noqa: E402
+
+
+def taxon(pipeline_run_id, tax_id, background_id=20, **fields):
+    return {
+        "pipeline_run_id": pipeline_run_id,
+        "tax_id": tax_id,
+        "background_id": background_id,
+        "tax_level": 1,
+        "genus_taxid": -200,
+        "family_taxid": 543,
+        "superkingdom_taxid": None,
+        "name": f"taxon {tax_id}",
+        "common_name": None,
+        "genus_name": "Escherichia",
+        "is_phage": 0,
+        "metric_list": [
+            {
+                "count_type": count_type,
+                "counts": 5,
+                "stdev": 1.5,
+                "mean": None,
+                "stdev_mass_normalized": None,
+                "mean_mass_normalized": None,
+                "percent_identity": 99.5,
+                "e_value": -10.0,
+                "rpm": 12.5,
+                "zscore": 100.0,
+                "alignment_length": 150.0,
+                "contigs": 0,
+            }
+            for count_type in ("NT", "NR")
+        ],
+        **fields,
+    }
+
+
+@pytest.fixture(autouse=True)
+def reset_s3(mocker):
+    mocker.patch.object(export, "_s3", None)
+
+
+class TestSchema:
+    def test_covers_every_packaged_field(self):
+        fields = set(export.schema().names) | {name for name, _ in export.PARTITION_FIELDS}
+
+        assert fields == set(taxon(1, 1))
+        metric_type = export.schema().field("metric_list").type.value_type
+        assert {field.name for field in metric_type} == set(taxon(1, 1)["metric_list"][0])
+
+
+class TestRunExporter:
+    def test_round_trip(self, tmp_path):
+        documents = [taxon(10, 1), taxon(10, 2, tax_level=2), taxon(11, 1, background_id=21)]
+        exporter = export.RunExporter(str(tmp_path))
+
+        assert list(exporter.tap(documents)) == documents
+
+        assert exporter.files == [
+            str(tmp_path / "background_id=20" / "pipeline_run_id=10" / export.FILENAME),
+            str(tmp_path / "background_id=21" / "pipeline_run_id=11" / export.FILENAME),
+        ]
+        table = pyarrow.dataset.dataset(str(tmp_path), partitioning=export.partitioning()).to_table()
+        rows = sorted(table.to_pylist(), key=lambda row: (row["pipeline_run_id"], row["tax_id"]))
+        assert rows == documents
+
+    def test_leaves_out_fields_not_in_the_schema(self, tmp_path):
+        exporter = export.RunExporter("file://" + str(tmp_path))
+
+        list(exporter.tap([taxon(10, 1, content_hash="abc")]))
+
+        (path,) = exporter.files
+        assert "content_hash" not in pyarrow.parquet.read_schema(path).names
+
+    def test_writes_to_s3(self, mocker):
+        s3 = mocker.patch.object(export, "_s3")
+        exporter = export.RunExporter("s3://bucket/exports/")
+
+        list(exporter.tap([taxon(10, 1)]))
+
+        key = "exports/background_id=20/pipeline_run_id=10/scored_taxon_counts.parquet"
+        assert exporter.files == ["s3://bucket/" + key]
+        assert s3.put_object.call_args.kwargs["Key"] == key
+        body = s3.put_object.call_args.kwargs["Body"]
+        assert pyarrow.parquet.read_table(io.BytesIO(body)).num_rows == 1
+
+    def test_no_documents(self, tmp_path):
+        exporter = export.RunExporter(str(tmp_path))
+
+        assert list(exporter.tap([])) == []
+        assert exporter.files == []
+
+    def test_needs_pyarrow(self, mocker):
+        mocker.patch.object(export, "pyarrow", None)
+
+        with pytest.raises(ImportError, match="requirements-export.txt"):
+            export.RunExporter("s3://bucket/exports")
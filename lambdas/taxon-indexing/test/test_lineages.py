@@ -0,0 +1,146 @@
+# type: ignore
+
+import io
+
+import numpy as np
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from chalicelib import lineages
+
+ROWS = [
+    (562, "Escherichia", "enterobacteria"),
+    (9606, "Homo", None),
+    (561, "Escherichia", "enterobacteria"),
+]
+
+
+def cursor_with(mocker, rows):
+    cursor = mocker.MagicMock()
+    cursor.__enter__.return_value = cursor
+    cursor.fetchmany.side_effect = [rows, []]
+    cursor.fetchall.return_value = rows
+    conn = mocker.Mock()
+    conn.cursor.return_value = cursor
+    return conn
+
+
+@pytest.fixture(autouse=True)
+def reset_cache(mocker):
+    mocker.patch.object(lineages, "_cache", None)
+    mocker.patch.object(lineages, "_s3", None)
+    mocker.patch.object(lineages, "LINEAGE_CACHE_S3_URI", None)
+
+
+@pytest.fixture
+def table(mocker):
+    return lineages.read_lineage_table(cursor_with(mocker, ROWS), 3)
+
+
+class TestLineageTable:
+    def test_lookup(self, table):
+        assert table.lookup([561, 9606, 1, 562]) == (
+            ["Escherichia", "Homo", None, "Escherichia"],
+            ["enterobacteria", None, None, "enterobacteria"],
+        )
+
+    def test_shares_repeated_names(self, table):
+        assert table.names == [None, "Escherichia", "enterobacteria", "Homo"]
+
+    def test_lookup_in_empty_table(self, mocker):
+        empty = lineages.read_lineage_table(cursor_with(mocker, []), 3)
+
+        assert empty.lookup([1]) == ([None], [None])
+
+    def test_save_and_load(self, table):
+        f = io.BytesIO()
+        table.save(f)
+        f.seek(0)
+
+        loaded = lineages.LineageTable.load(f)
+
+        assert loaded.names == table.names
+        np.testing.assert_array_equal(loaded.taxids, table.taxids)
+        assert loaded.lookup([561, 9606]) == table.lookup([561, 9606])
+
+
+class TestLoadLineageTable:
+    def test_reads_from_s3(self, mocker, table):
+        mocker.patch.object(lineages, "LINEAGE_CACHE_S3_URI", "s3://bucket/lineages")
+        f = io.BytesIO()
+        table.save(f)
+        s3 = mocker.patch.object(lineages, "_s3")
+        s3.get_object.return_value = {"Body": io.BytesIO(f.getvalue())}
+        conn = mocker.Mock()
+
+        loaded = lineages.load_lineage_table(conn, 3)
+
+        assert loaded.lookup([562]) == (["Escherichia"], ["enterobacteria"])
+        s3.get_object.assert_called_once_with(Bucket="bucket", Key="lineages/taxon_lineages_v3.npz")
+        conn.cursor.assert_not_called()
+
+    def test_writes_to_s3_on_miss(self, mocker):
+        mocker.patch.object(lineages, "LINEAGE_CACHE_S3_URI", "s3://bucket/lineages")
+        s3 = mocker.patch.object(lineages, "_s3")
+        s3.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+        loaded = lineages.load_lineage_table(cursor_with(mocker, ROWS), 3)
+
+        assert len(loaded) == 3
+        assert s3.put_object.call_args.kwargs["Key"] == "lineages/taxon_lineages_v3.npz"
+
+    def test_reads_from_mysql_without_writing_on_corrupt_object(self, mocker):
+        mocker.patch.object(lineages, "LINEAGE_CACHE_S3_URI", "s3://bucket/lineages")
+        s3 = mocker.patch.object(lineages, "_s3")
+        s3.get_object.return_value = {"Body": io.BytesIO(b"PK\x03\x04truncated")}
+
+        loaded = lineages.load_lineage_table(cursor_with(mocker, ROWS), 3)
+
+        assert len(loaded) == 3
+        s3.put_object.assert_not_called()
+
+    def test_reads_from_mysql_when_s3_is_unreachable(self, mocker):
+        mocker.patch.object(lineages, "LINEAGE_CACHE_S3_URI", "s3://bucket/lineages")
+        s3 = mocker.patch.object(lineages, "_s3")
+        s3.get_object.side_effect = EndpointConnectionError(endpoint_url="https://s3")
+
+        loaded = lineages.load_lineage_table(cursor_with(mocker, ROWS), 3)
+
+        assert len(loaded) == 3
+        s3.put_object.assert_not_called()
+
+    def test_ignores_write_errors(self, mocker):
+        mocker.patch.object(lineages, "LINEAGE_CACHE_S3_URI", "s3://bucket/lineages")
+        s3 = mocker.patch.object(lineages, "_s3")
+        s3.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        s3.put_object.side_effect = EndpointConnectionError(endpoint_url="https://s3")
+
+        assert len(lineages.load_lineage_table(cursor_with(mocker, ROWS), 3)) == 3
+
+
+class TestGetLineageTables:
+    def test_loads_each_lineage_version_once_per_container(self, mocker, table):
+        load = mocker.patch.object(lineages, "load_lineage_table", return_value=table)
+        conn = cursor_with(mocker, [(3,), (None,)])
+
+        lineages.get_lineage_tables(conn, [1])
+        tables, stats = lineages.get_lineage_tables(conn, [2])
+
+        assert list(tables) == [3]
+        load.assert_called_once_with(conn, 3)
+        assert stats["hits"] == 1
+
+
+class TestAddLineages:
+    def test_adds_names_by_lineage_version(self, table):
+        rows = [
+            {"lineage_taxon_join_id": 562, "lineage_version": 3},
+            {"lineage_taxon_join_id": 562, "lineage_version": None},
+        ]
+
+        (batch,) = lineages.add_lineages([rows], {3: table})
+
+        assert [(row["genus_name"], row["common_name"]) for row in batch] == [
+            ("Escherichia", "enterobacteria"),
+            (None, None),
+        ]
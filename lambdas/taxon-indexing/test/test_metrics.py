@@ -0,0 +1,91 @@
+# type: ignore
+
+import json
+
+import pytest
+
+from chalicelib import metrics
+
+
+@pytest.fixture
+def clock(mocker):
+    """
+    A perf_counter that only moves when the test advances it
+    """
+    now = [0.0]
+    mocker.patch.object(metrics.time, "perf_counter", side_effect=lambda: now[0])
+    return now
+
+
+class TestPercentile:
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+
+        assert metrics.percentile(values, 50) == 50
+        assert metrics.percentile(values, 95) == 95
+        assert metrics.percentile([3], 95) == 3
+        assert metrics.percentile([], 50) is None
+
+
+class TestInvocationMetrics:
+    def test_nested_phases_exclude_each_other(self, clock):
+        run_metrics = metrics.InvocationMetrics()
+
+        def rows():
+            for batch in ([1, 2], [3]):
+                clock[0] += 1  # fetching a batch
+                yield batch
+
+        def package(batches):
+            for batch in batches:
+                clock[0] += 2  # packaging it
+                yield batch
+
+        clock[0] += 0.5  # validating the event
+        with run_metrics.phase("bulk_wait"):
+            for _ in run_metrics.iterate(
+                "packaging",
+                package(run_metrics.iterate("score_query", rows(), count="rows", size=len)),
+                count="documents",
+            ):
+                clock[0] += 4  # waiting for a free bulk slot
+
+        summary = run_metrics.summary()
+
+        assert summary["phases_ms"] == {
+            "other": 500,
+            "score_query": 2000,
+            "packaging": 4000,
+            "bulk_wait": 8000,
+        }
+        assert summary["total_ms"] == 14500
+        assert (summary["rows"], summary["documents"]) == (3, 2)
+
+    def test_bulk_result(self, clock):
+        run_metrics = metrics.InvocationMetrics()
+        run_metrics.add("documents", 30)
+        run_metrics.add_bulk_result(
+            {"retried": 2, "errors": [], "request_seconds": [0.1, 0.3, 0.2], "bytes": 1000}
+        )
+        clock[0] += 3
+
+        summary = run_metrics.summary()
+
+        assert summary["bulk_latency_ms"] == {"p50": 200, "p95": 300, "max": 300}
+        assert (summary["bulk_requests"], summary["bulk_bytes"], summary["retried_items"]) == (3, 1000, 2)
+        assert summary["docs_per_second"] == 10
+
+    def test_emit_logs_embedded_metric_format(self, capsys):
+        run_metrics = metrics.InvocationMetrics()
+        with run_metrics.phase("refresh"):
+            pass
+        run_metrics.add("bulk_bytes", 10)
+
+        run_metrics.emit(run_metrics.summary(), pipeline_run_ids=[1, 2])
+
+        record = json.loads(capsys.readouterr().out)
+        names = {metric["Name"]: metric["Unit"] for metric in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+        assert names["refresh_ms"] == "Milliseconds"
+        assert names["bulk_bytes"] == "Bytes"
+        assert "bulk_latency_p50_ms" not in names
+        assert record["pipeline_run_ids"] == [1, 2]
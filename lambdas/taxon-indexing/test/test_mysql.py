@@ -0,0 +1,122 @@
+# type: ignore
+
+from decimal import Decimal
+
+import pymysql
+import pytest
+
+from chalicelib import mysql
+
+PARAMS = {
+    "mysql_host": "test-mysql-host",
+    "mysql_port": "3306",
+    "mysql_username": "test-mysql-username",
+    "mysql_password": "test-mysql-password",
+    "mysql_db": "test-mysql-db",
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_connection():
+    mysql._connection = None
+    yield
+    mysql._connection = None
+
+
+class TestGetConnection:
+    def test_cold_start_connects(self, mocker):
+        connect = mocker.patch.object(mysql.pymysql, "connect")
+
+        conn, stats = mysql.get_connection(PARAMS)
+
+        assert conn is connect.return_value
+        assert stats["reused"] is False
+        assert connect.call_args.kwargs["autocommit"] is True
+        assert connect.call_args.kwargs["ssl"] == {"enable_tls": True}
+
+    def test_local_mode_connects_without_password(self, mocker):
+        mocker.patch.dict("os.environ", {"LOCAL_MODE": "1"})
+        connect = mocker.patch.object(mysql.pymysql, "connect")
+
+        mysql.get_connection(PARAMS)
+
+        assert "passwd" not in connect.call_args.kwargs
+
+    def test_warm_start_reuses_live_connection(self, mocker):
+        connect = mocker.patch.object(mysql.pymysql, "connect")
+        first, _ = mysql.get_connection(PARAMS)
+
+        second, stats = mysql.get_connection(PARAMS)
+
+        assert second is first
+        assert stats["reused"] is True
+        first.ping.assert_called_once_with(reconnect=False)
+        connect.assert_called_once()
+
+    def test_reconnects_when_ping_fails(self, mocker):
+        stale, fresh = mocker.Mock(), mocker.Mock()
+        stale.ping.side_effect = pymysql.err.OperationalError(2013, "Lost connection")
+        connect = mocker.patch.object(
+            mysql.pymysql, "connect", side_effect=[stale, fresh]
+        )
+        mysql.get_connection(PARAMS)
+
+        conn, stats = mysql.get_connection(PARAMS)
+
+        assert conn is fresh
+        assert stats["reused"] is False
+        stale.close.assert_called_once()
+        assert connect.call_count == 2
+
+
+class TestDiscardConnection:
+    def test_next_invocation_connects_again(self, mocker):
+        connect = mocker.patch.object(mysql.pymysql, "connect")
+        conn, _ = mysql.get_connection(PARAMS)
+
+        mysql.discard_connection()
+        mysql.get_connection(PARAMS)
+
+        conn.close.assert_called_once()
+        assert connect.call_count == 2
+
+    def test_ignores_close_errors(self, mocker):
+        conn = mocker.Mock()
+        conn.close.side_effect = pymysql.err.Error("already closed")
+        mysql._connection = conn
+
+        mysql.discard_connection()
+
+        assert mysql._connection is None
+
+
+class TestExecute:
+    def test_binds_args(self, mocker):
+        cursor = mocker.Mock()
+
+        assert mysql.execute(cursor, ("SELECT %s", [1])) is None
+
+        cursor.execute.assert_called_once_with("SELECT %s", [1])
+
+    def test_explain_returns_plan_first(self, mocker):
+        cursor = mocker.Mock()
+        cursor.fetchall.return_value = [
+            {"table": "taxon_summaries", "key": None, "filtered": Decimal("10.0")}
+        ]
+
+        plan = mysql.execute(cursor, ("SELECT %s", [1]), explain=True)
+
+        assert plan == [{"table": "taxon_summaries", "key": None, "filtered": "10.0"}]
+        assert cursor.execute.call_args_list == [
+            mocker.call("EXPLAIN SELECT %s", [1]),
+            mocker.call("SELECT %s", [1]),
+        ]
+
+    def test_explain_with_tuple_cursor(self, mocker):
+        cursor = mocker.Mock()
+        cursor.description = [("table",), ("key",)]
+        cursor.fetchall.return_value = [("taxon_counts", "PRIMARY")]
+
+        plan = mysql.execute(cursor, ("SELECT 1", []), explain=True)
+
+        assert plan == [{"table": "taxon_counts", "key": "PRIMARY"}]
@@ -0,0 +1,65 @@
+# type: ignore
+
+from chalicelib.packaging import package_metric_tuples, package_metrics
+
+COLUMNS = [
+    "pipeline_run_id",
+    "tax_id",
+    "count_type",
+    "tax_level",
+    "genus_taxid",
+    "family_taxid",
+    "is_phage",
+    "counts",
+    "percent_identity",
+    "alignment_length",
+    "e_value",
+    "rpm",
+    "superkingdom_taxid",
+    "name",
+    "genus_name",
+    "common_name",
+    "contigs",
+    "background_id",
+    "created_at",
+    "stdev",
+    "mean",
+    "stdev_mass_normalized",
+    "mean_mass_normalized",
+    "zscore",
+]
+
+
+def row(pipeline_run_id, tax_id, count_type):
+    return (
+        pipeline_run_id, tax_id, count_type, 1, 10, 100, 0, 5, 99.5, 150.0, 1e-10, 12.5,
+        2, f"taxon {tax_id}", "genus", "common", 3, 7, None, 1.5, 2.5, None, None, 4.2,
+    )
+
+
+ROWS = [
+    row(1, 561, "NT"),
+    row(1, 561, "NR"),
+    row(1, 562, "NT"),
+    row(2, 562, "NT"),
+]
+
+
+class TestPackageMetricTuples:
+    def test_matches_package_metrics(self):
+        expected = list(package_metrics(dict(zip(COLUMNS, r)) for r in ROWS))
+
+        assert list(package_metric_tuples(ROWS, COLUMNS)) == expected
+        assert [len(taxon["metric_list"]) for taxon in expected] == [2, 1, 1]
+
+    def test_columns_in_any_order(self):
+        order = list(reversed(range(len(COLUMNS))))
+        columns = [COLUMNS[i] for i in order]
+        rows = [tuple(r[i] for i in order) for r in ROWS]
+
+        assert list(package_metric_tuples(rows, columns)) == list(
+            package_metric_tuples(ROWS, COLUMNS)
+        )
+
+    def test_no_rows(self):
+        assert list(package_metric_tuples([], COLUMNS)) == []
@@ -0,0 +1,64 @@
+# type: ignore
+
+import pytest
+
+from chalicelib import queries
+
+
+class TestScoredTaxonCountsQuery:
+    def test_binds_ids_as_parameters(self):
+        sql, args = queries.get_scored_taxon_counts_for_runs_query(
+            [(101, 7), (102, 7)], include_contig_counts=True
+        )
+
+        assert sql.count("%s") == len(args)
+        assert "101" not in sql and "102" not in sql
+        # taxon_counts ids, runs table pairs, background ids, contig ids
+        assert args == [101, 102, 101, 7, 102, 7, 7, 101, 102]
+
+    def test_statement_only_depends_on_run_count(self):
+        first, _ = queries.get_scored_taxon_counts_query(1, 2)
+        second, _ = queries.get_scored_taxon_counts_query(3, 4)
+
+        assert first == second
+
+    def test_rejects_non_integer_ids(self):
+        with pytest.raises(ValueError):
+            queries.get_scored_taxon_counts_query("1; DROP TABLE contigs", 2)
+
+
+class TestContigsQuery:
+    def test_binds_ids_as_parameters(self):
+        sql, args = queries.get_contigs_by_pipeline_run_ids_query(["5", 6])
+
+        assert args == [5, 6]
+        assert sql.count("%s") == 2
+
+
+class TestTaxonSummariesVersionsQuery:
+    def test_binds_ids_as_parameters(self):
+        sql, args = queries.get_taxon_summaries_versions_query([3, "4"])
+
+        assert args == [3, 4]
+        assert sql.count("%s") == 2
+        assert "GROUP BY background_id" in sql
+
+
+class TestUnscoredTaxonCountsQuery:
+    def test_does_not_join_summaries(self):
+        sql, args = queries.get_scored_taxon_counts_for_runs_query(
+            [(101, 7)], include_scores=False
+        )
+
+        assert "taxon_summaries" not in sql
+        assert "zscore" not in sql
+        assert "pipeline_runs.total_ercc_reads" in sql
+        assert args == [101, 101, 7]
+
+    def test_does_not_join_lineages(self):
+        sql, _ = queries.get_scored_taxon_counts_for_runs_query(
+            [(101, 7)], include_lineages=False
+        )
+
+        assert "FROM taxon_lineages" not in sql
+        assert "pipeline_runs.lineage_version" in sql
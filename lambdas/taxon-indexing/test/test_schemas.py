@@ -0,0 +1,17 @@
+# type: ignore
+
+import pytest
+from aws_lambda_powertools.utilities.validation import validate
+from aws_lambda_powertools.utilities.validation.exceptions import SchemaValidationError
+
+from chalicelib import schemas
+
+RUN = {"pipeline_run_id": 1, "background_id": 2}
+
+
+class TestInput:
+    @pytest.mark.parametrize("option", ["es_batchsize", "es_bulk_concurrency"])
+    def test_integer_options(self, option):
+        validate(event={**RUN, option: 2}, schema=schemas.INPUT)
+        with pytest.raises(SchemaValidationError):
+            validate(event={**RUN, option: 2.5}, schema=schemas.INPUT)
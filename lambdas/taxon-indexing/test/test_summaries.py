@@ -0,0 +1,187 @@
+# type: ignore
+
+import numpy as np
+import pytest
+
+from chalicelib import summaries
+
+NAN = float("nan")
+
+
+def table(rows):
+    """
+    Build a BackgroundSummaries from (tax_id, tax_level, count_type, *stats) rows
+    """
+    return summaries.BackgroundSummaries(
+        summaries.pack_keys(
+            [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+        ),
+        np.array([row[3:] for row in rows], dtype=np.float64).reshape(-1, 4),
+    )
+
+
+def row(tax_id, background_id=1, count_type="NT", **fields):
+    return {
+        "tax_id": tax_id,
+        "tax_level": 1,
+        "count_type": count_type,
+        "background_id": background_id,
+        "counts": 10,
+        "rpm": 5.0,
+        "bpm": 50.0,
+        "technology": "Illumina",
+        "total_ercc_reads": 0,
+        **fields,
+    }
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    summaries._cache = None
+    yield
+    summaries._cache = None
+
+
+class TestBackgroundSummaries:
+    def test_lookup(self):
+        summaries_table = table([(2, 1, "NR", 1, 2, 3, 4), (1, 1, "NT", 5, 6, None, None)])
+
+        stats = summaries_table.lookup(
+            summaries.pack_keys([1, 2, 2, -300], [1, 1, 2, 1], ["NT", "NR", "NR", "NT"])
+        )
+
+        np.testing.assert_array_equal(
+            stats,
+            [[5, 6, NAN, NAN], [1, 2, 3, 4], [NAN] * 4, [NAN] * 4],
+        )
+
+    def test_lookup_in_empty_table(self):
+        stats = table([]).lookup(summaries.pack_keys([1], [1], ["NT"]))
+
+        assert np.isnan(stats).all()
+
+
+class TestZscores:
+    @pytest.mark.parametrize(
+        "stats, inputs, expected",
+        [
+            # (rpm - mean) / stdev for Illumina
+            ([10, 2, NAN, NAN], (1, 14, 0, "Illumina", 0), 2),
+            # bpm for other technologies
+            ([10, 2, NAN, NAN], (1, 14, 4, "ONT", 0), -3),
+            # clamped
+            ([0, 0.01, NAN, NAN], (1, 14, 0, "Illumina", 0), 99),
+            ([0, 0.01, NAN, NAN], (1, -14, 0, "Illumina", 0), -99),
+            # no summary or a zero stdev gives no z-score
+            ([NAN, NAN, NAN, NAN], (1, 14, 0, "Illumina", 0), 100),
+            ([10, 0, NAN, NAN], (1, 14, 0, "Illumina", 0), 100),
+            # mass normalized: counts per ERCC read for Illumina, counts otherwise
+            ([10, 2, 0.5, 0.25], (100, 14, 0, "Illumina", 100), 2),
+            ([10, 2, 0.5, 0.25], (1, 14, 0, "ONT", 4), 2),
+            ([10, 2, 0.5, 0.25], (100, 14, 0, "Illumina", 0), 100),
+        ],
+    )
+    def test_matches_sql(self, stats, inputs, expected):
+        counts, rpm, bpm, technology, total_ercc_reads = inputs
+
+        zscores = summaries.zscores(
+            np.array([stats], dtype=np.float64),
+            [counts],
+            [rpm],
+            [bpm],
+            [technology],
+            [total_ercc_reads],
+        )
+
+        assert zscores.tolist() == [expected]
+
+    def test_rounds_normalized_counts_like_mysql(self):
+        # SELECT ((1 / 3) - 0) / 1 gives 0.3333 in MySQL, not 0.33333...
+        zscores = summaries.zscores(
+            np.array([[0, 1, 0, 1]], dtype=np.float64), [1], [0], [0], ["Illumina"], [3]
+        )
+
+        assert zscores.tolist() == [0.3333]
+
+
+class TestMysqlDivide:
+    def test_matches_mysql(self):
+        # SELECT 1 / 3, 2 / 3, 1 / 20000, 1 / 40000, 7 / 1, -1 / 20000, 3 / 80000
+        result = summaries.mysql_divide(
+            [1, 2, 1, 1, 7, -1, 3], [3, 3, 20000, 40000, 1, 20000, 80000]
+        )
+
+        assert result.tolist() == [0.3333, 0.6667, 0.0001, 0.0, 7.0, -0.0001, 0.0]
+
+
+class TestScoreRows:
+    def test_scores_each_row_against_its_background(self):
+        tables = {
+            1: table([(7, 1, "NT", 1, 2, None, None)]),
+            2: table([(7, 1, "NT", 3, 1, None, None)]),
+        }
+
+        rows = list(
+            summaries.score_rows(
+                [[row(7, background_id=1), row(7, background_id=2)], [row(8)]], tables
+            )
+        )
+
+        assert [r["zscore"] for r in rows] == [2, 2, 100]
+        assert rows[0]["mean"] == 1 and rows[0]["mean_mass_normalized"] is None
+        assert rows[2]["stdev"] is None
+
+
+class TestGetBackgroundSummaries:
+    def test_loads_each_background_once_per_container(self, mocker):
+        load = mocker.patch.object(
+            summaries,
+            "load_background_summaries",
+            side_effect=lambda conn, background_id: table([(background_id, 1, "NT", 1, 1, 1, 1)]),
+        )
+
+        mocker.patch.object(
+            summaries,
+            "get_background_versions",
+            side_effect=lambda conn, background_ids: {
+                background_id: (1, 1, 1) for background_id in background_ids
+            },
+        )
+
+        summaries.get_background_summaries("conn", [1, 2])
+        tables, stats = summaries.get_background_summaries("conn", [2])
+
+        assert list(tables) == [2]
+        assert load.call_count == 2
+        assert stats["hits"] == 1 and stats["cached"] == 2
+
+    def test_reloads_recomputed_background(self, mocker):
+        load = mocker.patch.object(
+            summaries,
+            "load_background_summaries",
+            side_effect=lambda conn, background_id: table([(background_id, 1, "NT", 1, 1, 1, 1)]),
+        )
+        versions = mocker.patch.object(
+            summaries, "get_background_versions", return_value={1: (10, 1, 10)}
+        )
+
+        summaries.get_background_summaries("conn", [1])
+        # the rows were replaced
+        versions.return_value = {1: (10, 11, 20)}
+        tables, stats = summaries.get_background_summaries("conn", [1])
+
+        assert load.call_count == 2
+        assert stats["reloads"] == 1 and stats["cached"] == 1
+
+
+class TestGetBackgroundVersions:
+    def test_versions_by_background(self, mocker):
+        conn = mocker.MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [(1, 10, 1, 10)]
+
+        versions = summaries.get_background_versions(conn, [1, 2])
+
+        assert versions == {1: (10, 1, 10), 2: (0, None, None)}
+        sql, args = cursor.execute.call_args.args
+        assert args == [1, 2]